@@ -6,6 +6,7 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_current_user, get_db, require_admin
+from app.core.database import notify_oee_config_changed
 from app.models.oee_config import (
     MachineAvailabilityConfig,
     MachinePerformanceConfig,
@@ -13,17 +14,24 @@ from app.models.oee_config import (
     OEETarget,
     RejectEvent,
 )
+from app.models.oee_state import OEERecalcJob
 from app.models.user import User
 from app.schemas.oee_config import (
     MachineAvailabilityConfigCreate, MachineAvailabilityConfigRead, MachineAvailabilityConfigUpdate,
     MachinePerformanceConfigCreate, MachinePerformanceConfigRead, MachinePerformanceConfigUpdate,
     MachineQualityConfigCreate, MachineQualityConfigRead, MachineQualityConfigUpdate,
+    OEERecalcJobCreate, OEERecalcJobRead,
     OEETargetCreate, OEETargetRead, OEETargetUpdate,
     RejectEventCreate, RejectEventRead,
 )
+from app.services.recalc import queue_recalculation
 
 router = APIRouter(tags=["oee-config"])
 
+# Config changes only apply to windows calculated from now on; passing this
+# also queues a recalculation of the affected machines from that time
+_RECALCULATE_FROM = Query(None, description="Recalculate the affected machines' OEE from this time")
+
 
 # ── OEE Targets ───────────────────────────────────────────────────────────────
 @router.get("/oee-targets", response_model=list[OEETargetRead])
@@ -70,32 +78,67 @@ async def list_avail_configs(machine_id: int | None = None, db: AsyncSession = D
 
 
 @router.post("/availability-configs", response_model=MachineAvailabilityConfigRead, status_code=201)
-async def create_avail_config(payload: MachineAvailabilityConfigCreate, db: AsyncSession = Depends(get_db), _=Depends(require_admin)):
+async def create_avail_config(
+    payload: MachineAvailabilityConfigCreate,
+    recalculate_from: datetime | None = _RECALCULATE_FROM,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_admin),
+):
     obj = MachineAvailabilityConfig(**payload.model_dump())
     db.add(obj)
     await db.flush()
     await db.refresh(obj)
+    await notify_oee_config_changed(db, obj.machine_id)
+    if recalculate_from:
+        await queue_recalculation(
+            db, [obj.machine_id], recalculate_from, current_user.id, f"availability config {obj.id} created"
+        )
     return obj
 
 
 @router.patch("/availability-configs/{config_id}", response_model=MachineAvailabilityConfigRead)
-async def update_avail_config(config_id: int, payload: MachineAvailabilityConfigUpdate, db: AsyncSession = Depends(get_db), _=Depends(require_admin)):
+async def update_avail_config(
+    config_id: int,
+    payload: MachineAvailabilityConfigUpdate,
+    recalculate_from: datetime | None = _RECALCULATE_FROM,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_admin),
+):
     obj = await db.get(MachineAvailabilityConfig, config_id)
     if not obj:
         raise HTTPException(404, "Config not found")
+    previous_machine_id = obj.machine_id
     for k, v in payload.model_dump(exclude_none=True).items():
         setattr(obj, k, v)
     await db.flush()
     await db.refresh(obj)
+    await notify_oee_config_changed(db, obj.machine_id)
+    if previous_machine_id != obj.machine_id:
+        await notify_oee_config_changed(db, previous_machine_id)
+    if recalculate_from:
+        await queue_recalculation(
+            db, [obj.machine_id, previous_machine_id], recalculate_from, current_user.id,
+            f"availability config {obj.id} updated",
+        )
     return obj
 
 
 @router.delete("/availability-configs/{config_id}", status_code=204)
-async def delete_avail_config(config_id: int, db: AsyncSession = Depends(get_db), _=Depends(require_admin)):
+async def delete_avail_config(
+    config_id: int,
+    recalculate_from: datetime | None = _RECALCULATE_FROM,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_admin),
+):
     obj = await db.get(MachineAvailabilityConfig, config_id)
     if not obj:
         raise HTTPException(404, "Config not found")
     await db.delete(obj)
+    await notify_oee_config_changed(db, obj.machine_id)
+    if recalculate_from:
+        await queue_recalculation(
+            db, [obj.machine_id], recalculate_from, current_user.id, f"availability config {config_id} deleted"
+        )
 
 
 # ── Performance Config ────────────────────────────────────────────────────────
@@ -108,32 +151,67 @@ async def list_perf_configs(machine_id: int | None = None, db: AsyncSession = De
 
 
 @router.post("/performance-configs", response_model=MachinePerformanceConfigRead, status_code=201)
-async def create_perf_config(payload: MachinePerformanceConfigCreate, db: AsyncSession = Depends(get_db), _=Depends(require_admin)):
+async def create_perf_config(
+    payload: MachinePerformanceConfigCreate,
+    recalculate_from: datetime | None = _RECALCULATE_FROM,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_admin),
+):
     obj = MachinePerformanceConfig(**payload.model_dump())
     db.add(obj)
     await db.flush()
     await db.refresh(obj)
+    await notify_oee_config_changed(db, obj.machine_id)
+    if recalculate_from:
+        await queue_recalculation(
+            db, [obj.machine_id], recalculate_from, current_user.id, f"performance config {obj.id} created"
+        )
     return obj
 
 
 @router.patch("/performance-configs/{config_id}", response_model=MachinePerformanceConfigRead)
-async def update_perf_config(config_id: int, payload: MachinePerformanceConfigUpdate, db: AsyncSession = Depends(get_db), _=Depends(require_admin)):
+async def update_perf_config(
+    config_id: int,
+    payload: MachinePerformanceConfigUpdate,
+    recalculate_from: datetime | None = _RECALCULATE_FROM,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_admin),
+):
     obj = await db.get(MachinePerformanceConfig, config_id)
     if not obj:
         raise HTTPException(404, "Config not found")
+    previous_machine_id = obj.machine_id
     for k, v in payload.model_dump(exclude_none=True).items():
         setattr(obj, k, v)
     await db.flush()
     await db.refresh(obj)
+    await notify_oee_config_changed(db, obj.machine_id)
+    if previous_machine_id != obj.machine_id:
+        await notify_oee_config_changed(db, previous_machine_id)
+    if recalculate_from:
+        await queue_recalculation(
+            db, [obj.machine_id, previous_machine_id], recalculate_from, current_user.id,
+            f"performance config {obj.id} updated",
+        )
     return obj
 
 
 @router.delete("/performance-configs/{config_id}", status_code=204)
-async def delete_perf_config(config_id: int, db: AsyncSession = Depends(get_db), _=Depends(require_admin)):
+async def delete_perf_config(
+    config_id: int,
+    recalculate_from: datetime | None = _RECALCULATE_FROM,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_admin),
+):
     obj = await db.get(MachinePerformanceConfig, config_id)
     if not obj:
         raise HTTPException(404, "Config not found")
     await db.delete(obj)
+    await notify_oee_config_changed(db, obj.machine_id)
+    if recalculate_from:
+        await queue_recalculation(
+            db, [obj.machine_id], recalculate_from, current_user.id, f"performance config {config_id} deleted"
+        )
 
 
 # ── Quality Config ────────────────────────────────────────────────────────────
@@ -146,32 +224,67 @@ async def list_qual_configs(machine_id: int | None = None, db: AsyncSession = De
 
 
 @router.post("/quality-configs", response_model=MachineQualityConfigRead, status_code=201)
-async def create_qual_config(payload: MachineQualityConfigCreate, db: AsyncSession = Depends(get_db), _=Depends(require_admin)):
+async def create_qual_config(
+    payload: MachineQualityConfigCreate,
+    recalculate_from: datetime | None = _RECALCULATE_FROM,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_admin),
+):
     obj = MachineQualityConfig(**payload.model_dump())
     db.add(obj)
     await db.flush()
     await db.refresh(obj)
+    await notify_oee_config_changed(db, obj.machine_id)
+    if recalculate_from:
+        await queue_recalculation(
+            db, [obj.machine_id], recalculate_from, current_user.id, f"quality config {obj.id} created"
+        )
     return obj
 
 
 @router.patch("/quality-configs/{config_id}", response_model=MachineQualityConfigRead)
-async def update_qual_config(config_id: int, payload: MachineQualityConfigUpdate, db: AsyncSession = Depends(get_db), _=Depends(require_admin)):
+async def update_qual_config(
+    config_id: int,
+    payload: MachineQualityConfigUpdate,
+    recalculate_from: datetime | None = _RECALCULATE_FROM,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_admin),
+):
     obj = await db.get(MachineQualityConfig, config_id)
     if not obj:
         raise HTTPException(404, "Config not found")
+    previous_machine_id = obj.machine_id
     for k, v in payload.model_dump(exclude_none=True).items():
         setattr(obj, k, v)
     await db.flush()
     await db.refresh(obj)
+    await notify_oee_config_changed(db, obj.machine_id)
+    if previous_machine_id != obj.machine_id:
+        await notify_oee_config_changed(db, previous_machine_id)
+    if recalculate_from:
+        await queue_recalculation(
+            db, [obj.machine_id, previous_machine_id], recalculate_from, current_user.id,
+            f"quality config {obj.id} updated",
+        )
     return obj
 
 
 @router.delete("/quality-configs/{config_id}", status_code=204)
-async def delete_qual_config(config_id: int, db: AsyncSession = Depends(get_db), _=Depends(require_admin)):
+async def delete_qual_config(
+    config_id: int,
+    recalculate_from: datetime | None = _RECALCULATE_FROM,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_admin),
+):
     obj = await db.get(MachineQualityConfig, config_id)
     if not obj:
         raise HTTPException(404, "Config not found")
     await db.delete(obj)
+    await notify_oee_config_changed(db, obj.machine_id)
+    if recalculate_from:
+        await queue_recalculation(
+            db, [obj.machine_id], recalculate_from, current_user.id, f"quality config {config_id} deleted"
+        )
 
 
 # ── Reject Events ─────────────────────────────────────────────────────────────
@@ -215,3 +328,44 @@ async def delete_reject_event(event_id: int, db: AsyncSession = Depends(get_db),
     if not obj:
         raise HTTPException(404, "Reject event not found")
     await db.delete(obj)
+
+
+# ── Recalculation Jobs ────────────────────────────────────────────────────────
+# The OEE service picks up queued jobs, recomputes the affected windows with the
+# current configs and overwrites the original results in place.
+@router.get("/oee-recalculations", response_model=list[OEERecalcJobRead])
+async def list_recalc_jobs(
+    status: str | None = None,
+    limit: int = Query(50, le=500),
+    db: AsyncSession = Depends(get_db),
+    _=Depends(get_current_user),
+):
+    q = select(OEERecalcJob).order_by(OEERecalcJob.id.desc()).limit(limit)
+    if status:
+        q = q.where(OEERecalcJob.status == status)
+    return (await db.execute(q)).scalars().all()
+
+
+@router.get("/oee-recalculations/{job_id}", response_model=OEERecalcJobRead)
+async def get_recalc_job(job_id: int, db: AsyncSession = Depends(get_db), _=Depends(get_current_user)):
+    obj = await db.get(OEERecalcJob, job_id)
+    if not obj:
+        raise HTTPException(404, "Recalculation job not found")
+    return obj
+
+
+@router.post("/oee-recalculations", response_model=OEERecalcJobRead, status_code=201)
+async def create_recalc_job(
+    payload: OEERecalcJobCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_admin),
+):
+    if not payload.machine_ids:
+        raise HTTPException(422, "At least one machine is required")
+    if payload.range_end <= payload.range_start:
+        raise HTTPException(422, "range_end must be after range_start")
+    obj = OEERecalcJob(**payload.model_dump(), status="queued", requested_by=current_user.id)
+    db.add(obj)
+    await db.flush()
+    await db.refresh(obj)
+    return obj
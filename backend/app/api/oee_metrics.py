@@ -1,11 +1,13 @@
 """Endpoints for querying OEE metrics from InfluxDB 3."""
-from datetime import datetime, timezone
+import math
+from datetime import datetime, timedelta, timezone
 from typing import Any
 
 from fastapi import APIRouter, Depends, Query
 
 from app.api.deps import get_current_user
 from app.core.influxdb import query_influx
+from app.services import downsample
 
 router = APIRouter(prefix="/oee-metrics", tags=["oee-metrics"])
 
@@ -115,9 +117,167 @@ async def get_quality_metrics(
     return [{k: result[k][i] for k in keys} for i in range(n)]
 
 
+_SUMMARY_SUMS = (
+    "planned_time_seconds",
+    "actual_run_time_seconds",
+    "downtime_seconds",
+    "weighted_performance_seconds",
+    "total_parts",
+    "good_parts",
+    "reject_parts",
+    "window_count",
+)
+_SUMMARY_SELECT = """
+    SUM(planned_time_seconds) AS planned_time_seconds,
+    SUM(actual_run_time_seconds) AS actual_run_time_seconds,
+    SUM(downtime_seconds) AS downtime_seconds,
+    SUM(performance * actual_run_time_seconds) AS weighted_performance_seconds,
+    SUM(total_parts) AS total_parts,
+    SUM(good_parts) AS good_parts,
+    SUM(reject_parts) AS reject_parts,
+    COUNT(*) AS window_count
+"""
+# Trend bucket sizes, smallest first; the range / max_points is rounded up to one of
+# these, or used as is (whole seconds) beyond the largest
+_TREND_BUCKETS = (
+    60, 120, 300, 600, 900, 1800, 3600, 2 * 3600, 3 * 3600, 6 * 3600, 12 * 3600, 86400, 7 * 86400,
+)
+# With LTTB, buckets are this many times finer before downsampling back to max_points
+_LTTB_OVERSAMPLE = 4
+
+
+def _summarize(sums: dict[str, Any]) -> dict[str, Any]:
+    """Turn summed window totals into OEE components for the whole range.
+
+    Availability and quality are ratios of the summed times and parts;
+    performance is each window's performance weighted by its run time.
+    """
+    planned = sums["planned_time_seconds"]
+    run_time = sums["actual_run_time_seconds"]
+    total_parts = sums["total_parts"]
+    availability = run_time / planned if planned else None
+    performance = sums["weighted_performance_seconds"] / run_time if run_time else None
+    quality = sums["good_parts"] / total_parts if total_parts else None
+    oee = (
+        availability * performance * quality
+        if availability is not None and performance is not None and quality is not None
+        else None
+    )
+    summary = {k: v for k, v in sums.items() if k != "weighted_performance_seconds"}
+    return dict(summary, oee=oee, availability=availability, performance=performance, quality=quality)
+
+
+@router.get("/summary")
+async def get_oee_summary(
+    machine_id: str | None = Query(None),
+    from_time: datetime | None = Query(None),
+    to_time: datetime | None = Query(None),
+    _=Depends(get_current_user),
+) -> dict[str, Any]:
+    """OEE over a time range per machine, plus the fleet total, aggregated in InfluxDB.
+
+    Every window in the range counts (no row limit), weighted by its planned
+    and run time, so long ranges give the same answer as the sum of their parts.
+    """
+    filters = []
+    if machine_id:
+        filters.append(f"machine_id = '{machine_id}'")
+    tf = _build_time_filter(from_time, to_time)
+    if tf:
+        filters.append(tf)
+    where = f"WHERE {' AND '.join(filters)}" if filters else ""
+    sql = f"""
+        SELECT machine_id, {_SUMMARY_SELECT}
+        FROM oee_metrics
+        {where}
+        GROUP BY machine_id
+        ORDER BY machine_id
+    """
+    result = query_influx(sql)
+    machines = []
+    fleet = dict.fromkeys(_SUMMARY_SUMS, 0)
+    for i, mid in enumerate(result.get("machine_id", [])):
+        sums = {k: result[k][i] or 0 for k in _SUMMARY_SUMS}
+        for k in _SUMMARY_SUMS:
+            fleet[k] += sums[k]
+        machines.append(dict(_summarize(sums), machine_id=mid))
+    return {"machines": machines, "fleet": _summarize(fleet)}
+
+
+def _trend_bucket(span_seconds: float, points: int) -> int:
+    # Epoch-aligned buckets can straddle one extra bucket at the range's ends
+    target = span_seconds / max(points - 1, 1)
+    return next((b for b in _TREND_BUCKETS if b >= target), math.ceil(target))
+
+
+@router.get("/trend")
+async def get_oee_trend(
+    machine_id: str | None = Query(None),
+    from_time: datetime | None = Query(None),
+    to_time: datetime | None = Query(None),
+    max_points: int = Query(500, ge=10, le=5000),
+    metric: str = Query("oee", pattern="^(oee|availability|performance|quality)$"),
+    lttb: bool = Query(False),
+    _=Depends(get_current_user),
+) -> dict[str, Any]:
+    """OEE over time, at most ``max_points`` points per machine whatever the range.
+
+    Windows are grouped into ``date_bin`` buckets sized from the range and
+    aggregated in InfluxDB with the same weighting as ``/summary``.  With
+    ``lttb`` the buckets are finer and each machine's series is downsampled
+    on ``metric`` with largest-triangle-three-buckets, which keeps short dips
+    a plain average would smooth away.  The range defaults to the last 24 hours.
+    """
+    # Naive timestamps are taken as UTC so they can be compared with the default
+    to_time = to_time or datetime.now(timezone.utc)
+    to_time = to_time if to_time.tzinfo else to_time.replace(tzinfo=timezone.utc)
+    from_time = from_time or to_time - timedelta(hours=24)
+    from_time = from_time if from_time.tzinfo else from_time.replace(tzinfo=timezone.utc)
+    span = (to_time - from_time).total_seconds()
+    bucket = _trend_bucket(span, max_points * _LTTB_OVERSAMPLE if lttb else max_points)
+
+    filters = [_build_time_filter(from_time, to_time)]
+    if machine_id:
+        filters.append(f"machine_id = '{machine_id}'")
+    sql = f"""
+        SELECT machine_id,
+               date_bin(INTERVAL '{bucket} seconds', time, TIMESTAMP '1970-01-01T00:00:00Z') AS bin,
+               {_SUMMARY_SELECT}
+        FROM oee_metrics
+        WHERE {' AND '.join(filters)}
+        GROUP BY machine_id, bin
+        ORDER BY machine_id, bin
+    """
+    result = query_influx(sql)
+    series: dict[str, list[dict[str, Any]]] = {}
+    for i, mid in enumerate(result.get("machine_id", [])):
+        sums = {k: result[k][i] or 0 for k in _SUMMARY_SUMS}
+        row = dict(_summarize(sums), machine_id=mid, time=result["bin"][i])
+        series.setdefault(mid, []).append(row)
+
+    points = []
+    for rows in series.values():
+        if lttb and len(rows) > max_points:
+            rows = [r for r in rows if r[metric] is not None]
+            xs = [r["time"].timestamp() for r in rows]
+            keep = downsample.lttb(xs, [r[metric] for r in rows], max_points)
+            rows = [rows[k] for k in keep]
+        points.extend(rows)
+    return {"bucket_seconds": bucket, "points": points}
+
+
 @router.get("/current/{machine_id}")
-async def get_current_oee(machine_id: str, _=Depends(get_current_user)) -> dict[str, Any]:
-    """Return the most recent OEE snapshot for a machine."""
+async def get_current_oee(
+    machine_id: str,
+    include_provisional: bool = Query(True),
+    _=Depends(get_current_user),
+) -> dict[str, Any]:
+    """Return the most recent OEE snapshot for a machine.
+
+    When the OEE service publishes provisional results for the open window
+    and one is newer than the last closed window, that one is returned with
+    ``provisional: true``.
+    """
     sql = f"""
         SELECT * FROM oee_metrics
         WHERE machine_id = '{machine_id}'
@@ -125,9 +285,23 @@ async def get_current_oee(machine_id: str, _=Depends(get_current_user)) -> dict[
         LIMIT 1
     """
     result = query_influx(sql)
-    if not result:
-        return {}
-    keys = list(result.keys())
-    n = len(result[keys[0]]) if keys else 0
-    rows = [{k: result[k][i] for k in keys} for i in range(n)]
-    return rows[0] if rows else {}
+    rows = []
+    if result:
+        keys = list(result.keys())
+        n = len(result[keys[0]]) if keys else 0
+        rows = [{k: result[k][i] for k in keys} for i in range(n)]
+    latest = dict(rows[0], provisional=False) if rows else {}
+
+    if include_provisional:
+        provisional_sql = f"""
+            SELECT * FROM oee_provisional
+            WHERE machine_id = '{machine_id}'
+            ORDER BY time DESC
+            LIMIT 1
+        """
+        result = query_influx(provisional_sql)
+        if result.get("time"):
+            candidate = {k: v[0] for k, v in result.items() if v}
+            if not latest or candidate["time"] > latest["time"]:
+                return dict(candidate, provisional=True)
+    return latest
@@ -1,13 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_current_user, get_db, require_admin
-from app.models.product import MachineProductConfig, Product
+from app.core.database import notify_oee_config_changed
+from app.models.product import MachineProductConfig, Product, ProductRun
+from app.models.user import User
 from app.schemas.product import (
     MachineProductConfigCreate, MachineProductConfigRead, MachineProductConfigUpdate,
     ProductCreate, ProductRead, ProductUpdate,
+    ProductRunCreate, ProductRunRead, ProductRunUpdate,
 )
+from app.services.recalc import queue_recalculation
 
 router = APIRouter(tags=["products"])
 
@@ -63,30 +69,132 @@ async def list_mpc(machine_id: int | None = None, db: AsyncSession = Depends(get
     return (await db.execute(q)).scalars().all()
 
 
+# Cycle time changes only apply to windows calculated from now on; passing this
+# also queues a recalculation of the windows in which the product ran
+_RECALCULATE_FROM = Query(None, description="Recalculate the affected windows' OEE from this time")
+
+
 @router.post("/machine-product-configs", response_model=MachineProductConfigRead, status_code=201)
-async def create_mpc(payload: MachineProductConfigCreate, db: AsyncSession = Depends(get_db), _=Depends(require_admin)):
+async def create_mpc(
+    payload: MachineProductConfigCreate,
+    recalculate_from: datetime | None = _RECALCULATE_FROM,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_admin),
+):
     obj = MachineProductConfig(**payload.model_dump())
     db.add(obj)
     await db.flush()
     await db.refresh(obj)
+    await notify_oee_config_changed(db, obj.machine_id)
+    if recalculate_from:
+        await queue_recalculation(
+            db, [obj.machine_id], recalculate_from, current_user.id,
+            f"machine-product config {obj.id} created", product_id=obj.product_id,
+        )
     return obj
 
 
 @router.patch("/machine-product-configs/{config_id}", response_model=MachineProductConfigRead)
-async def update_mpc(config_id: int, payload: MachineProductConfigUpdate, db: AsyncSession = Depends(get_db), _=Depends(require_admin)):
+async def update_mpc(
+    config_id: int,
+    payload: MachineProductConfigUpdate,
+    recalculate_from: datetime | None = _RECALCULATE_FROM,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_admin),
+):
     obj = await db.get(MachineProductConfig, config_id)
     if not obj:
         raise HTTPException(404, "Config not found")
+    previous_machine_id, previous_product_id = obj.machine_id, obj.product_id
     for k, v in payload.model_dump(exclude_none=True).items():
         setattr(obj, k, v)
     await db.flush()
     await db.refresh(obj)
+    await notify_oee_config_changed(db, obj.machine_id)
+    if previous_machine_id != obj.machine_id:
+        await notify_oee_config_changed(db, previous_machine_id)
+    if recalculate_from:
+        # Moved to another product: every window of the machine may be affected
+        await queue_recalculation(
+            db, [obj.machine_id, previous_machine_id], recalculate_from, current_user.id,
+            f"machine-product config {obj.id} updated",
+            product_id=obj.product_id if obj.product_id == previous_product_id else None,
+        )
     return obj
 
 
 @router.delete("/machine-product-configs/{config_id}", status_code=204)
-async def delete_mpc(config_id: int, db: AsyncSession = Depends(get_db), _=Depends(require_admin)):
+async def delete_mpc(
+    config_id: int,
+    recalculate_from: datetime | None = _RECALCULATE_FROM,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_admin),
+):
     obj = await db.get(MachineProductConfig, config_id)
     if not obj:
         raise HTTPException(404, "Config not found")
     await db.delete(obj)
+    await notify_oee_config_changed(db, obj.machine_id)
+    if recalculate_from:
+        await queue_recalculation(
+            db, [obj.machine_id], recalculate_from, current_user.id,
+            f"machine-product config {config_id} deleted", product_id=obj.product_id,
+        )
+
+
+# ── Product Runs ──────────────────────────────────────────────────────────────
+@router.get("/product-runs", response_model=list[ProductRunRead])
+async def list_product_runs(
+    machine_id: int | None = None,
+    from_time: datetime | None = Query(None),
+    to_time: datetime | None = Query(None),
+    db: AsyncSession = Depends(get_db),
+    _=Depends(get_current_user),
+):
+    q = select(ProductRun).order_by(ProductRun.start_time.desc())
+    if machine_id:
+        q = q.where(ProductRun.machine_id == machine_id)
+    if from_time:
+        q = q.where(or_(ProductRun.end_time.is_(None), ProductRun.end_time >= from_time))
+    if to_time:
+        q = q.where(ProductRun.start_time <= to_time)
+    return (await db.execute(q)).scalars().all()
+
+
+@router.post("/product-runs", response_model=ProductRunRead, status_code=201)
+async def create_product_run(payload: ProductRunCreate, db: AsyncSession = Depends(get_db), _=Depends(get_current_user)):
+    # Starting a run ends whatever was running on the machine at that moment
+    await db.execute(
+        update(ProductRun)
+        .where(
+            ProductRun.machine_id == payload.machine_id,
+            ProductRun.end_time.is_(None),
+            ProductRun.start_time < payload.start_time,
+        )
+        .values(end_time=payload.start_time)
+    )
+    obj = ProductRun(**payload.model_dump(), source="operator")
+    db.add(obj)
+    await db.flush()
+    await db.refresh(obj)
+    return obj
+
+
+@router.patch("/product-runs/{run_id}", response_model=ProductRunRead)
+async def update_product_run(run_id: int, payload: ProductRunUpdate, db: AsyncSession = Depends(get_db), _=Depends(get_current_user)):
+    obj = await db.get(ProductRun, run_id)
+    if not obj:
+        raise HTTPException(404, "Product run not found")
+    for k, v in payload.model_dump(exclude_none=True).items():
+        setattr(obj, k, v)
+    await db.flush()
+    await db.refresh(obj)
+    return obj
+
+
+@router.delete("/product-runs/{run_id}", status_code=204)
+async def delete_product_run(run_id: int, db: AsyncSession = Depends(get_db), _=Depends(require_admin)):
+    obj = await db.get(ProductRun, run_id)
+    if not obj:
+        raise HTTPException(404, "Product run not found")
+    await db.delete(obj)
@@ -15,7 +15,7 @@ router = APIRouter(prefix="/system", tags=["system-admin"])
 SERVICES = [
     {"name": "frontend", "description": "React UI + Nginx", "port": "80"},
     {"name": "backend", "description": "FastAPI", "port": "8000"},
-    {"name": "oee-service", "description": "OEE Calculator", "port": None},
+    {"name": "oee-service", "description": "OEE Calculator", "port": "9100"},
     {"name": "postgres", "description": "PostgreSQL", "port": "5432"},
     {"name": "influxdb", "description": "InfluxDB 3 Core", "port": "8181"},
     {"name": "grafana", "description": "Grafana", "port": "3001", "url": "/grafana"},
@@ -55,8 +55,7 @@ async def system_health(db: AsyncSession = Depends(get_db), _=Depends(require_ad
     results["backend"] = "ok"
     # Frontend/nginx is always ok (request came through it)
     results["frontend"] = "ok"
-    # OEE service has no health endpoint
-    results["oee-service"] = "no_health_check"
+    details = {}
 
     # Check PostgreSQL + version
     try:
@@ -73,11 +72,20 @@ async def system_health(db: AsyncSession = Depends(get_db), _=Depends(require_ad
         checks = await asyncio.gather(
             _check_http(client, f"{settings.INFLUXDB_URL}/health", influx_headers),
             _check_http(client, "http://grafana:3000/api/health"),
+            _check_http(client, f"{settings.OEE_SERVICE_URL}/health"),
         )
         results["influxdb"] = checks[0][0]
         results["grafana"] = checks[1][0]
         versions["grafana"] = _extract_version("grafana", checks[1][1])
 
+        # OEE service reports "ok" or "degraded" (overrunning cycles, failing writes)
+        oee_status, oee_body = checks[2]
+        if oee_status == "ok" and oee_body:
+            results["oee-service"] = oee_body.get("status", "ok")
+            details["oee-service"] = oee_body
+        else:
+            results["oee-service"] = oee_status
+
         # InfluxDB version via SQL endpoint
         if results["influxdb"] == "ok":
             try:
@@ -105,6 +113,8 @@ async def system_health(db: AsyncSession = Depends(get_db), _=Depends(require_ad
         ver = versions.get(svc["name"])
         if ver:
             entry["version"] = ver
+        if svc["name"] in details:
+            entry["details"] = details[svc["name"]]
         services.append(entry)
     return {"services": services}
 
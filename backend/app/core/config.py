@@ -23,6 +23,8 @@ class Settings(BaseSettings):
 
     # OEE service (used when imported from oee-service)
     OEE_CALC_INTERVAL_SECONDS: int = 300
+    # OEE service metrics/health endpoint
+    OEE_SERVICE_URL: str = "http://oee-service:9100"
 
 
 settings = Settings()
@@ -1,3 +1,4 @@
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
 
@@ -19,3 +20,15 @@ async def get_db() -> AsyncSession:
         except Exception:
             await session.rollback()
             raise
+
+
+# The OEE service LISTENs on this channel and reloads the notified machine's configs
+OEE_CONFIG_CHANNEL = "oee_config_changed"
+
+
+async def notify_oee_config_changed(db: AsyncSession, machine_id: int) -> None:
+    """Publish a machine config change; Postgres delivers it when the transaction commits."""
+    await db.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": OEE_CONFIG_CHANNEL, "payload": str(machine_id)},
+    )
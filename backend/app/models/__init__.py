@@ -1,7 +1,7 @@
 from app.models.user import User
 from app.models.organization import Site, Area, Line, Machine
 from app.models.shift import ShiftSchedule, ShiftInstance
-from app.models.product import Product, MachineProductConfig
+from app.models.product import Product, MachineProductConfig, ProductRun
 from app.models.downtime import DowntimeCategory, DowntimeCode, DowntimeEvent
 from app.models.oee_config import (
     OEETarget,
@@ -10,16 +10,18 @@ from app.models.oee_config import (
     MachineQualityConfig,
     RejectEvent,
 )
+from app.models.oee_state import MinorStoppage, OEECalcCheckpoint, OEERecalcJob, TagMonitorWatermark
 
 __all__ = [
     "User",
     "Site", "Area", "Line", "Machine",
     "ShiftSchedule", "ShiftInstance",
-    "Product", "MachineProductConfig",
+    "Product", "MachineProductConfig", "ProductRun",
     "DowntimeCategory", "DowntimeCode", "DowntimeEvent",
     "OEETarget",
     "MachineAvailabilityConfig",
     "MachinePerformanceConfig",
     "MachineQualityConfig",
     "RejectEvent",
+    "OEECalcCheckpoint", "OEERecalcJob", "TagMonitorWatermark", "MinorStoppage",
 ]
@@ -65,6 +65,10 @@ class DowntimeTagConfig(Base):
     digital_downtime_value: Mapped[str | None] = mapped_column(String(64), nullable=True)
     analog_operator: Mapped[str | None] = mapped_column(String(8), nullable=True)
     analog_threshold: Mapped[float | None] = mapped_column(Double(), nullable=True)
+    # Analog only: leave downtime once the value is this far back past the threshold
+    analog_hysteresis: Mapped[float | None] = mapped_column(Double(), nullable=True)
+    # Ignore down/up runs shorter than this many seconds
+    debounce_seconds: Mapped[float | None] = mapped_column(Double(), nullable=True)
     downtime_category_id: Mapped[int | None] = mapped_column(
         Integer, ForeignKey("downtime_categories.id", ondelete="SET NULL"), nullable=True
     )
@@ -0,0 +1,92 @@
+"""OEE service runtime state — calculation checkpoints, recalculation jobs, tag monitor watermarks and minor stoppage counts."""
+from datetime import datetime, timezone
+
+from sqlalchemy import JSON, BigInteger, DateTime, Double, ForeignKey, Integer, String, Text
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from app.core.database import Base
+
+
+class OEECalcCheckpoint(Base):
+    """End of the last interval-aligned OEE window completed for a machine."""
+
+    __tablename__ = "oee_calc_checkpoints"
+
+    machine_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("machines.id", ondelete="CASCADE"), primary_key=True
+    )
+    last_window_end: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    # Last production_count sample at or before last_window_end, used as the
+    # baseline for counter deltas in the next window
+    counter_time: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    counter_total: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    counter_reject: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False
+    )
+
+    machine: Mapped["Machine"] = relationship("Machine")  # type: ignore[name-defined]
+
+
+class OEERecalcJob(Base):
+    """Request to recompute historical OEE windows, picked up by the OEE service."""
+
+    __tablename__ = "oee_recalc_jobs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    machine_ids: Mapped[list] = mapped_column(JSON, nullable=False)
+    range_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    range_end: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    # Limit to windows in which this product ran (product-specific config changes)
+    product_id: Mapped[int | None] = mapped_column(
+        Integer, ForeignKey("products.id", ondelete="SET NULL"), nullable=True
+    )
+    reason: Mapped[str | None] = mapped_column(Text, nullable=True)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="queued")  # queued | running | completed | failed
+    total_windows: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    completed_windows: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    requested_by: Mapped[int | None] = mapped_column(
+        Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False
+    )
+    started_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False
+    )
+
+
+class TagMonitorWatermark(Base):
+    """Time of the last tag sample the tag monitor has evaluated for a config."""
+
+    __tablename__ = "tag_monitor_watermarks"
+
+    config_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("downtime_tag_configs.id", ondelete="CASCADE"), primary_key=True
+    )
+    last_sample_time: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False
+    )
+
+
+class MinorStoppage(Base):
+    """Tag-detected stops shorter than the machine's minor stoppage threshold, per calculation window.
+
+    Counted here instead of being recorded as downtime events.
+    """
+
+    __tablename__ = "minor_stoppages"
+
+    machine_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("machines.id", ondelete="CASCADE"), primary_key=True
+    )
+    window_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    stop_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    stop_seconds: Mapped[float] = mapped_column(Double, nullable=False, default=0.0)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False
+    )
@@ -1,4 +1,6 @@
-from sqlalchemy import Float, ForeignKey, Integer, String, Text, UniqueConstraint
+from datetime import datetime, timezone
+
+from sqlalchemy import DateTime, Float, ForeignKey, Index, Integer, String, Text, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.core.database import Base
@@ -30,3 +32,24 @@ class MachineProductConfig(Base):
 
     machine: Mapped["Machine"] = relationship("Machine")  # type: ignore[name-defined]
     product: Mapped["Product"] = relationship("Product", back_populates="machine_configs")
+
+
+class ProductRun(Base):
+    """Which product ran on which machine, and when (end_time NULL = still running)."""
+
+    __tablename__ = "product_runs"
+    __table_args__ = (Index("ix_product_runs_machine_start", "machine_id", "start_time"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    machine_id: Mapped[int] = mapped_column(Integer, ForeignKey("machines.id", ondelete="CASCADE"), nullable=False)
+    product_id: Mapped[int] = mapped_column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    start_time: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    end_time: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # "operator" (entered through the API) or "tag" (detected by the OEE service)
+    source: Mapped[str] = mapped_column(String(16), nullable=False, default="operator")
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False
+    )
+
+    machine: Mapped["Machine"] = relationship("Machine")  # type: ignore[name-defined]
+    product: Mapped["Product"] = relationship("Product")
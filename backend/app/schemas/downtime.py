@@ -82,6 +82,8 @@ class DowntimeTagConfigBase(BaseModel):
     digital_downtime_value: str | None = None
     analog_operator: str | None = None
     analog_threshold: float | None = None
+    analog_hysteresis: float | None = None
+    debounce_seconds: float | None = None
     downtime_category_id: int | None = None
     description: str | None = None
     is_enabled: bool = True
@@ -99,6 +101,8 @@ class DowntimeTagConfigUpdate(BaseModel):
     digital_downtime_value: str | None = None
     analog_operator: str | None = None
     analog_threshold: float | None = None
+    analog_hysteresis: float | None = None
+    debounce_seconds: float | None = None
     downtime_category_id: int | None = None
     description: str | None = None
     is_enabled: bool | None = None
@@ -138,3 +138,25 @@ class RejectEventRead(RejectEventBase):
     operator_id: int | None
     created_at: datetime
     model_config = {"from_attributes": True}
+
+
+# ── Recalculation Job ─────────────────────────────────────────────────────────
+class OEERecalcJobCreate(BaseModel):
+    machine_ids: list[int]
+    range_start: datetime
+    range_end: datetime
+    product_id: int | None = None
+    reason: str | None = None
+
+
+class OEERecalcJobRead(OEERecalcJobCreate):
+    id: int
+    status: str
+    total_windows: int
+    completed_windows: int
+    error: str | None
+    requested_by: int | None
+    created_at: datetime
+    started_at: datetime | None
+    finished_at: datetime | None
+    model_config = {"from_attributes": True}
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from pydantic import BaseModel
 
 
@@ -39,3 +41,27 @@ class MachineProductConfigUpdate(BaseModel):
 class MachineProductConfigRead(MachineProductConfigBase):
     id: int
     model_config = {"from_attributes": True}
+
+
+class ProductRunBase(BaseModel):
+    machine_id: int
+    product_id: int
+    start_time: datetime
+    end_time: datetime | None = None
+
+
+class ProductRunCreate(ProductRunBase):
+    pass
+
+
+class ProductRunUpdate(BaseModel):
+    product_id: int | None = None
+    start_time: datetime | None = None
+    end_time: datetime | None = None
+
+
+class ProductRunRead(ProductRunBase):
+    id: int
+    source: str
+    created_at: datetime
+    model_config = {"from_attributes": True}
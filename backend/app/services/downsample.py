@@ -0,0 +1,36 @@
+"""Downsampling for time-series charts."""
+from typing import Sequence
+
+
+def lttb(xs: Sequence[float], ys: Sequence[float], threshold: int) -> list[int]:
+    """Largest-triangle-three-buckets: indices of ``threshold`` points that keep the line's shape.
+
+    The first and last points are always kept; every bucket in between
+    contributes the point forming the largest triangle with the previously
+    kept point and the average of the next bucket.  ``xs`` must be sorted.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    kept = [0]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        next_xs, next_ys = xs[end:next_end] or xs[-1:], ys[end:next_end] or ys[-1:]
+        avg_x = sum(next_xs) / len(next_xs)
+        avg_y = sum(next_ys) / len(next_ys)
+
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        kept.append(best)
+        a = best
+    kept.append(n - 1)
+    return kept
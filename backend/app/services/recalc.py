@@ -0,0 +1,36 @@
+"""Queueing historical OEE recalculations after a config change."""
+from datetime import datetime, timezone
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.oee_state import OEERecalcJob
+
+
+async def queue_recalculation(
+    db: AsyncSession,
+    machine_ids: list[int],
+    range_start: datetime,
+    requested_by: int | None,
+    reason: str,
+    product_id: int | None = None,
+) -> OEERecalcJob:
+    """Queue a job recomputing ``machine_ids`` from ``range_start`` until now with the current configs.
+
+    The OEE service only rewrites windows up to each machine's checkpoint;
+    later windows use the new config anyway.  With ``product_id``, only
+    windows in which that product ran are recomputed.
+    """
+    if range_start.tzinfo is None:
+        range_start = range_start.replace(tzinfo=timezone.utc)
+    job = OEERecalcJob(
+        machine_ids=sorted(set(machine_ids)),
+        range_start=range_start,
+        range_end=datetime.now(timezone.utc),
+        product_id=product_id,
+        reason=reason,
+        status="queued",
+        requested_by=requested_by,
+    )
+    db.add(job)
+    await db.flush()
+    return job
@@ -0,0 +1,34 @@
+"""OEE calculation checkpoints for gap-free window processing
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "003"
+down_revision: Union[str, None] = "002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ── oee_calc_checkpoints ──────────────────────────────────────────────────
+    op.create_table(
+        "oee_calc_checkpoints",
+        sa.Column(
+            "machine_id",
+            sa.Integer(),
+            sa.ForeignKey("machines.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("last_window_end", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("oee_calc_checkpoints")
@@ -0,0 +1,35 @@
+"""Product runs: which product ran on which machine, and when
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "004"
+down_revision: Union[str, None] = "003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ── product_runs ──────────────────────────────────────────────────────────
+    op.create_table(
+        "product_runs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("machine_id", sa.Integer(), sa.ForeignKey("machines.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("start_time", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("end_time", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("source", sa.String(16), nullable=False, server_default="operator"),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+    op.create_index("ix_product_runs_id", "product_runs", ["id"])
+    op.create_index("ix_product_runs_machine_start", "product_runs", ["machine_id", "start_time"])
+
+
+def downgrade() -> None:
+    op.drop_table("product_runs")
@@ -0,0 +1,28 @@
+"""Production counter watermarks on OEE calculation checkpoints
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "005"
+down_revision: Union[str, None] = "004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ── oee_calc_checkpoints: last production_count sample seen ──────────────
+    op.add_column("oee_calc_checkpoints", sa.Column("counter_time", sa.DateTime(timezone=True), nullable=True))
+    op.add_column("oee_calc_checkpoints", sa.Column("counter_total", sa.BigInteger(), nullable=True))
+    op.add_column("oee_calc_checkpoints", sa.Column("counter_reject", sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("oee_calc_checkpoints", "counter_reject")
+    op.drop_column("oee_calc_checkpoints", "counter_total")
+    op.drop_column("oee_calc_checkpoints", "counter_time")
@@ -0,0 +1,43 @@
+"""Historical OEE recalculation jobs
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "006"
+down_revision: Union[str, None] = "005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ── oee_recalc_jobs ───────────────────────────────────────────────────────
+    op.create_table(
+        "oee_recalc_jobs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("machine_ids", sa.JSON(), nullable=False),
+        sa.Column("range_start", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("range_end", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id", ondelete="SET NULL"), nullable=True),
+        sa.Column("reason", sa.Text(), nullable=True),
+        sa.Column("status", sa.String(16), nullable=False, server_default="queued"),
+        sa.Column("total_windows", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("completed_windows", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("requested_by", sa.Integer(), sa.ForeignKey("users.id", ondelete="SET NULL"), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+    op.create_index("ix_oee_recalc_jobs_id", "oee_recalc_jobs", ["id"])
+    op.create_index("ix_oee_recalc_jobs_status", "oee_recalc_jobs", ["status"])
+
+
+def downgrade() -> None:
+    op.drop_table("oee_recalc_jobs")
@@ -0,0 +1,40 @@
+"""Tag monitor edge detection: sample watermarks, hysteresis and debounce
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "007"
+down_revision: Union[str, None] = "006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ── downtime_tag_configs: optional edge filters ───────────────────────────
+    op.add_column("downtime_tag_configs", sa.Column("analog_hysteresis", sa.Double(), nullable=True))
+    op.add_column("downtime_tag_configs", sa.Column("debounce_seconds", sa.Double(), nullable=True))
+
+    # ── tag_monitor_watermarks ────────────────────────────────────────────────
+    op.create_table(
+        "tag_monitor_watermarks",
+        sa.Column(
+            "config_id",
+            sa.Integer(),
+            sa.ForeignKey("downtime_tag_configs.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("last_sample_time", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("tag_monitor_watermarks")
+    op.drop_column("downtime_tag_configs", "debounce_seconds")
+    op.drop_column("downtime_tag_configs", "analog_hysteresis")
@@ -0,0 +1,35 @@
+"""Minor stoppage counts per machine and calculation window
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "008"
+down_revision: Union[str, None] = "007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "minor_stoppages",
+        sa.Column(
+            "machine_id",
+            sa.Integer(),
+            sa.ForeignKey("machines.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("window_start", sa.DateTime(timezone=True), primary_key=True),
+        sa.Column("stop_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("stop_seconds", sa.Double(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("minor_stoppages")
@@ -1,11 +1,14 @@
 import { useRef, useState, useEffect, useMemo } from "react";
+import { useQuery } from "@tanstack/react-query";
 import * as d3 from "d3";
-import type { OEEMetric, Machine } from "@/lib/api";
+import { oeeMetricsApi, type Machine } from "@/lib/api";
 
 export type TrendMetric = "oee" | "availability" | "performance" | "quality";
 
 interface Props {
-  data: OEEMetric[];
+  fromTime: string;
+  toTime: string;
+  machineId?: string;
   machines: Machine[];
   metric: TrendMetric;
   height?: number;
@@ -17,6 +20,9 @@ const MACHINE_COLORS = [
 ];
 
 const MARGIN = { top: 24, right: 24, bottom: 44, left: 52 };
+// One point per this many pixels; rounded so resizing doesn't refetch on every pixel
+const PX_PER_POINT = 2;
+const POINT_STEP = 50;
 
 function useContainerWidth(ref: React.RefObject<HTMLDivElement | null>): number {
   const [width, setWidth] = useState(600);
@@ -29,7 +35,7 @@ function useContainerWidth(ref: React.RefObject<HTMLDivElement | null>): number
   return width;
 }
 
-export function OEETrendChart({ data, machines, metric, height = 300 }: Props) {
+export function OEETrendChart({ fromTime, toTime, machineId, machines, metric, height = 300 }: Props) {
   const containerRef = useRef<HTMLDivElement>(null);
   const xAxisRef = useRef<SVGGElement>(null);
   const yAxisRef = useRef<SVGGElement>(null);
@@ -43,12 +49,36 @@ export function OEETrendChart({ data, machines, metric, height = 300 }: Props) {
   const innerWidth = containerWidth - MARGIN.left - MARGIN.right;
   const innerHeight = height - MARGIN.top - MARGIN.bottom;
 
+  // The server buckets the whole range to about one point per PX_PER_POINT
+  // pixels, keeping dips with LTTB, so long ranges stay complete and light
+  const maxPoints = Math.max(
+    POINT_STEP,
+    Math.round(innerWidth / PX_PER_POINT / POINT_STEP) * POINT_STEP
+  );
+  const { data: trend, isLoading } = useQuery({
+    queryKey: ["oee-metrics", "trend", fromTime, toTime, machineId, metric, maxPoints],
+    queryFn: () =>
+      oeeMetricsApi
+        .trend({
+          from_time: fromTime,
+          to_time: toTime,
+          machine_id: machineId,
+          metric,
+          max_points: maxPoints,
+          lttb: true,
+        })
+        .then((r) => r.data),
+    refetchInterval: 60_000,
+    placeholderData: (previous) => previous,
+  });
+  const data = useMemo(() => trend?.points ?? [], [trend]);
+
   // Parse and sort data, group by machine
   const byMachine = useMemo(() => {
     const groups: Record<string, { time: Date; value: number }[]> = {};
     for (const row of data) {
       if (!row.time || row.machine_id == null) continue;
-      const val = row[metric] as number | undefined;
+      const val = row[metric];
       if (val == null) continue;
       const mid = String(row.machine_id);
       if (!groups[mid]) groups[mid] = [];
@@ -82,12 +112,14 @@ export function OEETrendChart({ data, machines, metric, height = 300 }: Props) {
   useEffect(() => {
     if (!xAxisRef.current) return;
     const tickCount = containerWidth < 400 ? 4 : 6;
+    const [start, end] = xScale.domain();
+    const format = end.getTime() - start.getTime() > 2 * 24 * 60 * 60 * 1000 ? "%b %d" : "%H:%M";
     d3.select(xAxisRef.current)
       .call(
         d3
           .axisBottom(xScale)
           .ticks(tickCount)
-          .tickFormat((d) => d3.timeFormat("%H:%M")(d as Date))
+          .tickFormat((d) => d3.timeFormat(format)(d as Date))
       )
       .call((g) => g.select(".domain").attr("stroke", "#e5e7eb"))
       .call((g) => g.selectAll(".tick line").attr("stroke", "#e5e7eb"))
@@ -168,7 +200,9 @@ export function OEETrendChart({ data, machines, metric, height = 300 }: Props) {
           className="flex items-center justify-center text-sm text-gray-400"
           style={{ height }}
         >
-          No data for this time range — metrics are written every OEE calculation interval.
+          {isLoading
+            ? "Loading…"
+            : "No data for this time range — metrics are written every OEE calculation interval."}
         </div>
       ) : (
         <>
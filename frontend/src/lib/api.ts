@@ -202,6 +202,8 @@ export const oeeMetricsApi = {
   performance: (params?: OEEQueryParams) => api.get<OEEMetric[]>("/oee-metrics/performance", { params }),
   quality: (params?: OEEQueryParams) => api.get<OEEMetric[]>("/oee-metrics/quality", { params }),
   current: (machineId: string) => api.get<OEEMetric>(`/oee-metrics/current/${machineId}`),
+  summary: (params?: Omit<OEEQueryParams, "limit">) => api.get<OEESummary>("/oee-metrics/summary", { params }),
+  trend: (params?: OEETrendParams) => api.get<OEETrend>("/oee-metrics/trend", { params }),
 };
 
 // ── Types ─────────────────────────────────────────────────────────────────────
@@ -253,7 +255,8 @@ export interface DowntimeCode {
 export interface DowntimeTagConfig {
   id: number; machine_id: number; measurement_name: string; tag_field: string;
   tag_type: "digital" | "analog"; digital_downtime_value?: string;
-  analog_operator?: string; analog_threshold?: number;
+  analog_operator?: string; analog_threshold?: number; analog_hysteresis?: number;
+  debounce_seconds?: number;
   downtime_category_id?: number; description?: string; is_enabled: boolean;
 }
 export interface DowntimeEvent {
@@ -307,15 +310,31 @@ export interface OEEMetric {
   total_parts?: number; good_parts?: number; reject_parts?: number;
   ideal_cycle_time?: number;
   value?: number;
+  // Open-window result from the OEE service, superseded when the window closes
+  provisional?: boolean; elapsed_seconds?: number;
 }
+// Range totals from /oee-metrics/summary; ratios are null when there is nothing to divide by
+export interface OEESummaryRow {
+  machine_id?: string;
+  oee: number | null; availability: number | null; performance: number | null; quality: number | null;
+  planned_time_seconds: number; actual_run_time_seconds: number; downtime_seconds: number;
+  total_parts: number; good_parts: number; reject_parts: number; window_count: number;
+}
+export interface OEESummary { machines: OEESummaryRow[]; fleet: OEESummaryRow; }
 export interface OEEQueryParams {
   machine_id?: string; from_time?: string; to_time?: string; limit?: number;
 }
+// Trend points are bucketed server-side; at most max_points per machine
+export interface OEETrendParams extends Omit<OEEQueryParams, "limit"> {
+  max_points?: number; metric?: "oee" | "availability" | "performance" | "quality"; lttb?: boolean;
+}
+export interface OEETrend { bucket_seconds: number; points: (OEESummaryRow & { time: string })[]; }
 
 export interface ServiceStatus {
   name: string; description: string; port: string | null;
-  status: "ok" | "error" | "no_health_check"; url?: string;
+  status: "ok" | "degraded" | "error" | "no_health_check"; url?: string;
   version?: string;
+  details?: { problems?: string[] } & Record<string, unknown>;
 }
 export interface SystemHealthResponse { services: ServiceStatus[]; }
 export interface SampleDataStatus { loaded: boolean; }
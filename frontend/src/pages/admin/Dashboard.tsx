@@ -1,6 +1,6 @@
 import { useState, useMemo } from "react";
 import { useQuery } from "@tanstack/react-query";
-import { machinesApi, oeeMetricsApi, downtimeEventsApi, downtimeCodesApi, type OEEMetric } from "@/lib/api";
+import { machinesApi, oeeMetricsApi, downtimeEventsApi, downtimeCodesApi } from "@/lib/api";
 import { OEEDonutChart } from "@/components/charts/OEEDonutChart";
 import { DowntimeStackedChart } from "@/components/charts/DowntimeStackedChart";
 import { RefreshCw } from "lucide-react";
@@ -26,32 +26,6 @@ const DEFAULT_FROM   = toLocalDT(new Date(now.getTime() - 7 * 24 * 60 * 60 * 100
 const DEFAULT_TO     = toLocalDT(now);
 const DEFAULT_PRESET = "Last 7 Days";
 
-const avg = (arr: number[]) =>
-  arr.length ? arr.reduce((a, b) => a + b, 0) / arr.length : null;
-
-function aggregateByMachine(data: OEEMetric[]) {
-  const groups: Record<string, OEEMetric[]> = {};
-  for (const row of data) {
-    const mid = String(row.machine_id ?? "");
-    if (!mid) continue;
-    if (!groups[mid]) groups[mid] = [];
-    groups[mid].push(row);
-  }
-  const numAvg = (vals: (number | null | undefined)[]) => {
-    const clean = vals.filter((v): v is number => v != null);
-    return clean.length ? clean.reduce((a, b) => a + b, 0) / clean.length : undefined;
-  };
-  return Object.values(groups).map((rows) => ({
-    ...rows[0],
-    oee:          numAvg(rows.map((r) => r.oee)),
-    availability: numAvg(rows.map((r) => r.availability)),
-    performance:  numAvg(rows.map((r) => r.performance)),
-    quality:      numAvg(rows.map((r) => r.quality)),
-    total_parts:  rows.reduce((s, r) => s + (r.total_parts ?? 0), 0),
-    good_parts:   rows.reduce((s, r) => s + (r.good_parts  ?? 0), 0),
-  } as OEEMetric));
-}
-
 // ── KPI Card ──────────────────────────────────────────────────────────────────
 
 function KpiCard({
@@ -103,13 +77,6 @@ export default function AdminDashboard() {
     setActivePreset(label);
   }
 
-  const queryParams = {
-    from_time: new Date(fromDate).toISOString(),
-    to_time:   new Date(toDate).toISOString(),
-    machine_id: selectedMachine || undefined,
-    limit: 5000,
-  };
-
   // ── Queries ───────────────────────────────────────────────────────────────────
 
   const { data: machines = [] } = useQuery({
@@ -117,27 +84,22 @@ export default function AdminDashboard() {
     queryFn: () => machinesApi.list().then((r) => r.data),
   });
 
-  const allMachineParams = {
-    from_time: new Date(fromDate).toISOString(),
-    to_time:   new Date(toDate).toISOString(),
-    limit: 5000,
-  };
-
+  // Aggregated server-side over every window in the period: one row per
+  // machine (the table always shows all of them) plus the fleet total
   const {
-    data: oeeData = [],
+    data: summary,
     isFetching,
     dataUpdatedAt,
     refetch,
   } = useQuery({
-    queryKey: ["oee-metrics", "oee", fromDate, toDate, selectedMachine],
-    queryFn: () => oeeMetricsApi.oee(queryParams).then((r) => r.data),
-    refetchInterval: 60_000,
-  });
-
-  // Unfiltered OEE data so the Machine Summary table always shows all machines
-  const { data: allOeeData = [] } = useQuery({
-    queryKey: ["oee-metrics", "oee", fromDate, toDate, "all"],
-    queryFn: () => oeeMetricsApi.oee(allMachineParams).then((r) => r.data),
+    queryKey: ["oee-metrics", "summary", fromDate, toDate],
+    queryFn: () =>
+      oeeMetricsApi
+        .summary({
+          from_time: new Date(fromDate).toISOString(),
+          to_time:   new Date(toDate).toISOString(),
+        })
+        .then((r) => r.data),
     refetchInterval: 60_000,
   });
 
@@ -160,29 +122,27 @@ export default function AdminDashboard() {
   });
 
   // ── Derived data ──────────────────────────────────────────────────────────────
-  // Average all snapshots in the selected period per machine so KPIs reflect
-  // the full period, not just the latest snapshot.
-
-  const latestByMachine = useMemo(() => aggregateByMachine(oeeData), [oeeData]);
+  // KPIs come from the selected machine's row, or the fleet total, both
+  // weighted by planned time rather than averaged per snapshot.
 
-  // Always show all machines in the summary table regardless of filter
-  const allMachinesSummary = useMemo(() => aggregateByMachine(allOeeData), [allOeeData]);
+  const allMachinesSummary = summary?.machines ?? [];
 
   const kpi = useMemo(() => {
-    if (!latestByMachine.length) return null;
+    const row = selectedMachine
+      ? summary?.machines.find((r) => r.machine_id === selectedMachine)
+      : summary?.fleet;
+    if (!row || !row.window_count) return null;
+    const pct = (v: number | null) => (v != null ? v * 100 : null);
     return {
-      oee:          avg(latestByMachine.map((r) => (r.oee          ?? 0) * 100)),
-      availability: avg(latestByMachine.map((r) => (r.availability ?? 0) * 100)),
-      performance:  avg(latestByMachine.map((r) => (r.performance  ?? 0) * 100)),
-      quality:      avg(latestByMachine.map((r) => (r.quality       ?? 0) * 100)),
-      totalParts:   latestByMachine.reduce((s, r) => s + (r.total_parts ?? 0), 0),
-      goodParts:    latestByMachine.reduce((s, r) => s + (r.good_parts  ?? 0), 0),
-      rejects:      latestByMachine.reduce(
-        (s, r) => s + Math.max(0, (r.total_parts ?? 0) - (r.good_parts ?? 0)),
-        0
-      ),
+      oee:          pct(row.oee),
+      availability: pct(row.availability),
+      performance:  pct(row.performance),
+      quality:      pct(row.quality),
+      totalParts:   row.total_parts,
+      goodParts:    row.good_parts,
+      rejects:      Math.max(row.reject_parts, row.total_parts - row.good_parts, 0),
     };
-  }, [latestByMachine]);
+  }, [summary, selectedMachine]);
 
   const lastUpdated = dataUpdatedAt
     ? new Date(dataUpdatedAt).toLocaleTimeString()
@@ -312,7 +272,7 @@ export default function AdminDashboard() {
         <div className="card col-span-1">
           <div className="px-5 pt-5 pb-2">
             <h3 className="text-base font-semibold text-gray-900 dark:text-gray-100">OEE Breakdown</h3>
-            <p className="text-xs text-gray-400 mt-0.5">Plant average</p>
+            <p className="text-xs text-gray-400 mt-0.5">Weighted by planned time</p>
           </div>
           <div className="px-4 pb-5 flex items-center justify-center min-h-[260px]">
             {kpi ? (
@@ -367,7 +327,7 @@ export default function AdminDashboard() {
                     const machine = machines.find(
                       (m) => String(m.id) === mid
                     );
-                    const pct = (v?: number) =>
+                    const pct = (v: number | null) =>
                       v != null ? `${(v * 100).toFixed(1)}%` : "—";
                     const oeeVal = (row.oee ?? 0) * 100;
                     const oeeColor =
@@ -9,6 +9,8 @@ function StatusDot({ status }: { status: ServiceStatus["status"] }) {
   const cls =
     status === "ok"
       ? "bg-emerald-500"
+      : status === "degraded"
+      ? "bg-amber-500"
       : status === "error"
       ? "bg-red-500"
       : "bg-gray-400";
@@ -22,6 +24,7 @@ function StatusDot({ status }: { status: ServiceStatus["status"] }) {
 
 function statusLabel(s: ServiceStatus["status"]) {
   if (s === "ok") return "Healthy";
+  if (s === "degraded") return "Degraded";
   if (s === "error") return "Unreachable";
   return "No health check";
 }
@@ -118,6 +121,11 @@ export default function SystemAdmin() {
                     <StatusDot status={svc.status} />
                   </div>
                   <p className="text-xs text-gray-500">{svc.description}</p>
+                  {svc.details?.problems?.map((problem) => (
+                    <p key={problem} className="text-[11px] text-amber-600">
+                      {problem}
+                    </p>
+                  ))}
                   {svc.version && (
                     <span className="text-[11px] text-gray-400 font-mono">
                       v{svc.version}
@@ -132,6 +140,8 @@ export default function SystemAdmin() {
                         className={`text-xs font-medium ${
                           svc.status === "ok"
                             ? "text-emerald-600"
+                            : svc.status === "degraded"
+                            ? "text-amber-600"
                             : svc.status === "error"
                             ? "text-red-500"
                             : "text-gray-400"
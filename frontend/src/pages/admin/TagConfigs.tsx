@@ -14,6 +14,8 @@ function emptyForm(): Omit<DowntimeTagConfig, "id"> {
     digital_downtime_value: "",
     analog_operator: ">",
     analog_threshold: undefined,
+    analog_hysteresis: undefined,
+    debounce_seconds: undefined,
     downtime_category_id: undefined,
     description: "",
     is_enabled: true,
@@ -176,8 +178,34 @@ export default function AdminTagConfigs() {
                     }
                   />
                 </div>
+                <div>
+                  <label className="label">Hysteresis (optional)</label>
+                  <input
+                    className="input"
+                    type="number"
+                    min={0}
+                    placeholder="e.g. 5"
+                    value={form.analog_hysteresis ?? ""}
+                    onChange={(e) =>
+                      setForm({ ...form, analog_hysteresis: e.target.value ? Number(e.target.value) : undefined })
+                    }
+                  />
+                </div>
               </>
             )}
+            <div>
+              <label className="label">Debounce seconds (optional)</label>
+              <input
+                className="input"
+                type="number"
+                min={0}
+                placeholder="Ignore stops shorter than this"
+                value={form.debounce_seconds ?? ""}
+                onChange={(e) =>
+                  setForm({ ...form, debounce_seconds: e.target.value ? Number(e.target.value) : undefined })
+                }
+              />
+            </div>
             <div>
               <label className="label">Default Category (optional)</label>
               <select
@@ -285,8 +313,28 @@ export default function AdminTagConfigs() {
                             setEditForm({ ...editForm, analog_threshold: e.target.value ? Number(e.target.value) : undefined })
                           }
                         />
+                        <input
+                          className="input"
+                          type="number"
+                          min={0}
+                          placeholder="Hysteresis"
+                          value={editForm.analog_hysteresis ?? ""}
+                          onChange={(e) =>
+                            setEditForm({ ...editForm, analog_hysteresis: e.target.value ? Number(e.target.value) : undefined })
+                          }
+                        />
                       </>
                     )}
+                    <input
+                      className="input"
+                      type="number"
+                      min={0}
+                      placeholder="Debounce (s)"
+                      value={editForm.debounce_seconds ?? ""}
+                      onChange={(e) =>
+                        setEditForm({ ...editForm, debounce_seconds: e.target.value ? Number(e.target.value) : undefined })
+                      }
+                    />
                     <div className="flex items-center gap-2">
                       <input
                         type="checkbox"
@@ -320,6 +368,8 @@ export default function AdminTagConfigs() {
                     {cfg.tag_type === "digital"
                       ? `value == "${cfg.digital_downtime_value}"`
                       : `value ${cfg.analog_operator} ${cfg.analog_threshold}`}
+                    {cfg.tag_type === "analog" && cfg.analog_hysteresis != null && ` · Hysteresis ${cfg.analog_hysteresis}`}
+                    {cfg.debounce_seconds != null && ` · Debounce ${cfg.debounce_seconds}s`}
                     {cat && ` · Category: ${cat.name}`}
                     {cfg.description && ` · ${cfg.description}`}
                   </div>
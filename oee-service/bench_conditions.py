@@ -0,0 +1,84 @@
+"""Benchmark tag condition evaluation: compiled, vectorized masks vs the old scalar path.
+
+    python bench_conditions.py --configs 2000 --samples 300
+
+Builds a mix of digital (integer and string columns) and analog configs with
+random sample columns, evaluates them per value with the scalar function the
+tag monitor used to call, and as whole-column masks with
+``calculator.tag_edges.compile_condition``, checks both agree and prints the
+timings.  Needs only NumPy.
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from calculator.tag_edges import compile_condition
+
+
+def _scalar_condition(value, tag_type: str, digital_downtime_value: str | None,
+                      analog_operator: str | None, analog_threshold: float | None) -> bool:
+    """The tag monitor's previous per-value check, kept as the baseline."""
+    if tag_type == "digital":
+        return str(value) == digital_downtime_value
+    elif tag_type == "analog" and analog_operator and analog_threshold is not None:
+        try:
+            numeric = float(value)
+        except (TypeError, ValueError):
+            return False
+        ops = {
+            ">": numeric > analog_threshold,
+            ">=": numeric >= analog_threshold,
+            "<": numeric < analog_threshold,
+            "<=": numeric <= analog_threshold,
+            "==": numeric == analog_threshold,
+        }
+        return ops.get(analog_operator, False)
+    return False
+
+
+def _configs(count: int, samples: int, rng: random.Random) -> list[tuple[tuple, np.ndarray]]:
+    np_rng = np.random.default_rng(rng.randrange(1 << 32))
+    configs = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            params = ("digital", "0", None, None)
+            values = np_rng.integers(0, 2, samples)
+        elif kind == 1:
+            params = ("digital", "FAULT", None, None)
+            values = np_rng.choice(np.array(["RUN", "IDLE", "FAULT"], dtype=object), samples)
+        else:
+            params = ("analog", None, rng.choice([">", ">=", "<", "<="]), float(rng.randint(20, 80)))
+            values = np_rng.uniform(0, 100, samples)
+        configs.append((params, values))
+    return configs
+
+
+def main(args: argparse.Namespace) -> None:
+    configs = _configs(args.configs, args.samples, random.Random(args.seed))
+    total = args.configs * args.samples
+
+    started = time.perf_counter()
+    scalar = [np.array([_scalar_condition(v, *params) for v in values]) for params, values in configs]
+    scalar_seconds = time.perf_counter() - started
+
+    compile_condition.cache_clear()
+    started = time.perf_counter()
+    vectorized = [compile_condition(*params).mask(values) for params, values in configs]
+    vector_seconds = time.perf_counter() - started
+
+    mismatches = sum(not np.array_equal(a, b) for a, b in zip(scalar, vectorized))
+    print(f"{args.configs} configs x {args.samples} samples = {total} values")
+    print(f"  scalar:     {scalar_seconds * 1000:9.1f} ms  ({scalar_seconds / total * 1e9:6.0f} ns/value)")
+    print(f"  vectorized: {vector_seconds * 1000:9.1f} ms  ({vector_seconds / total * 1e9:6.0f} ns/value)")
+    print(f"  speedup:    {scalar_seconds / vector_seconds:9.1f}x, {mismatches} configs disagree")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare scalar and vectorized tag condition evaluation")
+    parser.add_argument("--configs", type=int, default=2000)
+    parser.add_argument("--samples", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=1)
+    main(parser.parse_args())
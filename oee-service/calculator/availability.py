@@ -18,6 +18,7 @@ class AvailabilityResult:
     state_idle_seconds: float = 0.0
     state_changeover_seconds: float = 0.0
     state_planned_downtime_seconds: float = 0.0
+    minor_stoppage_seconds: float = 0.0
     value: float = 0.0
 
     def __post_init__(self):
@@ -35,6 +36,7 @@ def calculate_availability(
     state_durations: dict[str, float],
     planned_time_seconds: float,
     excluded_state_seconds: float = 0.0,
+    minor_stoppage_seconds: float = 0.0,
 ) -> AvailabilityResult:
     """
     Calculate availability from machine state durations.
@@ -45,6 +47,8 @@ def calculate_availability(
         planned_time_seconds: Total planned production time for the window.
         excluded_state_seconds: Seconds in states that should NOT count against availability
                                 (e.g. planned maintenance categories configured as excluded).
+        minor_stoppage_seconds: Seconds of stops shorter than the minor stoppage threshold;
+                                counted as run time, so they show up as a performance loss.
     """
     running = state_durations.get("running", 0.0)
     stopped = state_durations.get("stopped", 0.0)
@@ -55,7 +59,7 @@ def calculate_availability(
 
     # Downtime = all non-running, non-excluded time
     unplanned_downtime = stopped + faulted + idle + changeover
-    total_downtime = unplanned_downtime - excluded_state_seconds
+    total_downtime = unplanned_downtime - excluded_state_seconds - minor_stoppage_seconds
 
     # Effective planned time excludes planned downtime and excluded categories
     effective_planned = max(planned_time_seconds - planned_dt - excluded_state_seconds, 0.0)
@@ -75,4 +79,5 @@ def calculate_availability(
         state_idle_seconds=idle,
         state_changeover_seconds=changeover,
         state_planned_downtime_seconds=planned_dt,
+        minor_stoppage_seconds=minor_stoppage_seconds,
     )
@@ -0,0 +1,180 @@
+"""Per-window part counts from cumulative PLC counters.
+
+``production_count`` carries ``total_count`` / ``reject_count`` counters that
+may be cumulative, reset by the PLC, or roll over at their integer width.
+Instead of ``MAX(count)`` per window, the engine starts from each machine's
+last seen counter values (persisted alongside its calculation checkpoint),
+reads only samples newer than that watermark, and sums the deltas between
+consecutive samples into the window of the later sample:
+
+- a normal increase counts as ``current - previous``;
+- a decrease near ``counter_max`` is a rollover and counts the wrapped amount;
+- any other decrease is a reset, and counts ``current`` (the counter restarted
+  from zero) — which also makes per-window counters that reset every window
+  come out right.
+
+A machine with no watermark uses its first sample as the baseline.  A null
+counter field in a sample keeps that counter's previous value; when there is
+no previous value, the counter's first non-null reading is the baseline.  A
+window without samples carries the values forward with the watermark moved
+to the window end, so an idle machine's next scan starts from there.
+"""
+from bisect import bisect_right
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta, timezone
+
+from influxdb_client_3 import InfluxDBClient3
+
+from calculator.window_inputs import query_table
+
+Window = tuple[datetime, datetime]
+
+# A decrease from above this fraction of counter_max is treated as a rollover
+ROLLOVER_FRACTION = 0.9
+
+
+@dataclass
+class CounterState:
+    time: datetime
+    total: int
+    reject: int
+
+
+@dataclass
+class WindowCounts:
+    total_parts: int = 0
+    reject_parts: int = 0
+    # Counter values at the end of the window, persisted when the window completes
+    state: CounterState | None = None
+
+
+def counter_delta(previous: int, current: int, counter_max: int = 0) -> int:
+    """Parts produced between two readings of one counter."""
+    if current >= previous:
+        return current - previous
+    if counter_max > 0 and previous >= counter_max * ROLLOVER_FRACTION:
+        return (counter_max - previous) + current + 1
+    return current
+
+
+def compute_window_counts(
+    influx: InfluxDBClient3,
+    windows_by_machine: dict[int, list[Window]],
+    states: dict[int, CounterState],
+    counter_max: int = 0,
+    lookback_seconds: int = 0,
+) -> dict[tuple[int, datetime], WindowCounts]:
+    """Count parts for every (machine_id, window_end) with one fleet query.
+
+    The query starts at the oldest watermark, but no more than
+    ``lookback_seconds`` (when set) before a machine's first window, so one
+    machine whose counter went quiet doesn't widen every cycle's scan.
+    Raises on query errors so the windows are retried rather than recorded
+    as zero production.
+    """
+    windows_by_machine = {mid: sorted(ws) for mid, ws in windows_by_machine.items() if ws}
+    if not windows_by_machine:
+        return {}
+
+    def scan_start(mid: int, first_start: datetime) -> datetime:
+        start = min(states[mid].time, first_start) if mid in states else first_start
+        return max(start, first_start - timedelta(seconds=lookback_seconds)) if lookback_seconds else start
+
+    since = min(scan_start(mid, ws[0][0]) for mid, ws in windows_by_machine.items())
+    until = max(ws[-1][1] for ws in windows_by_machine.values())
+    machine_list = ", ".join(f"'{mid}'" for mid in windows_by_machine)
+    sql = f"""
+        SELECT machine_id, time, total_count, reject_count
+        FROM production_count
+        WHERE time > '{since.isoformat()}' AND time < '{until.isoformat()}'
+          AND machine_id IN ({machine_list})
+        ORDER BY machine_id, time
+    """
+    table = query_table(influx, sql)
+    data = table.to_pydict() if table is not None else {}
+
+    samples: dict[int, list[tuple[datetime, int | None, int | None]]] = {}
+    for mid, ts, total, reject in zip(
+        data.get("machine_id", []), data.get("time", []),
+        data.get("total_count", []), data.get("reject_count", []),
+    ):
+        if mid is None or ts is None:
+            continue
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        samples.setdefault(int(mid), []).append(
+            (ts, int(total) if total is not None else None, int(reject) if reject is not None else None)
+        )
+
+    counts: dict[tuple[int, datetime], WindowCounts] = {}
+    for mid, windows in windows_by_machine.items():
+        entries = [WindowCounts() for _ in windows]
+        starts = [w[0] for w in windows]
+        previous = states.get(mid)
+        rows = samples.get(mid, [])
+        first_total = next((t for _, t, _ in rows if t is not None), 0)
+        first_reject = next((r for _, _, r in rows if r is not None), 0)
+        for ts, total, reject in rows:
+            if previous is not None and ts <= previous.time:
+                continue
+            if total is None:
+                total = previous.total if previous is not None else first_total
+            if reject is None:
+                reject = previous.reject if previous is not None else first_reject
+            i = bisect_right(starts, ts) - 1
+            if previous is not None and 0 <= i and ts < windows[i][1]:
+                entries[i].total_parts += counter_delta(previous.total, total, counter_max)
+                entries[i].reject_parts += counter_delta(previous.reject, reject, counter_max)
+            previous = CounterState(ts, total, reject)
+            if 0 <= i and ts < windows[i][1]:
+                entries[i].state = previous
+
+        # Windows with no samples carry the previous values forward, with the
+        # watermark advanced to the window end
+        carried = states.get(mid)
+        for window, entry in zip(windows, entries):
+            if entry.state is None and carried is not None:
+                entry.state = replace(carried, time=max(carried.time, window[1]))
+            carried = entry.state
+            counts[(mid, window[1])] = entry
+    return counts
+
+
+def query_counter_baselines(
+    influx: InfluxDBClient3,
+    machine_ids: list[int],
+    before: datetime,
+    lookback_seconds: int,
+) -> dict[int, CounterState]:
+    """Each machine's last complete counter sample before ``before``, within the lookback.
+
+    Used as the watermark when counting from an arbitrary point in history
+    (recalculation), so the first sample in range counts its delta too.
+    Raises on query errors.
+    """
+    if not machine_ids:
+        return {}
+    since = before - timedelta(seconds=lookback_seconds)
+    machine_list = ", ".join(f"'{mid}'" for mid in machine_ids)
+    sql = f"""
+        SELECT machine_id, time, total_count, reject_count FROM (
+            SELECT machine_id, time, total_count, reject_count,
+                   ROW_NUMBER() OVER (PARTITION BY machine_id ORDER BY time DESC) AS rn
+            FROM production_count
+            WHERE time >= '{since.isoformat()}' AND time < '{before.isoformat()}'
+              AND machine_id IN ({machine_list})
+              AND total_count IS NOT NULL AND reject_count IS NOT NULL
+        ) AS latest
+        WHERE rn = 1
+    """
+    table = query_table(influx, sql)
+    data = table.to_pydict() if table is not None else {}
+    baselines: dict[int, CounterState] = {}
+    for mid, ts, total, reject in zip(
+        data.get("machine_id", []), data.get("time", []),
+        data.get("total_count", []), data.get("reject_count", []),
+    ):
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        baselines[int(mid)] = CounterState(ts, int(total), int(reject))
+    return baselines
@@ -0,0 +1,95 @@
+"""Seconds of recorded downtime events inside each calculation window, by category.
+
+Downtime for every machine and every owed window is loaded with one query and
+resolved with the sweep-line helpers in ``calculator.intervals``.  An event's
+category comes from its reason code (code → secondary → primary category) or,
+for tag-monitor events with no code yet, from the tag config.
+
+Downtime is *excluded* from availability when its category is listed in the
+machine's ``excluded_category_ids`` or has ``counts_against_availability``
+set to false.  Overlapping excluded events are counted once.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from calculator.intervals import Interval, overlap_per_window, union
+
+Window = tuple[datetime, datetime]
+
+
+@dataclass
+class DowntimeOverlap:
+    excluded_seconds: float = 0.0
+    # category_id (None = uncategorised) → seconds in the window
+    seconds_by_category: dict[int | None, float] = field(default_factory=dict)
+
+
+async def compute_downtime_overlap(
+    db: AsyncSession,
+    windows_by_machine: dict[int, list[Window]],
+    excluded_by_machine: dict[int, set[int]],
+) -> dict[tuple[int, datetime], DowntimeOverlap]:
+    """Return the overlap for each (machine_id, window_end) in ``windows_by_machine``."""
+    windows_by_machine = {mid: sorted(ws) for mid, ws in windows_by_machine.items() if ws}
+    if not windows_by_machine:
+        return {}
+    range_start = min(ws[0][0] for ws in windows_by_machine.values())
+    range_end = max(ws[-1][1] for ws in windows_by_machine.values())
+
+    result = await db.execute(
+        text(
+            """
+            SELECT de.machine_id, de.start_time, de.end_time,
+                   cat.id AS category_id,
+                   COALESCE(cat.counts_against_availability, true) AS counts_against_availability
+            FROM downtime_events de
+            LEFT JOIN downtime_codes dcode ON dcode.id = de.reason_code_id
+            LEFT JOIN downtime_secondary_categories dsc ON dsc.id = dcode.secondary_category_id
+            LEFT JOIN downtime_tag_configs dtc ON dtc.id = de.source_tag_config_id
+            LEFT JOIN downtime_categories cat
+                   ON cat.id = COALESCE(dsc.primary_category_id, dtc.downtime_category_id)
+            WHERE de.machine_id = ANY(:mids)
+              AND de.start_time < :range_end
+              AND (de.end_time IS NULL OR de.end_time > :range_start)
+            """
+        ),
+        {"mids": list(windows_by_machine), "range_start": range_start, "range_end": range_end},
+    )
+
+    now = datetime.now(timezone.utc).timestamp()
+    by_category: dict[int, dict[int | None, list[Interval]]] = {}
+    not_counting: set[int] = set()
+    for row in result.mappings():
+        end = row["end_time"].timestamp() if row["end_time"] else now
+        by_category.setdefault(row["machine_id"], {}).setdefault(row["category_id"], []).append(
+            (row["start_time"].timestamp(), end)
+        )
+        if row["category_id"] is not None and not row["counts_against_availability"]:
+            not_counting.add(row["category_id"])
+
+    overlaps: dict[tuple[int, datetime], DowntimeOverlap] = {}
+    for mid, windows in windows_by_machine.items():
+        entries = [DowntimeOverlap() for _ in windows]
+        for window, entry in zip(windows, entries):
+            overlaps[(mid, window[1])] = entry
+        categories = by_category.get(mid)
+        if not categories:
+            continue
+
+        spans = [(ws.timestamp(), we.timestamp()) for ws, we in windows]
+        excluded_ids = excluded_by_machine.get(mid, set()) | not_counting
+        excluded: list[Interval] = []
+        for category_id, intervals in categories.items():
+            for entry, seconds in zip(entries, overlap_per_window(union(intervals), spans)):
+                if seconds > 0:
+                    entry.seconds_by_category[category_id] = seconds
+            if category_id in excluded_ids:
+                excluded.extend(intervals)
+        if excluded:
+            for entry, seconds in zip(entries, overlap_per_window(union(excluded), spans)):
+                entry.excluded_seconds = seconds
+
+    return overlaps
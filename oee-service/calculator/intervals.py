@@ -0,0 +1,68 @@
+"""Sweep-line interval algebra over half-open [start, end) intervals.
+
+Intervals are ``(start, end)`` tuples of comparable numbers (epoch seconds in
+practice).  Functions that take "disjoint" lists expect the output of
+``union`` — sorted by start, non-overlapping — and run in linear time.
+"""
+from typing import Iterable
+
+Interval = tuple[float, float]
+
+
+def union(intervals: Iterable[Interval]) -> list[Interval]:
+    """Merge overlapping or touching intervals into a sorted disjoint list."""
+    merged: list[Interval] = []
+    for start, end in sorted(i for i in intervals if i[1] > i[0]):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def intersection(a: list[Interval], b: list[Interval]) -> list[Interval]:
+    """Intersect two sorted disjoint lists."""
+    out: list[Interval] = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+        if start < end:
+            out.append((start, end))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return out
+
+
+def clip(intervals: list[Interval], start: float, end: float) -> list[Interval]:
+    """Restrict a sorted disjoint list to [start, end)."""
+    return intersection(intervals, [(start, end)]) if end > start else []
+
+
+def measure(intervals: list[Interval]) -> float:
+    """Total length of a disjoint list."""
+    return sum(end - start for start, end in intervals)
+
+
+def overlap_per_window(intervals: list[Interval], windows: list[Interval]) -> list[float]:
+    """Seconds of a disjoint list inside each window, in one sweep.
+
+    ``windows`` must be sorted by start and non-overlapping (calculation
+    windows always are); the result is aligned with ``windows``.
+    """
+    out: list[float] = []
+    i = 0
+    for w_start, w_end in windows:
+        # Intervals ending before this window can't touch any later one either
+        while i < len(intervals) and intervals[i][1] <= w_start:
+            i += 1
+        total = 0.0
+        k = i
+        while k < len(intervals) and intervals[k][0] < w_end:
+            total += min(intervals[k][1], w_end) - max(intervals[k][0], w_start)
+            k += 1
+        out.append(total)
+    return out
@@ -0,0 +1,81 @@
+"""Per-machine availability/performance/quality configuration rows."""
+from dataclasses import dataclass, field
+from typing import Any
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+Row = dict[str, Any]
+
+
+@dataclass
+class MachineConfigs:
+    availability: Row | None = None
+    # All performance/quality rows for the machine, ordered by id.  The row
+    # with product_id = NULL is the machine default.
+    performance_rows: list[Row] = field(default_factory=list)
+    quality_rows: list[Row] = field(default_factory=list)
+    # product_id → ideal cycle time from machine_product_configs
+    product_cycle_times: dict[int, float] = field(default_factory=dict)
+
+    @staticmethod
+    def _pick(rows: list[Row], product_id: int | None) -> Row | None:
+        for row in rows:
+            if row["product_id"] == product_id:
+                return row
+        return None
+
+    def performance(self, product_id: int | None = None) -> Row | None:
+        return self._pick(self.performance_rows, product_id)
+
+    def quality(self, product_id: int | None = None) -> Row | None:
+        return self._pick(self.quality_rows, product_id)
+
+    def ideal_cycle_time(self, product_id: int | None = None) -> float:
+        """Per-product performance config, then machine-product cycle time, then machine default."""
+        if product_id is not None:
+            row = self.performance(product_id)
+            if row is not None:
+                return float(row["ideal_cycle_time_seconds"])
+            if product_id in self.product_cycle_times:
+                return self.product_cycle_times[product_id]
+        row = self.performance()
+        return float(row["ideal_cycle_time_seconds"]) if row else 1.0
+
+
+async def fetch_machine_configs(db: AsyncSession, machine_ids: list[int] | None = None) -> dict[int, MachineConfigs]:
+    """Load config rows with one query per table, optionally limited to some machines."""
+    where = "WHERE machine_id = ANY(:mids) " if machine_ids is not None else ""
+    params = {"mids": list(machine_ids)} if machine_ids is not None else {}
+    configs: dict[int, MachineConfigs] = {
+        mid: MachineConfigs() for mid in machine_ids or []
+    }
+
+    avail = await db.execute(
+        text(f"SELECT * FROM machine_availability_configs {where}ORDER BY id"), params
+    )
+    for row in avail.mappings():
+        configs.setdefault(row["machine_id"], MachineConfigs()).availability = dict(row)
+
+    perf = await db.execute(
+        text(f"SELECT * FROM machine_performance_configs {where}ORDER BY id"), params
+    )
+    for row in perf.mappings():
+        configs.setdefault(row["machine_id"], MachineConfigs()).performance_rows.append(dict(row))
+
+    qual = await db.execute(
+        text(f"SELECT * FROM machine_quality_configs {where}ORDER BY id"), params
+    )
+    for row in qual.mappings():
+        configs.setdefault(row["machine_id"], MachineConfigs()).quality_rows.append(dict(row))
+
+    products = await db.execute(
+        text(f"SELECT machine_id, product_id, ideal_cycle_time_seconds FROM machine_product_configs {where}ORDER BY id"),
+        params,
+    )
+    for row in products.mappings():
+        configs.setdefault(row["machine_id"], MachineConfigs()).product_cycle_times[row["product_id"]] = float(
+            row["ideal_cycle_time_seconds"]
+        )
+
+    return configs
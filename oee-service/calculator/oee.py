@@ -1,14 +1,23 @@
 """Orchestrates the full OEE calculation and writes results to InfluxDB 3."""
+import asyncio
 import logging
+import time
 from datetime import datetime, timezone
 
 from influxdb_client_3 import InfluxDBClient3, Point
-from sqlalchemy import select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from calculator.availability import calculate_availability
+from calculator.downtime_overlap import DowntimeOverlap, compute_downtime_overlap
+from calculator.machine_config import MachineConfigs, fetch_machine_configs
 from calculator.performance import calculate_performance
+from calculator.product_runs import ideal_cycle_time_for_window
 from calculator.quality import calculate_quality
+from calculator.rollups import RollupStore, RollupTotals
+from calculator.stoppages import StopSummary, minor_stoppage_point, minor_stoppage_threshold
+from calculator.window_inputs import WindowInputs, query_machine_inputs
+from metrics import STAGE_SECONDS
+from write_buffer import WriteBuffer
 
 logger = logging.getLogger(__name__)
 
@@ -20,83 +29,44 @@ async def run_oee_for_machine(
     machine_id: int,
     window_start: datetime,
     window_end: datetime,
-) -> None:
-    """Calculate and write OEE components for one machine over a time window."""
+    inputs: WindowInputs | None = None,
+    write_buffer: WriteBuffer | None = None,
+    configs: MachineConfigs | None = None,
+    rollups: RollupStore | None = None,
+    product_segments: list[tuple[int, float]] | None = None,
+    downtime: DowntimeOverlap | None = None,
+    stops: StopSummary | None = None,
+    provisional: bool = False,
+) -> RollupTotals:
+    """Calculate and write OEE components for one machine over a time window.
+
+    Returns the window's contribution to its shift and day rollups.  ``stops``
+    are the window's stops from ``calculator.stoppages``; minor ones count as
+    run time.  A ``provisional`` run covers the still-open window up to ``window_end`` and
+    writes a single ``oee_provisional`` point instead of the window metrics.
+    """
     machine_id_str = str(machine_id)
     shift_id = f"{window_start.strftime('%Y%m%d%H%M')}"
-
-    # ── 1. Fetch availability config ──────────────────────────────────────────
-    avail_cfg_result = await db.execute(
-        text("SELECT * FROM machine_availability_configs WHERE machine_id = :mid"),
-        {"mid": machine_id},
-    )
-    avail_cfg = avail_cfg_result.mappings().first()
-
-    # ── 2. Fetch performance config ───────────────────────────────────────────
-    perf_cfg_result = await db.execute(
-        text(
-            "SELECT * FROM machine_performance_configs "
-            "WHERE machine_id = :mid AND product_id IS NULL "
-            "ORDER BY id LIMIT 1"
-        ),
-        {"mid": machine_id},
-    )
-    perf_cfg = perf_cfg_result.mappings().first()
-
-    # ── 3. Fetch quality config ───────────────────────────────────────────────
-    qual_cfg_result = await db.execute(
-        text(
-            "SELECT * FROM machine_quality_configs "
-            "WHERE machine_id = :mid AND product_id IS NULL "
-            "ORDER BY id LIMIT 1"
-        ),
-        {"mid": machine_id},
-    )
-    qual_cfg = qual_cfg_result.mappings().first()
-
-    # ── 4. Query InfluxDB for machine state during window ─────────────────────
-    state_durations: dict[str, float] = {}
-    total_parts = 0
-    reject_parts = 0
-
-    iso_start = window_start.isoformat()
-    iso_end = window_end.isoformat()
-
-    try:
-        # State data
-        state_sql = f"""
-            SELECT state, SUM(duration_seconds) AS total_duration
-            FROM machine_state
-            WHERE machine_id = '{machine_id_str}'
-              AND time >= '{iso_start}' AND time < '{iso_end}'
-            GROUP BY state
-        """
-        state_table = influx.query(state_sql)
-        if state_table is not None:
-            state_dict = state_table.to_pydict()
-            states = state_dict.get("state", [])
-            durations = state_dict.get("total_duration", [])
-            for s, d in zip(states, durations):
-                if s and d is not None:
-                    state_durations[str(s).lower()] = float(d)
-
-        # Part count data
-        parts_sql = f"""
-            SELECT MAX(total_count) AS max_count, MAX(reject_count) AS max_reject
-            FROM production_count
-            WHERE machine_id = '{machine_id_str}'
-              AND time >= '{iso_start}' AND time < '{iso_end}'
-        """
-        parts_table = influx.query(parts_sql)
-        if parts_table is not None:
-            parts_dict = parts_table.to_pydict()
-            max_counts = parts_dict.get("max_count", [0])
-            max_rejects = parts_dict.get("max_reject", [0])
-            total_parts = int(max_counts[0] or 0) if max_counts else 0
-            reject_parts = int(max_rejects[0] or 0) if max_rejects else 0
-
-    except Exception as e:
-        logger.warning(f"InfluxDB query failed for machine {machine_id}: {e}")
+    job = "provisional" if provisional else "oee_calc"
+
+    # ── 1-3. Availability / performance / quality config ─────────────────────
+    # Normally served from the scheduler's config cache; query directly otherwise.
+    if configs is None:
+        with STAGE_SECONDS.time(job=job, stage="config_fetch"):
+            configs = (await fetch_machine_configs(db, [machine_id]))[machine_id]
+    avail_cfg = configs.availability
+
+    # ── 4. State durations and part counts for the window ─────────────────────
+    # The scheduler normally pre-fetches these for the whole fleet in one pass;
+    # fall back to per-machine queries when called on its own.
+    if inputs is None:
+        with STAGE_SECONDS.time(job=job, stage="inputs_query"):
+            inputs = await asyncio.to_thread(
+                query_machine_inputs, influx, machine_id_str, window_start, window_end
+            )
+    state_durations = inputs.state_durations
+    total_parts = inputs.total_parts
+    reject_parts = inputs.reject_parts
 
     # ── 5. Derive planned time ─────────────────────────────────────────────────
     window_seconds = (window_end - window_start).total_seconds()
@@ -105,7 +75,22 @@ async def run_oee_for_machine(
         else window_seconds
     )
 
-    # ── 6. Calculate each component ───────────────────────────────────────────
+    # ── 6. Downtime in excluded categories ────────────────────────────────────
+    if downtime is None:
+        excluded_ids = {machine_id: set(avail_cfg["excluded_category_ids"] or [])} if avail_cfg else {}
+        with STAGE_SECONDS.time(job=job, stage="downtime_query"):
+            overlaps = await compute_downtime_overlap(db, {machine_id: [(window_start, window_end)]}, excluded_ids)
+        downtime = overlaps.get((machine_id, window_end), DowntimeOverlap())
+    calc_started = time.perf_counter()
+    # Only time the machine was actually down can be excused
+    unplanned_downtime = sum(
+        state_durations.get(state, 0.0) for state in ("stopped", "faulted", "idle", "changeover")
+    )
+    excluded_seconds = min(downtime.excluded_seconds, unplanned_downtime)
+    minor_threshold = minor_stoppage_threshold(configs)
+    minor_seconds = min(stops.minor_seconds, unplanned_downtime - excluded_seconds) if stops else 0.0
+
+    # ── 7. Calculate each component ───────────────────────────────────────────
     avail_result = calculate_availability(
         machine_id=machine_id_str,
         shift_id=shift_id,
@@ -113,9 +98,12 @@ async def run_oee_for_machine(
         window_end=window_end,
         state_durations=state_durations,
         planned_time_seconds=planned_time,
+        excluded_state_seconds=excluded_seconds,
+        minor_stoppage_seconds=minor_seconds,
     )
 
-    ideal_cycle_time = float(perf_cfg["ideal_cycle_time_seconds"]) if perf_cfg else 1.0
+    # Products that ran in the window decide the ideal cycle time
+    ideal_cycle_time = ideal_cycle_time_for_window(configs, product_segments or [])
     perf_result = calculate_performance(
         machine_id=machine_id_str,
         shift_id=shift_id,
@@ -137,8 +125,44 @@ async def run_oee_for_machine(
 
     oee_value = avail_result.value * perf_result.value * qual_result.value
     timestamp = window_end
+    contribution = RollupTotals(
+        planned_time_seconds=avail_result.planned_time_seconds,
+        actual_run_time_seconds=avail_result.actual_run_time_seconds,
+        downtime_seconds=avail_result.downtime_seconds,
+        ideal_production_seconds=ideal_cycle_time * total_parts,
+        total_parts=total_parts,
+        good_parts=qual_result.good_parts,
+        reject_parts=reject_parts,
+        window_count=1,
+    )
+    STAGE_SECONDS.observe(time.perf_counter() - calc_started, job=job, stage="calculate")
+
+    # ── 8. Write to InfluxDB ──────────────────────────────────────────────────
+    write_started = time.perf_counter()
+    if provisional:
+        # Superseded by the periodic pass once the window closes; no rollups
+        point = (
+            Point("oee_provisional")
+            .tag("machine_id", machine_id_str)
+            .tag("shift_id", shift_id)
+            .field("availability", round(avail_result.value, 4))
+            .field("performance", round(perf_result.value, 4))
+            .field("quality", round(qual_result.value, 4))
+            .field("oee", round(oee_value, 4))
+            .field("elapsed_seconds", int(window_seconds))
+            .field("downtime_seconds", int(avail_result.downtime_seconds))
+            .field("total_parts", total_parts)
+            .field("reject_parts", reject_parts)
+            .time(timestamp)
+        )
+        try:
+            await asyncio.to_thread(influx.write, record=[point], write_precision="ns")
+            logger.debug(f"Machine {machine_id_str}: provisional OEE={oee_value:.1%} after {window_seconds:.0f}s")
+        except Exception as e:
+            logger.warning(f"Failed to write provisional OEE for machine {machine_id}: {e}")
+        STAGE_SECONDS.observe(time.perf_counter() - write_started, job=job, stage="write")
+        return contribution
 
-    # ── 7. Write to InfluxDB ──────────────────────────────────────────────────
     try:
         # Combined OEE metric
         oee_point = (
@@ -170,6 +194,8 @@ async def run_oee_for_machine(
             .field("state_running_seconds", int(avail_result.state_running_seconds))
             .field("state_stopped_seconds", int(avail_result.state_stopped_seconds))
             .field("state_faulted_seconds", int(avail_result.state_faulted_seconds))
+            .field("excluded_downtime_seconds", int(excluded_seconds))
+            .field("minor_stoppage_seconds", int(minor_seconds))
             .time(timestamp)
         )
 
@@ -197,8 +223,21 @@ async def run_oee_for_machine(
             .time(timestamp)
         )
 
-        for point in [oee_point, avail_point, perf_point, qual_point]:
-            influx.write(record=point, write_precision="ns")
+        points = [oee_point, avail_point, perf_point, qual_point]
+        if stops is not None and minor_threshold > 0:
+            points.append(minor_stoppage_point(
+                machine_id, window_start, int(window_seconds), "state",
+                stops.minor_count, minor_seconds, minor_threshold, stops.stop_count,
+            ))
+
+        # Shift / day running totals
+        if rollups is not None:
+            points += rollups.record(machine_id, window_start, window_end, contribution)
+        if write_buffer is not None:
+            await write_buffer.add(points)
+        else:
+            # The InfluxDB client is blocking — keep it off the event loop
+            await asyncio.to_thread(influx.write, record=points, write_precision="ns")
 
         logger.info(
             f"Machine {machine_id_str}: OEE={oee_value:.1%} "
@@ -207,3 +246,6 @@ async def run_oee_for_machine(
 
     except Exception as e:
         logger.error(f"Failed to write OEE metrics for machine {machine_id}: {e}")
+    STAGE_SECONDS.observe(time.perf_counter() - write_started, job=job, stage="write")
+
+    return contribution
@@ -0,0 +1,185 @@
+"""Time-aware product-run index: which product ran on each machine, and when.
+
+Runs come from the ``product_runs`` table — entered by operators through the
+API, or detected here from a ``product_change`` measurement (tag
+``machine_id``, field ``sku``) written by the SCADA pipeline.  The index keeps
+each machine's runs sorted by start time so the runs overlapping a window are
+found with a binary search instead of a query per window.
+"""
+import asyncio
+import logging
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from influxdb_client_3 import InfluxDBClient3
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from calculator.machine_config import MachineConfigs
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProductRun:
+    product_id: int
+    start_time: datetime
+    end_time: datetime | None  # None = still running
+    source: str
+
+
+class ProductRunIndex:
+    def __init__(self):
+        self._runs: dict[int, list[ProductRun]] = {}
+        self._starts: dict[int, list[datetime]] = {}
+        # Per machine, the newest product_change sample already synced and committed
+        self.tag_watermarks: dict[int, datetime] = {}
+
+    async def refresh(self, db: AsyncSession, since: datetime) -> None:
+        """Load every run that was still active at or after ``since`` in one query."""
+        result = await db.execute(
+            text(
+                "SELECT machine_id, product_id, start_time, end_time, source FROM product_runs "
+                "WHERE end_time IS NULL OR end_time > :since "
+                "ORDER BY machine_id, start_time"
+            ),
+            {"since": since},
+        )
+        runs: dict[int, list[ProductRun]] = {}
+        for row in result.mappings():
+            runs.setdefault(row["machine_id"], []).append(
+                ProductRun(row["product_id"], row["start_time"], row["end_time"], row["source"])
+            )
+        self._runs = runs
+        self._starts = {mid: [r.start_time for r in machine_runs] for mid, machine_runs in runs.items()}
+
+    def current(self, machine_id: int) -> ProductRun | None:
+        runs = self._runs.get(machine_id)
+        if runs and runs[-1].end_time is None:
+            return runs[-1]
+        return None
+
+    def segments(self, machine_id: int, window_start: datetime, window_end: datetime) -> list[tuple[int, float]]:
+        """Return (product_id, seconds) for each run overlapping the window, oldest first."""
+        runs = self._runs.get(machine_id)
+        if not runs:
+            return []
+        # Runs don't overlap, so walk back from the last run starting before window_end
+        i = bisect_left(self._starts[machine_id], window_end) - 1
+        out: list[tuple[int, float]] = []
+        while i >= 0:
+            run = runs[i]
+            end = min(run.end_time or window_end, window_end)
+            if end <= window_start:
+                break
+            overlap = (end - max(run.start_time, window_start)).total_seconds()
+            if overlap > 0:
+                out.append((run.product_id, overlap))
+            i -= 1
+        out.reverse()
+        return out
+
+
+def ideal_cycle_time_for_window(configs: MachineConfigs, segments: list[tuple[int, float]]) -> float:
+    """Time-weighted ideal cycle time of the products that ran in the window.
+
+    Windows with no recorded product fall back to the machine default.  A
+    window that spans a changeover weights each product's ideal cycle time by
+    how long it ran; part counts are per window, not per product.
+    """
+    covered = sum(seconds for _, seconds in segments)
+    if covered <= 0:
+        return configs.ideal_cycle_time()
+    return sum(configs.ideal_cycle_time(product_id) * seconds for product_id, seconds in segments) / covered
+
+
+async def sync_product_runs_from_tags(
+    db: AsyncSession,
+    influx: InfluxDBClient3,
+    index: ProductRunIndex,
+    machine_ids: list[int],
+    since: datetime,
+) -> tuple[int, dict[int, datetime]]:
+    """Record product changes from the ``product_change`` measurement as runs.
+
+    One query for ``machine_ids`` reads samples newer than the oldest of
+    their watermarks (never before ``since``); samples at or before a
+    machine's watermark or latest tag-sourced run are skipped.  Returns the
+    number of runs opened and each machine's newest sample, which the caller
+    stores in ``index.tag_watermarks`` once the runs are committed.
+    """
+    if not machine_ids:
+        return 0, {}
+    result = await db.execute(
+        text(
+            "SELECT machine_id, MAX(start_time) AS last_start FROM product_runs "
+            "WHERE source = 'tag' GROUP BY machine_id"
+        )
+    )
+    last_starts = {row[0]: row[1] for row in result.fetchall()}
+    synced = {mid: max(index.tag_watermarks.get(mid, since), since) for mid in machine_ids}
+    oldest = min(synced.values())
+
+    machine_list = ", ".join(f"'{mid}'" for mid in machine_ids)
+    sql = (
+        "SELECT machine_id, sku, time FROM product_change "
+        f"WHERE time > '{oldest.isoformat()}' AND machine_id IN ({machine_list}) "
+        "ORDER BY machine_id, time"
+    )
+    try:
+        table = await asyncio.to_thread(influx.query, sql)
+    except Exception as e:
+        logger.debug(f"Product runs: no product_change data: {e}")
+        return 0, {}
+    if table is None or table.num_rows == 0:
+        return 0, {}
+
+    skus = await db.execute(text("SELECT sku, id FROM products"))
+    product_by_sku = {row[0]: row[1] for row in skus.fetchall()}
+    owned = set(machine_ids)
+    current = {mid: index.current(mid) for mid in owned}
+    current_product = {mid: run.product_id if run else None for mid, run in current.items()}
+    current_start = {mid: run.start_time for mid, run in current.items() if run}
+
+    opened = 0
+    newest: dict[int, datetime] = {}
+    data = table.to_pydict()
+    for mid_raw, sku, ts in zip(data["machine_id"], data["sku"], data["time"]):
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        try:
+            mid = int(mid_raw)
+        except (TypeError, ValueError):
+            continue
+        if mid not in owned or ts <= synced[mid]:
+            continue
+        newest[mid] = max(newest.get(mid, ts), ts)
+        if mid in last_starts and ts <= last_starts[mid]:
+            continue
+        if mid in current_start and ts <= current_start[mid]:
+            continue
+        product_id = product_by_sku.get(str(sku))
+        if product_id is None or product_id == current_product.get(mid):
+            continue
+        await db.execute(
+            text(
+                "UPDATE product_runs SET end_time = :ts "
+                "WHERE machine_id = :mid AND end_time IS NULL AND start_time < :ts"
+            ),
+            {"mid": mid, "ts": ts},
+        )
+        await db.execute(
+            text(
+                "INSERT INTO product_runs (machine_id, product_id, start_time, source, created_at) "
+                "VALUES (:mid, :pid, :ts, 'tag', now())"
+            ),
+            {"mid": mid, "pid": product_id, "ts": ts},
+        )
+        current_product[mid] = product_id
+        current_start[mid] = ts
+        opened += 1
+
+    if opened:
+        logger.info(f"Product runs: recorded {opened} product changes from tags")
+    return opened, newest
@@ -0,0 +1,338 @@
+"""Incremental per-shift and per-day OEE rollups.
+
+As each window completes, its sums (planned time, run time, downtime, parts,
+ideal production time) are added to running totals for the machine's current
+shift and calendar day, and the updated totals are written to the
+``oee_shift_rollup`` / ``oee_daily_rollup`` measurements at the period start
+timestamp — so every update overwrites the same point.
+
+Ratios are derived from the sums (not averaged), so windows with different
+planned times are weighted correctly:
+
+    Availability = Σ run time / Σ planned time
+    Performance  = Σ (ideal cycle time × parts) / Σ run time
+    Quality      = Σ good parts / Σ total parts
+
+Each window's contribution is remembered until its period is pruned, so
+recalculating a window replaces its contribution rather than double counting.
+Periods are loaded from the windows stored in ``oee_metrics`` whenever the
+replica takes on a machine (at startup or on acquiring its shard), or after a
+recalculation rewrote its windows (notified on ``ROLLUP_CHANNEL``), never
+from the rollup points themselves.
+"""
+import logging
+from dataclasses import dataclass, fields
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from influxdb_client_3 import InfluxDBClient3, Point
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from calculator.window_inputs import query_table
+
+logger = logging.getLogger(__name__)
+
+SHIFT_MEASUREMENT = "oee_shift_rollup"
+DAILY_MEASUREMENT = "oee_daily_rollup"
+# Payload is a machine id whose stored windows were rewritten
+ROLLUP_CHANNEL = "oee_rollups_stale"
+
+
+@dataclass
+class RollupTotals:
+    planned_time_seconds: float = 0.0
+    actual_run_time_seconds: float = 0.0
+    downtime_seconds: float = 0.0
+    ideal_production_seconds: float = 0.0
+    total_parts: int = 0
+    good_parts: int = 0
+    reject_parts: int = 0
+    window_count: int = 0
+
+    def __add__(self, other: "RollupTotals") -> "RollupTotals":
+        return RollupTotals(*(getattr(self, f.name) + getattr(other, f.name) for f in fields(self)))
+
+    def __sub__(self, other: "RollupTotals") -> "RollupTotals":
+        return RollupTotals(*(getattr(self, f.name) - getattr(other, f.name) for f in fields(self)))
+
+    @property
+    def availability(self) -> float:
+        if self.planned_time_seconds > 0:
+            return min(self.actual_run_time_seconds / self.planned_time_seconds, 1.0)
+        return 0.0
+
+    @property
+    def performance(self) -> float:
+        if self.actual_run_time_seconds > 0:
+            return min(self.ideal_production_seconds / self.actual_run_time_seconds, 1.0)
+        return 0.0
+
+    @property
+    def quality(self) -> float:
+        if self.total_parts > 0:
+            return min(self.good_parts / self.total_parts, 1.0)
+        return 0.0
+
+    @property
+    def oee(self) -> float:
+        return self.availability * self.performance * self.quality
+
+
+@dataclass
+class _Schedule:
+    schedule_id: int
+    start_time: time
+    end_time: time
+    days_of_week: list[int]
+
+
+@dataclass
+class _Period:
+    totals: RollupTotals
+    # window_end → contribution, so a recalculated window replaces itself
+    windows: dict[datetime, RollupTotals]
+
+
+class RollupStore:
+    def __init__(self):
+        self._tz: dict[int, ZoneInfo] = {}
+        self._schedules: dict[int, list[_Schedule]] = {}
+        # (measurement, machine_id, period_start) → running totals
+        self._periods: dict[tuple[str, int, datetime], _Period] = {}
+        # Machines whose periods have been loaded from stored windows
+        self._machines: set[int] = set()
+
+    # ── Shift calendar ────────────────────────────────────────────────────────
+    async def refresh_calendar(self, db: AsyncSession) -> None:
+        """Load every machine's site timezone and active shift schedules in one query."""
+        result = await db.execute(
+            text(
+                """
+                SELECT m.id AS machine_id, s.timezone, ss.id AS schedule_id,
+                       ss.start_time, ss.end_time, ss.days_of_week
+                FROM machines m
+                JOIN lines l ON l.id = m.line_id
+                JOIN areas a ON a.id = l.area_id
+                JOIN sites s ON s.id = a.site_id
+                LEFT JOIN shift_schedules ss ON ss.site_id = s.id AND ss.is_active = true
+                ORDER BY m.id, ss.start_time
+                """
+            )
+        )
+        tz: dict[int, ZoneInfo] = {}
+        schedules: dict[int, list[_Schedule]] = {}
+        for row in result.mappings():
+            mid = row["machine_id"]
+            if mid not in tz:
+                try:
+                    tz[mid] = ZoneInfo(row["timezone"] or "UTC")
+                except ZoneInfoNotFoundError:
+                    tz[mid] = ZoneInfo("UTC")
+                schedules[mid] = []
+            if row["schedule_id"] is not None:
+                schedules[mid].append(
+                    _Schedule(row["schedule_id"], row["start_time"], row["end_time"], row["days_of_week"] or [])
+                )
+        self._tz, self._schedules = tz, schedules
+
+    def _zone(self, machine_id: int) -> ZoneInfo:
+        return self._tz.get(machine_id, ZoneInfo("UTC"))
+
+    def day_start(self, machine_id: int, ts: datetime) -> datetime:
+        local = ts.astimezone(self._zone(machine_id))
+        return datetime.combine(local.date(), time(0), self._zone(machine_id)).astimezone(timezone.utc)
+
+    def shift_for(self, machine_id: int, ts: datetime) -> tuple[int, datetime] | None:
+        """Return (schedule_id, shift start in UTC) for the shift containing ``ts``."""
+        zone = self._zone(machine_id)
+        local = ts.astimezone(zone)
+        for sched in self._schedules.get(machine_id, []):
+            # A shift that crosses midnight may have started the previous day
+            for day in (local.date(), local.date() - timedelta(days=1)):
+                if day.weekday() not in sched.days_of_week:
+                    continue
+                start = datetime.combine(day, sched.start_time, zone)
+                end_day = day + timedelta(days=1) if sched.end_time <= sched.start_time else day
+                end = datetime.combine(end_day, sched.end_time, zone)
+                if start <= local < end:
+                    return sched.schedule_id, start.astimezone(timezone.utc)
+        return None
+
+    # ── Running totals ────────────────────────────────────────────────────────
+    def sync_machines(
+        self, influx: InfluxDBClient3, machine_ids: list[int], since: datetime, interval_seconds: int
+    ) -> None:
+        """Load periods for machines this replica just took on; forget machines it no longer owns.
+
+        A newly owned machine's periods are rebuilt window by window from
+        ``oee_metrics``, so windows recalculated later (after a crash, or
+        another replica's partial run) replace their stored contribution
+        instead of being added on top.  Call after ``refresh_calendar``;
+        query errors are raised and the machines are retried next time.
+        """
+        owned = set(machine_ids)
+        released = self._machines - owned
+        added = owned - self._machines
+        if released:
+            self._periods = {key: p for key, p in self._periods.items() if key[1] not in released}
+        if added:
+            stored = query_stored_windows(
+                influx, sorted(added), since, datetime.now(timezone.utc), interval_seconds
+            )
+            self._periods = {key: p for key, p in self._periods.items() if key[1] not in added}
+            for machine_id, window_start, window_end, contribution in stored:
+                for key, _ in self._periods_for(machine_id, window_start):
+                    self._apply(key, window_end, contribution)
+            logger.info(f"Rollups: loaded {len(stored)} stored windows for {len(added)} machines")
+        self._machines = owned
+
+    def invalidate(self, machine_id: int | None = None) -> None:
+        """Reload one machine (or, with no id, every machine) on the next ``sync_machines``.
+
+        The current totals are kept, and still updated, until the reload.
+        """
+        if machine_id is None:
+            self._machines = set()
+        else:
+            self._machines.discard(machine_id)
+
+    def _apply(self, key: tuple[str, int, datetime], window_end: datetime, contribution: RollupTotals) -> RollupTotals:
+        period = self._periods.setdefault(key, _Period(totals=RollupTotals(), windows={}))
+        previous = period.windows.get(window_end)
+        if previous is not None:
+            period.totals = period.totals - previous
+        period.windows[window_end] = contribution
+        period.totals = period.totals + contribution
+        return period.totals
+
+    def _periods_for(self, machine_id: int, window_start: datetime) -> list[tuple[tuple[str, int, datetime], Point]]:
+        """Day and (if scheduled) shift period keys for a window, with their tagged points."""
+        machine_id_str = str(machine_id)
+        day = self.day_start(machine_id, window_start)
+        periods = [((DAILY_MEASUREMENT, machine_id, day), Point(DAILY_MEASUREMENT).tag("machine_id", machine_id_str))]
+
+        shift = self.shift_for(machine_id, window_start)
+        if shift is not None:
+            schedule_id, shift_start = shift
+            local_start = shift_start.astimezone(self._zone(machine_id))
+            periods.append((
+                (SHIFT_MEASUREMENT, machine_id, shift_start),
+                Point(SHIFT_MEASUREMENT)
+                .tag("machine_id", machine_id_str)
+                .tag("schedule_id", str(schedule_id))
+                .tag("shift_id", local_start.strftime("%Y%m%d%H%M")),
+            ))
+        return periods
+
+    def record(
+        self,
+        machine_id: int,
+        window_start: datetime,
+        window_end: datetime,
+        contribution: RollupTotals,
+    ) -> list[Point]:
+        """Add one window to its shift and day totals and return the updated rollup points."""
+        return [
+            _to_point(point, self._apply(key, window_end, contribution), key[2])
+            for key, point in self._periods_for(machine_id, window_start)
+        ]
+
+    def rebuild(
+        self,
+        windows: list[tuple[int, datetime, datetime, RollupTotals]],
+        touched: set[tuple[int, datetime]],
+    ) -> list[Point]:
+        """Recompute every period containing a ``touched`` (machine_id, window_end) from scratch.
+
+        ``windows`` is (machine_id, window_start, window_end, contribution) and
+        must include every window of those periods, not just the touched ones.
+        """
+        targets: dict[tuple[str, int, datetime], Point] = {}
+        for machine_id, window_start, window_end, _ in windows:
+            if (machine_id, window_end) in touched:
+                targets.update(self._periods_for(machine_id, window_start))
+        for key in targets:
+            self._periods.pop(key, None)
+        for machine_id, window_start, window_end, contribution in windows:
+            for key, _ in self._periods_for(machine_id, window_start):
+                if key in targets:
+                    self._apply(key, window_end, contribution)
+        return [_to_point(point, self._periods[key].totals, key[2]) for key, point in targets.items()]
+
+    def prune(self, before: datetime) -> None:
+        """Forget periods that started before ``before``; they will not be updated again."""
+        self._periods = {key: p for key, p in self._periods.items() if key[2] >= before}
+
+
+async def notify_rollups_stale(db: AsyncSession, machine_ids: list[int]) -> None:
+    """Tell whichever replicas own these machines to reload their periods; delivered on commit."""
+    for machine_id in machine_ids:
+        await db.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": ROLLUP_CHANNEL, "payload": str(machine_id)},
+        )
+
+
+def query_stored_windows(
+    influx: InfluxDBClient3,
+    machine_ids: list[int],
+    range_start: datetime,
+    range_end: datetime,
+    interval_seconds: int,
+) -> list[tuple[int, datetime, datetime, RollupTotals]]:
+    """(machine_id, window_start, window_end, contribution) for windows already in ``oee_metrics``."""
+    machine_list = ", ".join(f"'{mid}'" for mid in machine_ids)
+    sql = f"""
+        SELECT o.machine_id, o.time, o.planned_time_seconds, o.actual_run_time_seconds,
+               o.downtime_seconds, o.total_parts, o.good_parts, o.reject_parts, p.ideal_cycle_time
+        FROM oee_metrics o
+        LEFT JOIN performance_metrics p ON p.machine_id = o.machine_id AND p.time = o.time
+        WHERE o.time > '{range_start.isoformat()}' AND o.time <= '{range_end.isoformat()}'
+          AND o.machine_id IN ({machine_list})
+    """
+    table = query_table(influx, sql)
+    if table is None:
+        return []
+    step = timedelta(seconds=interval_seconds)
+    windows = []
+    for row in table.to_pylist():
+        window_end = row["time"]
+        if window_end.tzinfo is None:
+            window_end = window_end.replace(tzinfo=timezone.utc)
+        total_parts = int(row["total_parts"] or 0)
+        windows.append((
+            int(row["machine_id"]),
+            window_end - step,
+            window_end,
+            RollupTotals(
+                planned_time_seconds=float(row["planned_time_seconds"] or 0),
+                actual_run_time_seconds=float(row["actual_run_time_seconds"] or 0),
+                downtime_seconds=float(row["downtime_seconds"] or 0),
+                ideal_production_seconds=float(row["ideal_cycle_time"] or 0) * total_parts,
+                total_parts=total_parts,
+                good_parts=int(row["good_parts"] or 0),
+                reject_parts=int(row["reject_parts"] or 0),
+                window_count=1,
+            ),
+        ))
+    return windows
+
+
+def _to_point(point: Point, totals: RollupTotals, period_start: datetime) -> Point:
+    return (
+        point
+        .field("planned_time_seconds", float(totals.planned_time_seconds))
+        .field("actual_run_time_seconds", float(totals.actual_run_time_seconds))
+        .field("downtime_seconds", float(totals.downtime_seconds))
+        .field("ideal_production_seconds", float(totals.ideal_production_seconds))
+        .field("total_parts", int(totals.total_parts))
+        .field("good_parts", int(totals.good_parts))
+        .field("reject_parts", int(totals.reject_parts))
+        .field("window_count", int(totals.window_count))
+        .field("availability", round(totals.availability, 4))
+        .field("performance", round(totals.performance, 4))
+        .field("quality", round(totals.quality, 4))
+        .field("oee", round(totals.oee, 4))
+        .time(period_start)
+    )
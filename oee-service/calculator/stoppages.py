@@ -0,0 +1,162 @@
+"""Minor stoppages: stops shorter than the machine's ``minor_stoppage_threshold_seconds``.
+
+A machine that pauses for a few seconds hasn't really been down — it runs
+slower than it should — so short stops are a performance loss, not
+availability downtime, and a packaging line can have thousands a shift.
+They are classified in two places:
+
+- the OEE calculation splits each window's ``machine_state`` timeline into
+  stops (runs of consecutive stopped/faulted/idle rows).  Stops shorter than
+  the threshold count as run time for availability, which moves their loss
+  into performance, and the window's counts are written as a
+  ``minor_stoppages`` point with ``source=state``;
+- the tag monitor doesn't keep tag-detected stops shorter than the threshold
+  as ``downtime_events`` rows.  They are added up per machine and window in
+  the ``minor_stoppages`` table, and the window's ``minor_stoppages`` point
+  (``source=tag``) is rewritten with the running totals.
+
+The threshold comes from the machine's default performance config; 0 (or no
+config) turns classification off.  A stop is classified on its whole length,
+even when it spans a window boundary: the last seconds of a long fault that
+fall into the next window are still downtime there.  Such a stop counts in
+the ``stop_count`` of every window it touches.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from influxdb_client_3 import InfluxDBClient3, Point
+
+from calculator.machine_config import MachineConfigs
+from calculator.window_inputs import query_table
+
+STOP_STATES = ("stopped", "faulted", "idle")
+
+
+@dataclass
+class StopSummary:
+    stop_count: int = 0
+    minor_count: int = 0
+    minor_seconds: float = 0.0
+
+
+def minor_stoppage_threshold(configs: MachineConfigs) -> float:
+    row = configs.performance()
+    return float(row.get("minor_stoppage_threshold_seconds") or 0) if row else 0.0
+
+
+def classify_stop_runs(
+    mids: np.ndarray,
+    bins: np.ndarray,
+    states: np.ndarray,
+    durations: np.ndarray,
+    thresholds: dict[str, float],
+) -> dict[tuple[str, int], StopSummary]:
+    """Stops per (machine_id, bin) from state rows sorted by machine then time.
+
+    A stop is a run of consecutive stop-state rows of one machine, across bin
+    boundaries; its length is the sum of the rows' ``duration_seconds``.  A
+    stop is minor when its whole length is under the machine's threshold,
+    and each bin it touches gets the seconds of its rows that fall in it.
+    """
+    if len(mids) == 0:
+        return {}
+    is_stop = np.isin(np.char.lower(states.astype(str)), STOP_STATES)
+    new_machine = np.ones(len(mids), dtype=bool)
+    new_machine[1:] = mids[1:] != mids[:-1]
+    previous_stop = np.concatenate(([False], is_stop[:-1]))
+    run_start = is_stop & (new_machine | ~previous_stop)
+    if not run_start.any():
+        return {}
+    run_ids = np.cumsum(run_start) - 1
+    run_seconds = np.bincount(run_ids[is_stop], weights=durations[is_stop])
+
+    # One segment per (run, bin) the run touches
+    new_segment = run_start.copy()
+    new_segment[1:] |= is_stop[1:] & (bins[1:] != bins[:-1])
+    segment_starts = np.flatnonzero(new_segment)
+    segment_ids = np.cumsum(new_segment) - 1
+    segment_seconds = np.bincount(segment_ids[is_stop], weights=durations[is_stop])
+
+    summaries: dict[tuple[str, int], StopSummary] = {}
+    for start, seconds in zip(segment_starts, segment_seconds):
+        mid = str(mids[start])
+        summary = summaries.setdefault((mid, int(bins[start])), StopSummary())
+        summary.stop_count += 1
+        if run_seconds[run_ids[start]] < thresholds.get(mid, 0.0):
+            summary.minor_count += 1
+            summary.minor_seconds += float(seconds)
+    return summaries
+
+
+def query_fleet_stops(
+    influx: InfluxDBClient3,
+    range_start: datetime,
+    range_end: datetime,
+    interval_seconds: int,
+    thresholds: dict[int, float],
+) -> dict[tuple[str, datetime], StopSummary]:
+    """Stops per (machine_id string, window_end) for machines with a threshold, in one query.
+
+    Rows up to the largest threshold either side of the range are read too,
+    so a stop crossing the range's edges is classified on its full length —
+    a stop that runs past the margin is already at least the threshold long.
+    Windows are aligned to the Unix epoch like the scheduler's; errors are raised.
+    """
+    thresholds = {str(mid): seconds for mid, seconds in thresholds.items() if seconds > 0}
+    if not thresholds:
+        return {}
+    margin = timedelta(seconds=max(thresholds.values()))
+    machine_list = ", ".join(f"'{mid}'" for mid in sorted(thresholds))
+    sql = f"""
+        SELECT machine_id, state, duration_seconds, time
+        FROM machine_state
+        WHERE time >= '{(range_start - margin).isoformat()}' AND time < '{(range_end + margin).isoformat()}'
+          AND machine_id IN ({machine_list})
+        ORDER BY machine_id, time
+    """
+    table = query_table(influx, sql)
+    if table is None or len(table) == 0:
+        return {}
+    times = table.column("time").to_numpy(zero_copy_only=False).astype("datetime64[s]").astype(np.int64)
+    durations = table.column("duration_seconds").to_numpy(zero_copy_only=False).astype(float)
+    summaries = classify_stop_runs(
+        table.column("machine_id").to_numpy(zero_copy_only=False),
+        times // interval_seconds,
+        table.column("state").to_numpy(zero_copy_only=False),
+        np.nan_to_num(durations),
+        thresholds,
+    )
+    first_bin = int(range_start.timestamp()) // interval_seconds
+    last_bin = (int(range_end.timestamp()) - 1) // interval_seconds
+    return {
+        (mid, datetime.fromtimestamp((index + 1) * interval_seconds, tz=timezone.utc)): summary
+        for (mid, index), summary in summaries.items()
+        if first_bin <= index <= last_bin
+    }
+
+
+def minor_stoppage_point(
+    machine_id: int,
+    window_start: datetime,
+    interval_seconds: int,
+    source: str,
+    count: int,
+    seconds: float,
+    threshold_seconds: float,
+    stop_count: int | None = None,
+) -> Point:
+    """The per-window counter point; later writes for the same window replace it."""
+    point = (
+        Point("minor_stoppages")
+        .tag("machine_id", str(machine_id))
+        .tag("shift_id", window_start.strftime("%Y%m%d%H%M"))
+        .tag("source", source)
+        .field("count", count)
+        .field("seconds", round(seconds, 1))
+        .field("threshold_seconds", threshold_seconds)
+        .time(window_start + timedelta(seconds=interval_seconds))
+    )
+    if stop_count is not None:
+        point = point.field("stop_count", stop_count)
+    return point
@@ -0,0 +1,205 @@
+"""Downtime edges from every tag sample since the last tick.
+
+Looking only at the latest value misses a machine that stops and restarts
+between two ticks, and stamps events with the monitor's clock instead of the
+real transition time.  Instead, every sample after a config's watermark is
+turned into a down/up mask by the config's compiled ``TagCondition`` and
+run-length encoded with NumPy; each change of run value is an edge stamped
+with the first sample of the new run.
+
+Two optional per-config filters:
+
+- ``analog_hysteresis`` — an analog condition enters downtime at the
+  threshold but only leaves it once the value is ``hysteresis`` back on the
+  other side, so a value hovering around the threshold doesn't flap;
+- ``debounce_seconds`` — runs shorter than this are treated as glitches and
+  merged into the surrounding state.  The newest run can't be judged yet
+  when it is still shorter than the debounce, so it is left for the next
+  tick and the watermark stops before it.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+
+import numpy as np
+
+# Comparison for each analog operator; NumPy ufuncs work on arrays and scalars alike
+_ANALOG_OPS = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    "==": np.equal,
+}
+
+_TRUE_STRINGS = ("true", "1", "t", "on")
+_FALSE_STRINGS = ("false", "0", "f", "off")
+
+
+@dataclass
+class Edge:
+    time: datetime
+    is_down: bool
+
+
+def _as_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+@dataclass(frozen=True)
+class TagCondition:
+    """A downtime tag condition, compiled once per config.
+
+    Digital conditions keep the downtime value as a string plus its bool /
+    integer / float forms, so a numeric or boolean column is compared to a
+    number instead of formatting every value (a downtime value of ``"1"``
+    matches ``1``, ``1.0`` and ``true``).  Analog conditions keep the
+    comparison ufunc, the threshold and — with hysteresis — the threshold at
+    which downtime ends.
+    """
+
+    tag_type: str
+    text: str | None = None
+    as_bool: bool | None = None
+    as_int: int | None = None
+    as_float: float | None = None
+    op: np.ufunc | None = None
+    threshold: float | None = None
+    release: float | None = None
+
+    def mask(self, values: np.ndarray, was_down: bool = False) -> np.ndarray:
+        """Downtime condition for every sample, in time order."""
+        values = np.asarray(values)
+        if self.tag_type == "digital":
+            return self._digital_mask(values)
+        if self.op is None:
+            return np.zeros(len(values), dtype=bool)
+        if values.dtype.kind in "biuf":
+            numeric = values.astype(float, copy=False)
+        else:
+            numeric = np.fromiter((_as_float(v) for v in values), dtype=float, count=len(values))
+        with np.errstate(invalid="ignore"):
+            enter = self.op(numeric, self.threshold)
+            if self.release is None:
+                return enter
+            # Leave downtime only once the value is past the release threshold
+            leave = ~self.op(numeric, self.release) & ~np.isnan(numeric)
+
+        # Between the two thresholds the previous state holds: forward-fill the
+        # index of the last enter/leave sample
+        decided = enter | leave
+        last = np.where(decided, np.arange(len(numeric)), -1)
+        np.maximum.accumulate(last, out=last)
+        return np.where(last >= 0, enter[np.maximum(last, 0)], was_down)
+
+    def _digital_mask(self, values: np.ndarray) -> np.ndarray:
+        kind = values.dtype.kind
+        if kind == "b":
+            if self.as_bool is None:
+                return np.zeros(len(values), dtype=bool)
+            return values if self.as_bool else ~values
+        if kind in "iu":
+            if self.as_int is None:
+                return np.zeros(len(values), dtype=bool)
+            return values == self.as_int
+        if kind == "f":
+            if self.as_float is None:
+                return np.zeros(len(values), dtype=bool)
+            return values == self.as_float
+        # String columns (object arrays from Arrow) compare elementwise in C
+        return np.asarray(values == self.text, dtype=bool)
+
+    def holds(self, value, was_down: bool = False) -> bool:
+        """The condition for a single sample (used for pushed samples)."""
+        if self.tag_type == "digital":
+            if isinstance(value, str):
+                return value == self.text
+            if isinstance(value, (bool, np.bool_)):
+                return self.as_bool is not None and bool(value) == self.as_bool
+            if isinstance(value, (int, np.integer)):
+                return self.as_int is not None and int(value) == self.as_int
+            if isinstance(value, (float, np.floating)):
+                return self.as_float is not None and float(value) == self.as_float
+            return str(value) == self.text
+        if self.op is None:
+            return False
+        numeric = _as_float(value)
+        if self.op(numeric, self.threshold):
+            return True
+        # Inside the hysteresis band the previous state holds
+        return self.release is not None and was_down and bool(self.op(numeric, self.release))
+
+
+@lru_cache(maxsize=4096)
+def compile_condition(
+    tag_type: str,
+    digital_downtime_value: str | None,
+    analog_operator: str | None,
+    analog_threshold: float | None,
+    analog_hysteresis: float | None = None,
+) -> TagCondition:
+    if tag_type == "digital":
+        if digital_downtime_value is None:
+            return TagCondition("never")
+        text = str(digital_downtime_value)
+        normalized = text.strip().lower()
+        as_bool = True if normalized in _TRUE_STRINGS else False if normalized in _FALSE_STRINGS else None
+        as_float = _as_float(normalized)
+        as_float = None if np.isnan(as_float) else as_float
+        as_int = int(as_float) if as_float is not None and as_float.is_integer() else None
+        return TagCondition("digital", text=text, as_bool=as_bool, as_int=as_int, as_float=as_float)
+
+    op = _ANALOG_OPS.get(analog_operator or "")
+    if tag_type != "analog" or op is None or analog_threshold is None:
+        return TagCondition("never")
+    release = None
+    if analog_hysteresis and analog_operator != "==":
+        back_off = -analog_hysteresis if analog_operator in (">", ">=") else analog_hysteresis
+        release = float(analog_threshold) + back_off
+    return TagCondition("analog", op=op, threshold=float(analog_threshold), release=release)
+
+
+def detect_edges(
+    times: np.ndarray,
+    down: np.ndarray,
+    was_down: bool,
+    now: datetime,
+    debounce_seconds: float | None = None,
+) -> tuple[list[Edge], datetime | None]:
+    """Edges in ``down`` relative to ``was_down``, and the new watermark.
+
+    ``times`` are the samples' ``datetime64`` timestamps in ascending order.
+    The watermark is the time of the last sample that no longer needs to be
+    looked at (``None``: leave the watermark where it is).
+    """
+    if len(down) == 0:
+        return [], None
+    seconds = times.astype("datetime64[ns]").astype(np.int64) / 1e9
+
+    change = np.empty(len(down), dtype=bool)
+    change[0] = True
+    np.not_equal(down[1:], down[:-1], out=change[1:])
+    starts = np.flatnonzero(change)
+    run_values = down[starts]
+    run_starts = seconds[starts]
+
+    keep = np.ones(len(starts), dtype=bool)
+    watermark = seconds[-1]
+    if debounce_seconds:
+        run_ends = np.append(run_starts[1:], now.timestamp())
+        keep = run_ends - run_starts >= debounce_seconds
+        if not keep[-1]:
+            # Newest run is still too short to call: look at it again next tick
+            watermark = seconds[starts[-1] - 1] if starts[-1] > 0 else None
+
+    kept_values = run_values[keep]
+    kept_starts = run_starts[keep]
+    previous = np.concatenate(([was_down], kept_values[:-1]))
+    edges = [
+        Edge(datetime.fromtimestamp(kept_starts[i], tz=timezone.utc), bool(kept_values[i]))
+        for i in np.flatnonzero(kept_values != previous)
+    ]
+    return edges, (datetime.fromtimestamp(watermark, tz=timezone.utc) if watermark is not None else None)
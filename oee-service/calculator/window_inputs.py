@@ -0,0 +1,170 @@
+"""Raw per-window inputs (state durations, part counts) read from InfluxDB 3."""
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from influxdb_client_3 import InfluxDBClient3
+
+logger = logging.getLogger(__name__)
+
+# InfluxDB 3 creates databases and tables on first write; before that, queries
+# fail with one of these phrases, which just means "no data yet".
+_EMPTY_PHRASES = ("database not found", "table not found", "not found")
+
+
+def query_table(influx: InfluxDBClient3, sql: str):
+    """Run ``sql``, returning None instead of raising when the table does not exist yet."""
+    try:
+        return influx.query(sql)
+    except Exception as exc:
+        if any(phrase in str(exc).lower() for phrase in _EMPTY_PHRASES):
+            return None
+        raise
+
+
+@dataclass
+class WindowInputs:
+    state_durations: dict[str, float] = field(default_factory=dict)
+    total_parts: int = 0
+    reject_parts: int = 0
+
+
+def query_machine_inputs(
+    influx: InfluxDBClient3,
+    machine_id: str,
+    window_start: datetime,
+    window_end: datetime,
+) -> WindowInputs:
+    """Query state durations and part counts for a single machine."""
+    inputs = WindowInputs()
+    iso_start = window_start.isoformat()
+    iso_end = window_end.isoformat()
+
+    try:
+        # State data
+        state_sql = f"""
+            SELECT state, SUM(duration_seconds) AS total_duration
+            FROM machine_state
+            WHERE machine_id = '{machine_id}'
+              AND time >= '{iso_start}' AND time < '{iso_end}'
+            GROUP BY state
+        """
+        state_table = influx.query(state_sql)
+        if state_table is not None:
+            state_dict = state_table.to_pydict()
+            states = state_dict.get("state", [])
+            durations = state_dict.get("total_duration", [])
+            for s, d in zip(states, durations):
+                if s and d is not None:
+                    inputs.state_durations[str(s).lower()] = float(d)
+
+        # Part count data
+        parts_sql = f"""
+            SELECT MAX(total_count) AS max_count, MAX(reject_count) AS max_reject
+            FROM production_count
+            WHERE machine_id = '{machine_id}'
+              AND time >= '{iso_start}' AND time < '{iso_end}'
+        """
+        parts_table = influx.query(parts_sql)
+        if parts_table is not None:
+            parts_dict = parts_table.to_pydict()
+            max_counts = parts_dict.get("max_count", [0])
+            max_rejects = parts_dict.get("max_reject", [0])
+            inputs.total_parts = int(max_counts[0] or 0) if max_counts else 0
+            inputs.reject_parts = int(max_rejects[0] or 0) if max_rejects else 0
+
+    except Exception as e:
+        logger.warning(f"InfluxDB query failed for machine {machine_id}: {e}")
+
+    return inputs
+
+
+def query_fleet_inputs(
+    influx: InfluxDBClient3,
+    window_start: datetime,
+    window_end: datetime,
+    machine_ids: list[int] | None = None,
+) -> dict[str, WindowInputs]:
+    """Query state durations for every machine (or just ``machine_ids``) in one round trip.
+
+    Part counts are filled in by the caller from ``calculator.counters``,
+    which tracks counter deltas across windows.  Returns a dict keyed by
+    machine_id string.  Machines with no data in the window are absent;
+    callers should fall back to an empty ``WindowInputs``.
+    Query errors are raised so the window is retried rather than recorded as
+    zero production.
+    """
+    inputs: dict[str, WindowInputs] = {}
+    iso_start = window_start.isoformat()
+    iso_end = window_end.isoformat()
+    machine_clause = ""
+    if machine_ids is not None:
+        if not machine_ids:
+            return inputs
+        machine_clause = "AND machine_id IN (" + ", ".join(f"'{mid}'" for mid in machine_ids) + ")"
+
+    state_sql = f"""
+        SELECT machine_id, state, SUM(duration_seconds) AS total_duration
+        FROM machine_state
+        WHERE time >= '{iso_start}' AND time < '{iso_end}'
+          {machine_clause}
+        GROUP BY machine_id, state
+    """
+    state_table = query_table(influx, state_sql)
+    if state_table is not None:
+        state_dict = state_table.to_pydict()
+        for mid, s, d in zip(
+            state_dict.get("machine_id", []),
+            state_dict.get("state", []),
+            state_dict.get("total_duration", []),
+        ):
+            if mid is None or not s or d is None:
+                continue
+            entry = inputs.setdefault(str(mid), WindowInputs())
+            entry.state_durations[str(s).lower()] = float(d)
+
+    return inputs
+
+
+def query_fleet_state_bins(
+    influx: InfluxDBClient3,
+    range_start: datetime,
+    range_end: datetime,
+    interval_seconds: int,
+    machine_ids: list[int],
+) -> dict[tuple[str, datetime], WindowInputs]:
+    """State durations for every interval-aligned window in a range, in one query.
+
+    Bins are aligned to the Unix epoch like the scheduler's windows and keyed
+    by (machine_id string, window_end).  Used by recalculation, which covers
+    many windows at once; errors are raised.
+    """
+    inputs: dict[tuple[str, datetime], WindowInputs] = {}
+    machine_list = ", ".join(f"'{mid}'" for mid in machine_ids)
+    sql = f"""
+        SELECT machine_id, state,
+               date_bin(INTERVAL '{interval_seconds} seconds', time, TIMESTAMP '1970-01-01T00:00:00Z') AS bin,
+               SUM(duration_seconds) AS total_duration
+        FROM machine_state
+        WHERE time >= '{range_start.isoformat()}' AND time < '{range_end.isoformat()}'
+          AND machine_id IN ({machine_list})
+        GROUP BY machine_id, state, bin
+    """
+    table = query_table(influx, sql)
+    if table is None:
+        return inputs
+    step = timedelta(seconds=interval_seconds)
+    data = table.to_pydict()
+    for mid, s, bin_start, d in zip(
+        data.get("machine_id", []),
+        data.get("state", []),
+        data.get("bin", []),
+        data.get("total_duration", []),
+    ):
+        if mid is None or not s or bin_start is None or d is None:
+            continue
+        if bin_start.tzinfo is None:
+            bin_start = bin_start.replace(tzinfo=timezone.utc)
+        entry = inputs.setdefault((str(mid), bin_start + step), WindowInputs())
+        entry.state_durations[str(s).lower()] = float(d)
+    return inputs
@@ -0,0 +1,117 @@
+"""Check the vectorized OEE calculators against the scalar ones.
+
+    python check_vectorized.py --cases 5000
+
+Generates random machine-windows — including the edge cases the clamping
+rules exist for: no planned time, excluded or minor stoppage time larger
+than the downtime, no parts, more rejects than parts, no ideal cycle time —
+and computes each one with ``calculate_availability`` /
+``calculate_performance`` / ``calculate_quality`` and all of them at once
+with ``calculator.vectorized.calculate_oee_batch``.  Prints the cases that
+disagree and exits non-zero if there are any.  Needs only NumPy.
+"""
+import argparse
+import random
+import sys
+from datetime import datetime, timezone
+
+import numpy as np
+
+from calculator.availability import calculate_availability
+from calculator.performance import calculate_performance
+from calculator.quality import calculate_quality
+from calculator.vectorized import STATES, calculate_oee_batch, state_matrix
+
+TOLERANCE = 1e-9
+
+
+def _case(rng: random.Random) -> dict:
+    planned = rng.choice([0.0, 60.0, 300.0, 900.0, rng.uniform(0, 3600)])
+    durations = {state: rng.choice([0.0, rng.uniform(0, planned or 300)]) for state in STATES}
+    downtime = sum(durations[s] for s in ("stopped", "faulted", "idle", "changeover"))
+    total_parts = rng.choice([0, rng.randint(0, 500)])
+    return {
+        "state_durations": durations,
+        "planned_time_seconds": planned,
+        "excluded_state_seconds": rng.choice([0.0, rng.uniform(0, downtime + 60)]),
+        "minor_stoppage_seconds": rng.choice([0.0, rng.uniform(0, downtime + 60)]),
+        "total_parts": total_parts,
+        "reject_parts": rng.choice([0, rng.randint(0, total_parts + 5)]),
+        "ideal_cycle_time_seconds": rng.choice([0.0, rng.uniform(0.1, 10)]),
+    }
+
+
+def _scalar(case: dict) -> dict[str, float]:
+    now = datetime.now(timezone.utc)
+    availability = calculate_availability(
+        "1", "check", now, now,
+        case["state_durations"],
+        case["planned_time_seconds"],
+        case["excluded_state_seconds"],
+        case["minor_stoppage_seconds"],
+    )
+    performance = calculate_performance(
+        "1", "check", now, now,
+        case["total_parts"], case["ideal_cycle_time_seconds"], availability.actual_run_time_seconds,
+    )
+    quality = calculate_quality("1", "check", now, now, case["total_parts"], case["reject_parts"])
+    return {
+        "planned_time_seconds": availability.planned_time_seconds,
+        "actual_run_time_seconds": availability.actual_run_time_seconds,
+        "downtime_seconds": availability.downtime_seconds,
+        "availability": availability.value,
+        "performance": performance.value,
+        "quality": quality.value,
+        "good_parts": quality.good_parts,
+        "oee": availability.value * performance.value * quality.value,
+    }
+
+
+def main(args: argparse.Namespace) -> int:
+    rng = random.Random(args.seed)
+    cases = [_case(rng) for _ in range(args.cases)]
+
+    batch = calculate_oee_batch(
+        state_matrix(c["state_durations"] for c in cases),
+        [c["planned_time_seconds"] for c in cases],
+        [c["total_parts"] for c in cases],
+        [c["reject_parts"] for c in cases],
+        [c["ideal_cycle_time_seconds"] for c in cases],
+        [c["excluded_state_seconds"] for c in cases],
+        [c["minor_stoppage_seconds"] for c in cases],
+    )
+    columns = {
+        "planned_time_seconds": batch.availability.planned_time_seconds,
+        "actual_run_time_seconds": batch.availability.actual_run_time_seconds,
+        "downtime_seconds": batch.availability.downtime_seconds,
+        "availability": batch.availability.value,
+        "performance": batch.performance.value,
+        "quality": batch.quality.value,
+        "good_parts": batch.quality.good_parts,
+        "oee": batch.oee,
+    }
+
+    mismatches = 0
+    for i, case in enumerate(cases):
+        expected = _scalar(case)
+        wrong = {
+            name: (expected[name], float(column[i]))
+            for name, column in columns.items()
+            if not np.isclose(expected[name], column[i], rtol=0, atol=TOLERANCE)
+        }
+        if wrong:
+            mismatches += 1
+            if mismatches <= args.show:
+                print(f"case {i}: {case}")
+                for name, (scalar, vector) in wrong.items():
+                    print(f"  {name}: scalar {scalar!r} vectorized {vector!r}")
+    print(f"{args.cases} cases, {mismatches} disagree")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare vectorized and scalar OEE calculations")
+    parser.add_argument("--cases", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--show", type=int, default=10, help="mismatching cases to print")
+    sys.exit(main(parser.parse_args()))
@@ -10,6 +10,54 @@ class Settings(BaseSettings):
     INFLUXDB_TOKEN: str = ""
     OEE_CALC_INTERVAL_SECONDS: int = 300
     TAG_MONITOR_INTERVAL_SECONDS: int = 60
+    # Tag monitor only looks this far back for each machine's latest value
+    TAG_MONITOR_LOOKBACK_HOURS: int = 24
+    # Reload the tag monitor's in-memory open events from Postgres this often
+    TAG_MONITOR_RESYNC_SECONDS: int = 900
+    # "poll" reads tag samples from InfluxDB; "push" evaluates samples posted to the ingestion endpoint
+    TAG_MONITOR_MODE: str = "poll"
+    # Tag ingestion endpoint (0 = disabled), optional token, request size limit and edge flush period
+    OEE_INGEST_PORT: int = 0
+    OEE_INGEST_TOKEN: str = ""
+    OEE_INGEST_MAX_BODY_BYTES: int = 10_000_000
+    OEE_INGEST_FLUSH_SECONDS: float = 0.5
+    # Maximum number of machines calculated concurrently per cycle (1 = sequential)
+    OEE_CALC_CONCURRENCY: int = 8
+    # OEE result write batching — flush when any threshold is reached
+    INFLUXDB_WRITE_BATCH_POINTS: int = 5000
+    INFLUXDB_WRITE_BATCH_BYTES: int = 1_000_000
+    INFLUXDB_WRITE_FLUSH_SECONDS: float = 5.0
+    INFLUXDB_WRITE_GZIP: bool = True
+    # Safety-net full reload of the machine config cache (NOTIFY handles edits)
+    CONFIG_CACHE_FULL_RELOAD_SECONDS: int = 3600
+    # Windows are aligned to the interval and closed this long after their end
+    OEE_CALC_LAG_SECONDS: int = 15
+    # Spread machines over this many evenly spaced slots per interval (0 = whole fleet at once)
+    OEE_STAGGER_SLOTS: int = 0
+    # Recalculate a machine's open window on state changes / counter jumps (provisional result)
+    OEE_PROVISIONAL_ENABLED: bool = False
+    OEE_PROVISIONAL_DEBOUNCE_SECONDS: float = 2.0
+    OEE_PROVISIONAL_MIN_INTERVAL_SECONDS: float = 15.0
+    OEE_PROVISIONAL_CONCURRENCY: int = 2
+    # Missed windows are caught up to this far back, this many windows at a time
+    OEE_CATCHUP_LOOKBACK_HOURS: int = 168
+    OEE_CATCHUP_CONCURRENCY: int = 4
+    # Split machines across replicas (0 = single replica owns every machine)
+    OEE_SHARD_COUNT: int = 0
+    OEE_SHARD_HEARTBEAT_SECONDS: int = 15
+    # Largest production_count value before the PLC counter wraps to 0 (0 = never wraps)
+    PRODUCTION_COUNTER_MAX: int = 0
+    # Historical recalculation: worker processes, hours of windows per chunk, job poll
+    OEE_RECALC_WORKERS: int = 2
+    OEE_RECALC_CHUNK_HOURS: int = 24
+    OEE_RECALC_POLL_SECONDS: int = 30
+    # Prometheus /metrics and JSON /health endpoint (0 = disabled)
+    OEE_METRICS_PORT: int = 9100
+    # Failed InfluxDB batches are spooled here and replayed later ("" = no spool)
+    OEE_SPOOL_DIR: str = "/var/lib/oee-service/spool"
+    OEE_SPOOL_MAX_BYTES: int = 512_000_000
+    OEE_SPOOL_SEGMENT_BYTES: int = 16_000_000
+    OEE_SPOOL_BACKOFF_MAX_SECONDS: float = 300.0
 
 
 settings = Settings()
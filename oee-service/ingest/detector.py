@@ -0,0 +1,239 @@
+"""Inline downtime detection for pushed tag samples.
+
+With ``TAG_MONITOR_MODE=push`` the tag monitor no longer polls InfluxDB:
+every sample posted to the ingestion endpoint is checked against an
+in-memory index of ``downtime_tag_configs`` as it arrives, and the raw lines
+are forwarded to InfluxDB through their own write buffer.  Conditions,
+hysteresis and debounce behave as in ``calculator.tag_edges`` — the detector
+keeps, per config, the committed down/up state and the start of a not yet
+debounced run — and the resulting edges are written with
+``scheduler.tag_monitor.record_edges`` every ``OEE_INGEST_FLUSH_SECONDS``.
+
+Only configs for machines in this replica's shards are evaluated; samples for
+other machines are still forwarded to InfluxDB.  In ``poll`` mode the
+endpoint only forwards samples and the polling monitor does the detection.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from sqlalchemy import text
+
+from calculator.tag_edges import Edge, TagCondition, compile_condition
+from config import settings
+from ingest.protocol import Sample
+from metrics import INGEST_EDGES, INGEST_SAMPLES
+from scheduler.provisional import CounterWatch, get_provisional_scheduler
+from scheduler.tag_monitor import get_tag_monitor_state, record_edges
+from scheduler.tasks import get_engine, get_ingest_buffer, get_shard_manager
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Rule:
+    cfg_id: int
+    machine_id: int
+    condition: TagCondition
+    debounce_seconds: float | None
+    # Committed state, and the start of a run that hasn't lasted the debounce yet
+    down: bool = False
+    pending: bool | None = None
+    pending_since: datetime | None = None
+    last_time: datetime | None = None
+
+    def is_down(self, value) -> bool:
+        # Inside a hysteresis band the state of the previous sample holds
+        return self.condition.holds(value, self.pending if self.pending is not None else self.down)
+
+
+class Ingestor:
+    def __init__(
+        self, evaluate: bool, flush_seconds: float, config_reload_seconds: float, watermark_seconds: float
+    ):
+        self.evaluate = evaluate
+        self.flush_seconds = flush_seconds
+        self.config_reload_seconds = config_reload_seconds
+        self.watermark_seconds = watermark_seconds
+        # (measurement, machine_id tag, field) → rules watching that field
+        self._index: dict[tuple[str, str, str], list[_Rule]] = {}
+        self._rules: dict[int, _Rule] = {}
+        self._loaded_at: float | None = None
+        # Edges and watermarks waiting for the next flush
+        self._edges: dict[int, list[Edge]] = {}
+        self._watermarks: dict[int, datetime] = {}
+        self._watermarks_saved_at = 0.0
+        self._counters = CounterWatch()
+        self._task: asyncio.Task | None = None
+
+    # ── Config index ─────────────────────────────────────────────────────────
+    async def load_configs(self) -> None:
+        _, SessionLocal = get_engine()
+        async with SessionLocal() as db:
+            result = await db.execute(
+                text(
+                    """
+                    SELECT id, machine_id, measurement_name, tag_field, tag_type,
+                           digital_downtime_value, analog_operator, analog_threshold,
+                           analog_hysteresis, debounce_seconds
+                    FROM downtime_tag_configs
+                    WHERE is_enabled = true
+                    ORDER BY id
+                    """
+                )
+            )
+            shards = get_shard_manager()
+            rows = [row for row in result.fetchall() if shards.owns(row[1])]
+            state = get_tag_monitor_state()
+            await state.ensure_loaded(db, shards.owned)
+
+        index: dict[tuple[str, str, str], list[_Rule]] = {}
+        rules: dict[int, _Rule] = {}
+        for row in rows:
+            rule = _Rule(row[0], row[1], compile_condition(*row[4:9]), row[9])
+            previous = self._rules.get(rule.cfg_id)
+            if previous is not None:
+                # Keep the runtime state of configs that are still there
+                rule.pending, rule.pending_since, rule.last_time = (
+                    previous.pending, previous.pending_since, previous.last_time
+                )
+            # Edges still queued haven't reached the open events yet
+            if previous is not None and rule.cfg_id in self._edges:
+                rule.down = previous.down
+            else:
+                rule.down = rule.cfg_id in state.events
+            rules[rule.cfg_id] = rule
+            index.setdefault((row[2], str(row[1]), row[3]), []).append(rule)
+        self._index = index
+        self._rules = rules
+        self._loaded_at = time.monotonic()
+        logger.info(f"Tag ingestion: watching {len(rules)} downtime tag configs")
+
+    # ── Samples ──────────────────────────────────────────────────────────────
+    async def ingest(self, samples: list[Sample]) -> None:
+        """Evaluate samples against the config index and forward them to InfluxDB."""
+        if not samples:
+            return
+        for sample in samples:
+            machine = sample.tags.get("machine_id")
+            if machine is None:
+                continue
+            if sample.measurement == "production_count" and "total_count" in sample.fields:
+                self._observe_counter(machine, sample.fields["total_count"], sample.time)
+            for field, value in sample.fields.items():
+                for rule in self._index.get((sample.measurement, machine, field), ()):
+                    self._observe(rule, value, sample.time)
+        INGEST_SAMPLES.inc(len(samples))
+        await get_ingest_buffer().add([sample.line for sample in samples])
+
+    def _observe(self, rule: _Rule, value, at: datetime) -> None:
+        if rule.last_time is not None and at <= rule.last_time:
+            # Out of order or replayed; the state has already moved past it
+            return
+        rule.last_time = at
+        down = rule.is_down(value)
+        if not rule.debounce_seconds:
+            if down != rule.down:
+                self._commit(rule, Edge(at, down))
+            self._watermarks[rule.cfg_id] = at
+            return
+        if down == rule.down:
+            rule.pending = rule.pending_since = None
+            self._watermarks[rule.cfg_id] = at
+            return
+        if rule.pending != down:
+            rule.pending, rule.pending_since = down, at
+        self._expire(rule, at)
+
+    def _expire(self, rule: _Rule, now: datetime) -> None:
+        """Commit a pending run once it has lasted the debounce."""
+        if rule.pending is None or (now - rule.pending_since).total_seconds() < rule.debounce_seconds:
+            return
+        self._commit(rule, Edge(rule.pending_since, rule.pending))
+        rule.pending = rule.pending_since = None
+        self._watermarks[rule.cfg_id] = rule.last_time
+
+    def _commit(self, rule: _Rule, edge: Edge) -> None:
+        rule.down = edge.is_down
+        self._edges.setdefault(rule.cfg_id, []).append(edge)
+        INGEST_EDGES.inc(direction="down" if edge.is_down else "up")
+
+    def _observe_counter(self, machine: str, value, at: datetime) -> None:
+        try:
+            total = float(value)
+        except (TypeError, ValueError):
+            return
+        if not machine.isdigit() or not get_shard_manager().owns(int(machine)):
+            return
+        reason = self._counters.observe(int(machine), total, at)
+        if reason:
+            get_provisional_scheduler().notify(int(machine), reason)
+
+    # ── Flushing ─────────────────────────────────────────────────────────────
+    async def flush(self) -> None:
+        """Write the queued edges (and, periodically, watermarks) as downtime events."""
+        now = datetime.now(timezone.utc)
+        for rule in self._rules.values():
+            self._expire(rule, now)
+        save_watermarks = time.monotonic() - self._watermarks_saved_at >= self.watermark_seconds
+        if not self._edges and not save_watermarks:
+            return
+
+        edges, self._edges = self._edges, {}
+        watermarks = self._watermarks if save_watermarks else {
+            cfg_id: at for cfg_id, at in self._watermarks.items() if cfg_id in edges
+        }
+        self._watermarks = {cfg_id: at for cfg_id, at in self._watermarks.items() if cfg_id not in watermarks}
+        batch = {cfg_id: (self._rules[cfg_id].machine_id, cfg_edges) for cfg_id, cfg_edges in edges.items()
+                 if cfg_id in self._rules}
+        if await record_edges(batch, watermarks, now):
+            if save_watermarks:
+                self._watermarks_saved_at = time.monotonic()
+            return
+        # Keep everything for the next flush, ahead of anything queued meanwhile
+        for cfg_id, cfg_edges in edges.items():
+            self._edges[cfg_id] = cfg_edges + self._edges.get(cfg_id, [])
+        self._watermarks = {**watermarks, **self._watermarks}
+
+    async def run(self) -> None:
+        """Flush edges and keep the config index fresh for the lifetime of the service."""
+        while True:
+            try:
+                if self.evaluate:
+                    if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.config_reload_seconds:
+                        await self.load_configs()
+                    await self.flush()
+                buffer = get_ingest_buffer()
+                if buffer.due():
+                    await buffer.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Tag ingestion flush failed: {e}")
+            await asyncio.sleep(self.flush_seconds)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self.run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        if self.evaluate:
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Tag ingestion: final flush failed: {e}")
+        await get_ingest_buffer().flush()
+
+
+@lru_cache(maxsize=1)
+def get_ingestor() -> Ingestor:
+    return Ingestor(
+        evaluate=settings.TAG_MONITOR_MODE == "push",
+        flush_seconds=settings.OEE_INGEST_FLUSH_SECONDS,
+        config_reload_seconds=settings.TAG_MONITOR_INTERVAL_SECONDS,
+        watermark_seconds=settings.TAG_MONITOR_INTERVAL_SECONDS,
+    )
@@ -0,0 +1,176 @@
+"""Tag samples pushed to the ingestion endpoint: line protocol and JSON.
+
+Line protocol is parsed just far enough to evaluate tag conditions (the
+measurement, tags, fields and timestamp); the line itself is forwarded to
+InfluxDB unchanged except that its timestamp is normalised to nanoseconds.
+JSON samples look like::
+
+    {"measurement": "plc", "tags": {"machine_id": "3"}, "fields": {"running": true}, "time": 1760000000000}
+
+either on their own or as a list; ``time`` is an integer in the request's
+precision or an ISO-8601 string, and defaults to the time of receipt.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+PRECISION_NS = {"ns": 1, "n": 1, "us": 1_000, "u": 1_000, "ms": 1_000_000, "s": 1_000_000_000}
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+@dataclass
+class Sample:
+    measurement: str
+    tags: dict[str, str]
+    fields: dict[str, object]
+    time_ns: int
+    # Line protocol with a nanosecond timestamp, ready to forward to InfluxDB
+    line: str
+
+    @property
+    def time(self) -> datetime:
+        return datetime.fromtimestamp(self.time_ns / 1e9, tz=timezone.utc)
+
+
+def _split(text: str, sep: str, quotes: bool = False, maxsplit: int = -1) -> list[str]:
+    """Split on ``sep`` outside backslash escapes (and double quotes, if asked)."""
+    parts: list[str] = []
+    start = 0
+    i = 0
+    in_quotes = False
+    while i < len(text):
+        c = text[i]
+        if c == "\\":
+            i += 2
+            continue
+        if quotes and c == '"':
+            in_quotes = not in_quotes
+        elif c == sep and not in_quotes and (maxsplit < 0 or len(parts) < maxsplit):
+            parts.append(text[start:i])
+            start = i + 1
+        i += 1
+    parts.append(text[start:])
+    return parts
+
+
+def _unescape(text: str) -> str:
+    return text.replace("\\,", ",").replace("\\=", "=").replace("\\ ", " ").replace("\\\\", "\\")
+
+
+def _escape(text: str, measurement: bool = False) -> str:
+    text = text.replace("\\", "\\\\").replace(",", "\\,").replace(" ", "\\ ")
+    return text if measurement else text.replace("=", "\\=")
+
+
+def _field_value(raw: str) -> object:
+    if raw.startswith('"'):
+        if len(raw) < 2 or not raw.endswith('"'):
+            raise ProtocolError(f"unterminated string field value {raw!r}")
+        return raw[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+    if raw in ("t", "T", "true", "True", "TRUE"):
+        return True
+    if raw in ("f", "F", "false", "False", "FALSE"):
+        return False
+    try:
+        if raw[-1:] in ("i", "u"):
+            return int(raw[:-1])
+        return float(raw)
+    except ValueError:
+        raise ProtocolError(f"invalid field value {raw!r}") from None
+
+
+def _format_value(value: object) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return f"{value}i"
+    if isinstance(value, float):
+        return repr(value)
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def parse_line(line: str, precision: str, received_ns: int) -> Sample:
+    sections = _split(line, " ", quotes=True)
+    if len(sections) not in (2, 3) or not sections[0] or not sections[1]:
+        raise ProtocolError("expected 'measurement[,tags] fields [timestamp]'")
+    key, field_set = sections[0], sections[1]
+
+    key_parts = _split(key, ",")
+    measurement = _unescape(key_parts[0])
+    tags: dict[str, str] = {}
+    for tag in key_parts[1:]:
+        pair = _split(tag, "=", maxsplit=1)
+        if len(pair) != 2:
+            raise ProtocolError(f"invalid tag {tag!r}")
+        tags[_unescape(pair[0])] = _unescape(pair[1])
+
+    fields: dict[str, object] = {}
+    for field in _split(field_set, ",", quotes=True):
+        pair = _split(field, "=", quotes=True, maxsplit=1)
+        if len(pair) != 2 or not pair[1]:
+            raise ProtocolError(f"invalid field {field!r}")
+        fields[_unescape(pair[0])] = _field_value(pair[1])
+
+    if len(sections) == 3 and sections[2]:
+        try:
+            time_ns = int(sections[2]) * PRECISION_NS[precision]
+        except ValueError:
+            raise ProtocolError(f"invalid timestamp {sections[2]!r}") from None
+    else:
+        time_ns = received_ns
+    return Sample(measurement, tags, fields, time_ns, f"{key} {field_set} {time_ns}")
+
+
+def parse_line_protocol(body: str, precision: str, received_ns: int) -> tuple[list[Sample], list[str]]:
+    """Parse every line; returns the samples and an error message per bad line."""
+    if precision not in PRECISION_NS:
+        raise ProtocolError(f"unknown precision {precision!r}")
+    samples: list[Sample] = []
+    errors: list[str] = []
+    for number, line in enumerate(body.splitlines(), start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            samples.append(parse_line(line, precision, received_ns))
+        except ProtocolError as e:
+            errors.append(f"line {number}: {e}")
+    return samples, errors
+
+
+def parse_json(payload: object, precision: str, received_ns: int) -> tuple[list[Sample], list[str]]:
+    if precision not in PRECISION_NS:
+        raise ProtocolError(f"unknown precision {precision!r}")
+    items = payload if isinstance(payload, list) else [payload]
+    samples: list[Sample] = []
+    errors: list[str] = []
+    for number, item in enumerate(items, start=1):
+        try:
+            if not isinstance(item, dict) or not item.get("measurement") or not item.get("fields"):
+                raise ProtocolError("expected an object with 'measurement' and 'fields'")
+            measurement = str(item["measurement"])
+            tags = {str(k): str(v) for k, v in (item.get("tags") or {}).items()}
+            fields = {str(k): v for k, v in item["fields"].items() if v is not None}
+            if not fields:
+                raise ProtocolError("no non-null fields")
+            raw_time = item.get("time")
+            if raw_time is None:
+                time_ns = received_ns
+            elif isinstance(raw_time, str):
+                ts = datetime.fromisoformat(raw_time.replace("Z", "+00:00"))
+                ts = ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+                time_ns = int(ts.timestamp() * 1_000_000) * 1_000
+            else:
+                time_ns = int(raw_time) * PRECISION_NS[precision]
+        except (ProtocolError, ValueError, TypeError, AttributeError) as e:
+            errors.append(f"item {number}: {e}")
+            continue
+        key = ",".join(
+            [_escape(measurement, measurement=True)]
+            + [f"{_escape(k)}={_escape(v)}" for k, v in sorted(tags.items())]
+        )
+        field_set = ",".join(f"{_escape(k)}={_format_value(v)}" for k, v in fields.items())
+        samples.append(Sample(measurement, tags, fields, time_ns, f"{key} {field_set} {time_ns}"))
+    return samples, errors
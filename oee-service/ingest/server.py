@@ -0,0 +1,303 @@
+"""Tag ingestion endpoint: HTTP batch writes and a WebSocket stream.
+
+A plain asyncio server like the metrics endpoint, on ``OEE_INGEST_PORT``:
+
+- ``POST /write`` (also ``/api/v2/write``, so InfluxDB client libraries and
+  Telegraf's InfluxDB output can point straight at it) — line protocol, or
+  JSON with ``Content-Type: application/json``; ``?precision=ns|us|ms|s``
+  (default ``ns``) and gzip bodies are accepted.  ``204`` when every sample
+  was accepted, otherwise ``400`` with the errors and the number of samples
+  that were still accepted.
+- ``GET /ws`` — WebSocket; each text or binary message is a batch in line
+  protocol or JSON (when it starts with ``{`` or ``[``) and is answered with
+  ``{"accepted": n, "errors": [...]}``.
+
+With ``OEE_INGEST_TOKEN`` set every request needs
+``Authorization: Token <token>`` (or ``Bearer``), or ``?token=`` on the
+WebSocket URL for clients that can't set headers.  Requests with more than
+``MAX_HEADER_COUNT`` headers or ``MAX_HEADER_BYTES`` of request line and
+headers are refused with ``431``.  ``tests/test_ingest.py`` exercises the
+parsers, the framing and these limits.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import struct
+import time
+import zlib
+from urllib.parse import parse_qs, urlsplit
+
+from config import settings
+from ingest.detector import get_ingestor
+from ingest.protocol import ProtocolError, Sample, parse_json, parse_line_protocol
+from metrics import INGEST_REJECTED
+
+logger = logging.getLogger(__name__)
+
+WRITE_PATHS = ("/write", "/api/v2/write")
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+# Idle keep-alive / WebSocket connections are closed after this long
+IDLE_TIMEOUT_SECONDS = 120
+# Errors echoed back per request; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+# Request line plus headers; also the longest single line the reader buffers
+MAX_HEADER_BYTES = 16_384
+MAX_HEADER_COUNT = 64
+
+# WebSocket opcodes
+_CONTINUATION, _TEXT, _BINARY, _CLOSE, _PING, _PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+
+
+class _HTTPError(Exception):
+    """Rejects a request before its body was read, so the connection is closed too."""
+
+    def __init__(self, status: str, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _authorized(headers: dict[str, str], query: dict[str, list[str]]) -> bool:
+    token = settings.OEE_INGEST_TOKEN
+    if not token:
+        return True
+    scheme, _, value = headers.get("authorization", "").partition(" ")
+    supplied = value.strip() if scheme.lower() in ("token", "bearer") else query.get("token", [""])[0]
+    return hmac.compare_digest(supplied.encode(), token.encode())
+
+
+def _parse(body: bytes, precision: str, as_json: bool) -> tuple[list[Sample], list[str]]:
+    received_ns = time.time_ns()
+    try:
+        text = body.decode("utf-8")
+        if as_json:
+            return parse_json(json.loads(text), precision, received_ns)
+        return parse_line_protocol(text, precision, received_ns)
+    except (UnicodeDecodeError, ProtocolError, ValueError) as e:
+        # Unknown precision, invalid JSON or not UTF-8: nothing in the batch is usable
+        return [], [str(e)]
+
+
+async def _accept(body: bytes, precision: str, as_json: bool) -> tuple[int, list[str]]:
+    """Parse and ingest one batch; returns the accepted count and the errors."""
+    samples, errors = _parse(body, precision, as_json)
+    if errors:
+        INGEST_REJECTED.inc(len(errors), reason="invalid")
+    await get_ingestor().ingest(samples)
+    return len(samples), errors
+
+
+# ── HTTP ──────────────────────────────────────────────────────────────────────
+async def _readline(reader: asyncio.StreamReader, timeout: float) -> bytes:
+    try:
+        return await asyncio.wait_for(reader.readline(), timeout=timeout)
+    except ValueError:
+        # Longer than the stream limit (MAX_HEADER_BYTES)
+        raise _HTTPError("431 Request Header Fields Too Large", "header line too long") from None
+
+
+async def _read_request(reader: asyncio.StreamReader) -> tuple[str, str, dict[str, str]] | None:
+    request_line = await _readline(reader, IDLE_TIMEOUT_SECONDS)
+    if not request_line.strip():
+        return None
+    parts = request_line.decode("latin-1").split()
+    headers: dict[str, str] = {}
+    size = len(request_line)
+    while (line := await _readline(reader, 5)) not in (b"\r\n", b"\n", b""):
+        size += len(line)
+        if size > MAX_HEADER_BYTES or len(headers) >= MAX_HEADER_COUNT:
+            raise _HTTPError("431 Request Header Fields Too Large", "too many or too large headers")
+        name, colon, value = line.decode("latin-1").partition(":")
+        if not colon or not name.strip():
+            raise _HTTPError("400 Bad Request", "malformed header line")
+        headers[name.strip().lower()] = value.strip()
+    if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+        raise _HTTPError("400 Bad Request", "malformed request line")
+    return parts[0], parts[1], headers
+
+
+async def _read_body(reader: asyncio.StreamReader, headers: dict[str, str]) -> bytes:
+    limit = settings.OEE_INGEST_MAX_BODY_BYTES
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise _HTTPError("411 Length Required", "chunked bodies are not supported; send Content-Length")
+    try:
+        length = int(headers["content-length"])
+    except (KeyError, ValueError):
+        raise _HTTPError("411 Length Required", "Content-Length is required") from None
+    if length < 0:
+        raise _HTTPError("400 Bad Request", "invalid Content-Length")
+    if length > limit:
+        raise _HTTPError("413 Payload Too Large", f"body exceeds {limit} bytes")
+    body = await asyncio.wait_for(reader.readexactly(length), timeout=30)
+    if headers.get("content-encoding", "").lower() == "gzip":
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(body, limit + 1)
+        except zlib.error as e:
+            raise _HTTPError("400 Bad Request", f"invalid gzip body: {e}") from None
+        if len(body) > limit:
+            raise _HTTPError("413 Payload Too Large", f"decompressed body exceeds {limit} bytes")
+        if not decompressor.eof:
+            raise _HTTPError("400 Bad Request", "truncated gzip body")
+    return body
+
+
+async def _handle_write(
+    reader: asyncio.StreamReader, headers: dict[str, str], query: dict[str, list[str]]
+) -> tuple[str, dict | None]:
+    body = await _read_body(reader, headers)
+    as_json = headers.get("content-type", "").split(";")[0].strip() == "application/json"
+    accepted, errors = await _accept(body, query.get("precision", ["ns"])[0], as_json)
+    if errors:
+        return "400 Bad Request", {"error": "; ".join(errors[:MAX_REPORTED_ERRORS]), "accepted": accepted}
+    return "204 No Content", None
+
+
+def _respond(writer: asyncio.StreamWriter, status: str, body: dict | None, keep_alive: bool) -> None:
+    payload = json.dumps(body).encode() if body is not None else b""
+    content_type = "Content-Type: application/json\r\n" if payload else ""
+    writer.write(
+        f"HTTP/1.1 {status}\r\n{content_type}Content-Length: {len(payload)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload
+    )
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        # Keep-alive: serve requests until the client closes or goes idle
+        while True:
+            try:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, target, headers = request
+                url = urlsplit(target)
+                query = parse_qs(url.query)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                if not _authorized(headers, query):
+                    INGEST_REJECTED.inc(reason="unauthorized")
+                    raise _HTTPError("401 Unauthorized", "missing or invalid token")
+                if method == "POST" and url.path in WRITE_PATHS:
+                    status, body = await _handle_write(reader, headers, query)
+                elif method == "GET" and url.path == "/ws":
+                    await _websocket(reader, writer, headers, query)
+                    break
+                else:
+                    raise _HTTPError("404 Not Found", "not found")
+            except _HTTPError as e:
+                status, body, keep_alive = e.status, {"error": e.message}, False
+            _respond(writer, status, body, keep_alive)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+        pass
+    except Exception as e:
+        logger.warning(f"Ingestion request failed: {e}")
+    finally:
+        writer.close()
+
+
+# ── WebSocket ─────────────────────────────────────────────────────────────────
+def _frame(opcode: int, payload: bytes = b"") -> bytes:
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> tuple[bool, int, bytes]:
+    first, second = await asyncio.wait_for(reader.readexactly(2), timeout=IDLE_TIMEOUT_SECONDS)
+    length = second & 0x7F
+    if length == 126:
+        (length,) = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        (length,) = struct.unpack("!Q", await reader.readexactly(8))
+    opcode = first & 0x0F
+    if not second & 0x80:
+        raise ProtocolError("client frames must be masked")
+    if first & 0x70:
+        # No extensions are negotiated, so RSV1-3 must be clear
+        raise ProtocolError("reserved bits set")
+    if opcode not in (_CONTINUATION, _TEXT, _BINARY, _CLOSE, _PING, _PONG):
+        raise ProtocolError(f"unknown opcode {opcode:#x}")
+    if opcode & 0x8 and (length > 125 or not first & 0x80):
+        raise ProtocolError("control frames must be unfragmented and at most 125 bytes")
+    if length > settings.OEE_INGEST_MAX_BODY_BYTES:
+        raise ProtocolError("message too large")
+    mask = await reader.readexactly(4)
+    payload = await asyncio.wait_for(reader.readexactly(length), timeout=30)
+    # Unmask the whole payload at once as one big integer XOR
+    key = (mask * (length // 4 + 1))[:length]
+    payload = (int.from_bytes(payload, "big") ^ int.from_bytes(key, "big")).to_bytes(length, "big")
+    return bool(first & 0x80), opcode, payload
+
+
+async def _websocket(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    headers: dict[str, str],
+    query: dict[str, list[str]],
+) -> None:
+    key = headers.get("sec-websocket-key")
+    if headers.get("upgrade", "").lower() != "websocket" or not key:
+        raise _HTTPError("400 Bad Request", "expected a WebSocket upgrade")
+    accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+    writer.write(
+        "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+        f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode()
+    )
+    await writer.drain()
+
+    precision = query.get("precision", ["ns"])[0]
+    message = bytearray()
+    fragmented = False
+    while True:
+        try:
+            fin, opcode, payload = await _read_frame(reader)
+            if opcode == _CONTINUATION and not fragmented:
+                raise ProtocolError("continuation frame without a message to continue")
+            if opcode in (_TEXT, _BINARY) and fragmented:
+                raise ProtocolError("new message before the previous one finished")
+        except ProtocolError as e:
+            code = 1009 if "too large" in str(e) else 1002
+            writer.write(_frame(_CLOSE, struct.pack("!H", code) + str(e).encode()))
+            await writer.drain()
+            return
+        if opcode == _CLOSE:
+            writer.write(_frame(_CLOSE, payload[:2]))
+            await writer.drain()
+            return
+        if opcode == _PING:
+            writer.write(_frame(_PONG, payload))
+            await writer.drain()
+            continue
+        if opcode == _PONG:
+            continue
+
+        message += payload
+        if len(message) > settings.OEE_INGEST_MAX_BODY_BYTES:
+            writer.write(_frame(_CLOSE, struct.pack("!H", 1009) + b"message too large"))
+            await writer.drain()
+            return
+        fragmented = not fin
+        if not fin:
+            continue
+        body, message = bytes(message), bytearray()
+        accepted, errors = await _accept(body, precision, body.lstrip()[:1] in (b"{", b"["))
+        ack = {"accepted": accepted, "errors": errors[:MAX_REPORTED_ERRORS]}
+        writer.write(_frame(_TEXT, json.dumps(ack).encode()))
+        await writer.drain()
+
+
+async def start_server(port: int) -> asyncio.AbstractServer:
+    server = await asyncio.start_server(_handle, host="0.0.0.0", port=port, limit=MAX_HEADER_BYTES)
+    logger.info(f"Tag ingestion endpoint listening on :{port} (POST /write, GET /ws)")
+    return server
@@ -1,15 +1,39 @@
 """OEEForge OEE Calculation Service — entrypoint."""
+import asyncio
 import logging
 import signal
-import sys
-import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 
-from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 
+import metrics
 from config import settings
+from ingest import server as ingest_server
+from ingest.detector import get_ingestor
+from scheduler.config_cache import listen_for_config_changes
+from scheduler.provisional import get_provisional_scheduler
+from scheduler.recalc import run_recalc_jobs, shutdown_recalc_pool
 from scheduler.tag_monitor import run_tag_monitor
-from scheduler.tasks import run_calculations
+from scheduler.tasks import (
+    dispose_engine,
+    get_config_cache,
+    get_engine,
+    get_influx,
+    get_influx_breaker,
+    get_rollup_store,
+    get_shard_manager,
+    get_spool,
+    get_write_buffer,
+    result_write_buffers,
+    run_calculations,
+    run_staggered_calculations,
+)
+from scheduler.stagger import first_tick, slot_step_seconds
+from scheduler.windows import align_down
+from spool import drain_spool
 
 logging.basicConfig(
     level=logging.INFO,
@@ -18,57 +42,158 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def main():
+async def main():
     logger.info(
         f"OEE Calculation Service starting — "
         f"oee_interval: {settings.OEE_CALC_INTERVAL_SECONDS}s, "
-        f"tag_monitor_interval: {settings.TAG_MONITOR_INTERVAL_SECONDS}s"
+        f"tag_monitor: {settings.TAG_MONITOR_MODE} ({settings.TAG_MONITOR_INTERVAL_SECONDS}s), "
+        f"provisional: {'on' if settings.OEE_PROVISIONAL_ENABLED else 'off'}"
     )
 
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(
-        run_calculations,
-        trigger=IntervalTrigger(seconds=settings.OEE_CALC_INTERVAL_SECONDS),
-        id="oee_calc",
-        name="OEE Calculation",
-        replace_existing=True,
-        max_instances=1,
+    loop = asyncio.get_running_loop()
+    # Blocking InfluxDB calls run in this pool; size it for the concurrent work
+    loop.set_default_executor(ThreadPoolExecutor(
+        max_workers=settings.OEE_CALC_CONCURRENCY + settings.OEE_CATCHUP_CONCURRENCY + 4,
+        thread_name_prefix="influx",
+    ))
+
+    # Create the connection pool and InfluxDB client once; every job reuses them
+    get_engine()
+    influx = get_influx()
+    write_buffer = get_write_buffer()
+
+    def _collect_write_buffer():
+        buffers = result_write_buffers()
+        metrics.WRITE_BUFFER_PENDING.set(sum(b.pending() for b in buffers))
+        metrics.WRITE_BUFFER_FLUSHES.set_total(sum(b.flush_count for b in buffers))
+        metrics.WRITE_BUFFER_ERRORS.set_total(sum(b.error_count for b in buffers))
+        metrics.WRITE_BUFFER_FAILING.set(1 if any(b.last_write_failed for b in buffers) else 0)
+
+    metrics.add_collector(_collect_write_buffer)
+
+    # Replay batches spooled while InfluxDB was unreachable (including before a restart)
+    spool = get_spool()
+    breaker = get_influx_breaker()
+    spool_drainer = None
+    if spool is not None:
+        spool_drainer = asyncio.create_task(drain_spool(spool, write_buffer.write_lines, breaker))
+
+        def _collect_spool():
+            size, segments, age = spool.stats()
+            metrics.SPOOL_BYTES.set(size)
+            metrics.SPOOL_SEGMENTS.set(segments)
+            metrics.SPOOL_OLDEST_AGE.set(age)
+            metrics.SPOOL_SPOOLED.set_total(spool.spooled_batches)
+            metrics.SPOOL_REPLAYED.set_total(spool.replayed_batches)
+
+        metrics.add_collector(_collect_spool)
+    metrics.add_collector(lambda: metrics.INFLUX_CIRCUIT_OPEN.set(1 if breaker.is_open else 0))
+    metrics_server = await metrics.start_server(settings.OEE_METRICS_PORT) if settings.OEE_METRICS_PORT else None
+    listener = asyncio.create_task(listen_for_config_changes(get_config_cache(), get_rollup_store()))
+
+    # Claim machine shards before the first run so replicas don't both compute them
+    shard_manager = get_shard_manager()
+    try:
+        await shard_manager.heartbeat()
+    except Exception as e:
+        logger.error(f"Initial shard claim failed: {e}")
+    shard_heartbeat = asyncio.create_task(shard_manager.run())
+
+    # Pushed tag samples: forwarded to InfluxDB, and evaluated inline in push mode
+    ingestor = get_ingestor()
+    ingest = None
+    if settings.OEE_INGEST_PORT:
+        ingestor.start()
+        ingest = await ingest_server.start_server(settings.OEE_INGEST_PORT)
+    elif settings.TAG_MONITOR_MODE == "push":
+        logger.warning("TAG_MONITOR_MODE=push but OEE_INGEST_PORT is 0; no downtime will be detected from tags")
+
+    # Fire just after each interval boundary so every run closes a full window
+    first_boundary = align_down(datetime.now(timezone.utc), settings.OEE_CALC_INTERVAL_SECONDS) + timedelta(
+        seconds=settings.OEE_CALC_INTERVAL_SECONDS + settings.OEE_CALC_LAG_SECONDS
     )
+    now = datetime.now(timezone.utc)
+
+    scheduler = AsyncIOScheduler()
+    # Both jobs also run once immediately on startup (this also catches up missed windows)
+    if settings.OEE_STAGGER_SLOTS > 1:
+        # One tick per slot, each calculating only that slot's machines; slots
+        # never overlap themselves, so let a slow slot run alongside the next one
+        step = slot_step_seconds(settings.OEE_CALC_INTERVAL_SECONDS, settings.OEE_STAGGER_SLOTS)
+        logger.info(f"Staggering OEE calculation over {settings.OEE_STAGGER_SLOTS} slots, {step:.1f}s apart")
+        scheduler.add_job(
+            run_staggered_calculations,
+            trigger=IntervalTrigger(
+                seconds=step,
+                start_date=first_tick(now, settings.OEE_CALC_INTERVAL_SECONDS, settings.OEE_CALC_LAG_SECONDS),
+            ),
+            id="oee_calc",
+            name="OEE Calculation (staggered)",
+            replace_existing=True,
+            max_instances=settings.OEE_STAGGER_SLOTS,
+            next_run_time=now,
+        )
+    else:
+        scheduler.add_job(
+            run_calculations,
+            trigger=IntervalTrigger(seconds=settings.OEE_CALC_INTERVAL_SECONDS, start_date=first_boundary),
+            id="oee_calc",
+            name="OEE Calculation",
+            replace_existing=True,
+            max_instances=1,
+            next_run_time=now,
+        )
+    if settings.TAG_MONITOR_MODE != "push":
+        scheduler.add_job(
+            run_tag_monitor,
+            trigger=IntervalTrigger(seconds=settings.TAG_MONITOR_INTERVAL_SECONDS),
+            id="tag_monitor",
+            name="Tag Monitor",
+            replace_existing=True,
+            max_instances=1,
+            next_run_time=now,
+        )
     scheduler.add_job(
-        run_tag_monitor,
-        trigger=IntervalTrigger(seconds=settings.TAG_MONITOR_INTERVAL_SECONDS),
-        id="tag_monitor",
-        name="Tag Monitor",
+        run_recalc_jobs,
+        trigger=IntervalTrigger(seconds=settings.OEE_RECALC_POLL_SECONDS),
+        id="oee_recalc",
+        name="OEE Recalculation",
         replace_existing=True,
         max_instances=1,
     )
+    # Runs dropped because the previous one was still going (or fired too late)
+    scheduler.add_listener(
+        lambda event: metrics.CYCLES_SKIPPED.inc(job=event.job_id),
+        EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED,
+    )
     scheduler.start()
 
-    # Run both jobs once immediately on startup
-    try:
-        run_calculations()
-    except Exception as e:
-        logger.error(f"Initial OEE run failed: {e}")
-
-    try:
-        run_tag_monitor()
-    except Exception as e:
-        logger.error(f"Initial tag monitor run failed: {e}")
-
-    def shutdown(signum, frame):
-        logger.info("Shutting down OEE service...")
-        scheduler.shutdown(wait=False)
-        sys.exit(0)
-
-    signal.signal(signal.SIGTERM, shutdown)
-    signal.signal(signal.SIGINT, shutdown)
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
 
-    try:
-        while True:
-            time.sleep(1)
-    except (KeyboardInterrupt, SystemExit):
-        scheduler.shutdown()
+    logger.info("Shutting down OEE service...")
+    scheduler.shutdown(wait=False)
+    listener.cancel()
+    shard_heartbeat.cancel()
+    if ingest is not None:
+        ingest.close()
+        await ingestor.close()
+    get_provisional_scheduler().close()
+    shutdown_recalc_pool()
+    await shard_manager.close()
+    if metrics_server is not None:
+        metrics_server.close()
+    if spool_drainer is not None:
+        spool_drainer.cancel()
+    for buffer in result_write_buffers():
+        await buffer.flush()
+    if spool is not None:
+        spool.close()
+    await dispose_engine()
+    influx.close()
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
@@ -0,0 +1,325 @@
+"""In-process metrics for the OEE service, served in Prometheus text format.
+
+A tiny registry of counters, gauges and histograms keyed by label values,
+plus an asyncio HTTP server exposing:
+
+- ``GET /metrics`` — Prometheus exposition format
+- ``GET /health``  — JSON summary used by the backend's system admin page
+
+Everything runs on the service's event loop, so no locking is needed; the
+recalculation worker processes keep their own (unexported) registry.
+"""
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# Stage timings span sub-millisecond calculations to multi-second queries
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: tuple[str, str] | None = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self.values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _labels(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(_labels(labels), 0.0)
+
+    def set_total(self, value: float, **labels) -> None:
+        """Take the value from a count kept elsewhere (in a collector); it must only ever grow."""
+        self.values[_labels(labels)] = float(value)
+
+    def render(self) -> list[str]:
+        return super().render() + [f"{self.name}{_format_labels(k)} {v:g}" for k, v in self.values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self.values: dict[Labels, float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        self.values[_labels(labels)] = float(value)
+
+    def get(self, **labels) -> float | None:
+        return self.values.get(_labels(labels))
+
+    def render(self) -> list[str]:
+        return super().render() + [f"{self.name}{_format_labels(k)} {v:g}" for k, v in self.values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = buckets
+        # labels → (per-bucket counts, sum, count)
+        self.values: dict[Labels, tuple[list[int], float, int]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels(labels)
+        counts, total, n = self.values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self.values[key] = (counts, total + value, n + 1)
+
+    def time(self, **labels) -> "_Timer":
+        """Time a block; usable with both ``with`` and ``async with``."""
+        return _Timer(self, labels)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for key, (counts, total, n) in self.values.items():
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {n}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {n}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict[str, object]):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+    async def __aenter__(self) -> "_Timer":
+        return self.__enter__()
+
+    async def __aexit__(self, *exc) -> None:
+        self.__exit__(*exc)
+
+
+# ── Service metrics ───────────────────────────────────────────────────────────
+STAGE_SECONDS = Histogram(
+    "oee_stage_seconds", "Time spent per job stage (job=oee_calc|tag_monitor)."
+)
+CYCLE_SECONDS = Histogram(
+    "oee_cycle_seconds", "Wall time of a full job cycle.", buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800)
+)
+CYCLE_LAST_SECONDS = Gauge("oee_cycle_last_seconds", "Wall time of the most recent cycle per job.")
+CYCLE_INTERVAL_SECONDS = Gauge("oee_cycle_interval_seconds", "Configured interval per job.")
+CYCLE_LAST_COMPLETED = Gauge(
+    "oee_cycle_last_completed_timestamp_seconds", "Unix time the most recent cycle finished per job."
+)
+CYCLE_OVERRUNS = Counter("oee_cycle_overruns_total", "Cycles that took longer than their interval.")
+CYCLES_SKIPPED = Counter(
+    "oee_cycles_skipped_total", "Scheduled runs skipped because the previous run was still going or missed."
+)
+WINDOWS_CALCULATED = Counter("oee_windows_calculated_total", "Machine-windows calculated and written.")
+WINDOWS_PENDING = Gauge("oee_windows_pending", "Windows still owed after the most recent cycle.")
+MACHINE_FAILURES = Counter("oee_machine_failures_total", "Failed calculations per machine.")
+PROVISIONAL_RUNS = Counter("oee_provisional_runs_total", "Event-driven open-window recalculations by outcome.")
+SLOT_MACHINES = Gauge("oee_slot_machines", "Machines assigned to each staggered calculation slot.")
+SLOT_LAST_SECONDS = Gauge("oee_slot_last_seconds", "Wall time of the most recent run of each staggered slot.")
+INGEST_SAMPLES = Counter("oee_ingest_samples_total", "Tag samples accepted by the ingestion endpoint.")
+INGEST_REJECTED = Counter("oee_ingest_rejected_total", "Tag samples or requests rejected by the ingestion endpoint.")
+INGEST_EDGES = Counter("oee_ingest_edges_total", "Downtime edges detected from pushed tag samples.")
+WRITE_BUFFER_PENDING = Gauge("oee_write_buffer_pending_points", "Points waiting in the InfluxDB write buffer.")
+WRITE_BUFFER_FLUSHES = Counter("oee_write_buffer_flushes_total", "Batch writes sent to InfluxDB.")
+WRITE_BUFFER_ERRORS = Counter("oee_write_buffer_errors_total", "InfluxDB batch writes lost (neither written nor spooled).")
+WRITE_BUFFER_FAILING = Gauge("oee_write_buffer_failing", "1 if the most recent InfluxDB batch write was lost.")
+SPOOL_BYTES = Gauge("oee_spool_bytes", "Bytes of line protocol waiting in the on-disk spool.")
+SPOOL_SEGMENTS = Gauge("oee_spool_segments", "Segment files in the on-disk spool.")
+SPOOL_OLDEST_AGE = Gauge("oee_spool_oldest_age_seconds", "Age of the oldest spooled batch.")
+SPOOL_SPOOLED = Counter("oee_spool_spooled_batches_total", "Batches written to the spool.")
+SPOOL_REPLAYED = Counter("oee_spool_replayed_batches_total", "Spooled batches replayed to InfluxDB.")
+INFLUX_CIRCUIT_OPEN = Gauge("oee_influx_circuit_open", "1 while InfluxDB writes are suspended by the circuit breaker.")
+
+REGISTRY: list[_Metric] = [
+    STAGE_SECONDS,
+    CYCLE_SECONDS,
+    CYCLE_LAST_SECONDS,
+    CYCLE_INTERVAL_SECONDS,
+    CYCLE_LAST_COMPLETED,
+    CYCLE_OVERRUNS,
+    CYCLES_SKIPPED,
+    WINDOWS_CALCULATED,
+    WINDOWS_PENDING,
+    MACHINE_FAILURES,
+    PROVISIONAL_RUNS,
+    SLOT_MACHINES,
+    SLOT_LAST_SECONDS,
+    INGEST_SAMPLES,
+    INGEST_REJECTED,
+    INGEST_EDGES,
+    WRITE_BUFFER_PENDING,
+    WRITE_BUFFER_FLUSHES,
+    WRITE_BUFFER_ERRORS,
+    WRITE_BUFFER_FAILING,
+    SPOOL_BYTES,
+    SPOOL_SEGMENTS,
+    SPOOL_OLDEST_AGE,
+    SPOOL_SPOOLED,
+    SPOOL_REPLAYED,
+    INFLUX_CIRCUIT_OPEN,
+]
+
+# Refreshed right before each scrape (e.g. write buffer gauges)
+_collectors: list[Callable[[], None]] = []
+_started = time.time()
+
+
+def add_collector(collect: Callable[[], None]) -> None:
+    _collectors.append(collect)
+
+
+def record_cycle(job: str, seconds: float, interval_seconds: float) -> None:
+    """Record one finished cycle and count it as an overrun if it outlasted its interval."""
+    CYCLE_SECONDS.observe(seconds, job=job)
+    CYCLE_LAST_SECONDS.set(seconds, job=job)
+    CYCLE_INTERVAL_SECONDS.set(interval_seconds, job=job)
+    CYCLE_LAST_COMPLETED.set(time.time(), job=job)
+    if seconds > interval_seconds:
+        CYCLE_OVERRUNS.inc(job=job)
+        logger.warning(f"{job} cycle took {seconds:.1f}s, longer than its {interval_seconds:.0f}s interval")
+
+
+def _collect() -> None:
+    for collect in _collectors:
+        try:
+            collect()
+        except Exception as e:
+            logger.debug(f"Metrics collector failed: {e}")
+
+
+def render() -> str:
+    _collect()
+    lines: list[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def health() -> dict:
+    """Summary for the system admin page.
+
+    ``degraded`` when a job hasn't completed a cycle within three intervals,
+    its last cycle overran, InfluxDB writes are failing or spooled data is
+    waiting to be replayed.
+    """
+    _collect()
+    now = time.time()
+    jobs = {}
+    problems: list[str] = []
+    for key, interval in CYCLE_INTERVAL_SECONDS.values.items():
+        job = dict(key)["job"]
+        last_seconds = CYCLE_LAST_SECONDS.values.get(key, 0.0)
+        completed = CYCLE_LAST_COMPLETED.values.get(key)
+        age = now - completed if completed else None
+        jobs[job] = {
+            "interval_seconds": interval,
+            "last_cycle_seconds": round(last_seconds, 3),
+            "last_completed": datetime.fromtimestamp(completed, timezone.utc).isoformat() if completed else None,
+            "overruns": int(CYCLE_OVERRUNS.get(job=job)),
+            "skipped": int(CYCLES_SKIPPED.get(job=job)),
+        }
+        if age is not None and age > 3 * interval:
+            problems.append(f"{job} has not completed a cycle for {age:.0f}s")
+        if last_seconds > interval:
+            problems.append(f"{job} last cycle overran its interval")
+    if WRITE_BUFFER_FAILING.get():
+        problems.append("the most recent InfluxDB batch write was lost")
+    if INFLUX_CIRCUIT_OPEN.get():
+        problems.append("InfluxDB writes suspended (circuit open)")
+    if SPOOL_BYTES.get():
+        problems.append(
+            f"{int(SPOOL_BYTES.get())} bytes spooled, oldest {SPOOL_OLDEST_AGE.get() or 0:.0f}s ago"
+        )
+
+    failures = {dict(k)["machine_id"]: int(v) for k, v in MACHINE_FAILURES.values.items()}
+    return {
+        "status": "degraded" if problems else "ok",
+        "uptime_seconds": round(now - _started),
+        "problems": problems,
+        "jobs": jobs,
+        "windows_pending": int(WINDOWS_PENDING.get() or 0),
+        "write_buffer_pending_points": int(WRITE_BUFFER_PENDING.get() or 0),
+        "spool_bytes": int(SPOOL_BYTES.get() or 0),
+        "spool_oldest_age_seconds": round(SPOOL_OLDEST_AGE.get() or 0),
+        "machine_failures": failures,
+    }
+
+
+# ── HTTP endpoint ─────────────────────────────────────────────────────────────
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # Drain the headers; bodies are not accepted
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        path = parts[1].split("?")[0] if len(parts) >= 2 else ""
+        if len(parts) >= 2 and parts[0] == "GET" and path == "/metrics":
+            status, content_type, body = "200 OK", "text/plain; version=0.0.4", render()
+        elif len(parts) >= 2 and parts[0] == "GET" and path == "/health":
+            status, content_type, body = "200 OK", "application/json", json.dumps(health())
+        else:
+            status, content_type, body = "404 Not Found", "text/plain", "not found\n"
+        payload = body.encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.debug(f"Metrics request failed: {e}")
+    finally:
+        writer.close()
+
+
+async def start_server(port: int) -> asyncio.AbstractServer:
+    server = await asyncio.start_server(_handle, host="0.0.0.0", port=port)
+    logger.info(f"Metrics and health endpoints listening on :{port}")
+    return server
@@ -0,0 +1,95 @@
+"""Stand-in tag publisher for the ingestion endpoint.
+
+Simulates machines the way a PLC gateway would report them, so push-mode
+downtime detection can be exercised without real PLCs:
+
+    python publish_tags.py --url http://localhost:8300 --machines 1,2,3
+    python publish_tags.py --machines 1 --stop-every 120 --dry-run
+
+Every ``--period`` seconds each machine sends one line-protocol batch with a
+digital ``running`` field (``--measurement``, 0 while stopped — point a
+digital downtime tag config at it with downtime value ``0``), its
+``production_count`` counters and a ``machine_state`` sample.  Machines stop
+at random, on average every ``--stop-every`` seconds, for up to
+``--max-stop`` seconds.
+"""
+import argparse
+import gzip
+import random
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def _post(url: str, token: str | None, body: str) -> None:
+    request = urllib.request.Request(
+        f"{url.rstrip('/')}/write?precision=ns",
+        data=gzip.compress(body.encode()),
+        headers={"Content-Type": "text/plain; charset=utf-8", "Content-Encoding": "gzip"},
+        method="POST",
+    )
+    if token:
+        request.add_header("Authorization", f"Token {token}")
+    with urllib.request.urlopen(request, timeout=10) as response:
+        response.read()
+
+
+def main(args: argparse.Namespace) -> int:
+    machine_ids = [mid.strip() for mid in args.machines.split(",") if mid.strip()]
+    rng = random.Random(args.seed)
+    # machine_id → (running, stopped until, total, reject)
+    machines = {mid: [True, 0.0, 0, 0] for mid in machine_ids}
+    while True:
+        started = time.time()
+        now_ns = time.time_ns()
+        lines = []
+        for mid, machine in machines.items():
+            running, stopped_until, total, reject = machine
+            if running and rng.random() < args.period / args.stop_every:
+                running, stopped_until = False, started + rng.uniform(args.period, args.max_stop)
+                print(f"machine {mid}: stopped for {stopped_until - started:.0f}s", flush=True)
+            elif not running and started >= stopped_until:
+                running = True
+                print(f"machine {mid}: running", flush=True)
+            if running:
+                made = rng.randint(0, args.max_parts)
+                total += made
+                reject += sum(rng.random() < args.reject_rate for _ in range(made))
+            machine[:] = [running, stopped_until, total, reject]
+            state = "running" if running else "stopped"
+            lines += [
+                f"{args.measurement},machine_id={mid} running={1 if running else 0}i {now_ns}",
+                f"production_count,machine_id={mid} total_count={total}i,reject_count={reject}i {now_ns}",
+                f'machine_state,machine_id={mid} state="{state}",duration_seconds={float(args.period)} {now_ns}',
+            ]
+        body = "\n".join(lines)
+        if args.dry_run:
+            print(body, flush=True)
+        else:
+            try:
+                _post(args.url, args.token, body)
+            except urllib.error.HTTPError as e:
+                print(f"Write rejected ({e.code}): {e.read().decode(errors='replace')}", file=sys.stderr)
+            except (urllib.error.URLError, OSError) as e:
+                print(f"Write failed: {e}", file=sys.stderr)
+        time.sleep(max(args.period - (time.time() - started), 0))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish simulated machine tags to the OEE ingestion endpoint")
+    parser.add_argument("--url", default="http://localhost:8300", help="ingestion endpoint base URL")
+    parser.add_argument("--token", help="OEE_INGEST_TOKEN, if set on the service")
+    parser.add_argument("--machines", required=True, help="comma-separated machine ids")
+    parser.add_argument("--measurement", default="plc_tags", help="measurement of the running tag")
+    parser.add_argument("--period", type=float, default=1.0, help="seconds between samples")
+    parser.add_argument("--stop-every", type=float, default=300.0, help="mean seconds between stops")
+    parser.add_argument("--max-stop", type=float, default=90.0, help="longest stop in seconds")
+    parser.add_argument("--max-parts", type=int, default=3, help="most parts made per period")
+    parser.add_argument("--reject-rate", type=float, default=0.02, help="fraction of parts rejected")
+    parser.add_argument("--seed", type=int, help="random seed for a repeatable run")
+    parser.add_argument("--dry-run", action="store_true", help="print the line protocol instead of sending it")
+    try:
+        sys.exit(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,88 @@
+"""Queue a historical OEE recalculation and follow its progress.
+
+    python recalc.py --machines 1,2,3 --start 2026-07-01 --end 2026-10-01
+    python recalc.py --line 4 --start 2026-07-01T06:00:00+00:00 --end 2026-07-02 --product 12
+
+The job is executed by the running OEE service (see ``scheduler.recalc``);
+this command only inserts it and prints progress until it finishes.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from config import settings
+
+
+def _timestamp(value: str) -> datetime:
+    ts = datetime.fromisoformat(value)
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+async def main(args: argparse.Namespace) -> int:
+    engine = create_async_engine(settings.DATABASE_URL)
+    try:
+        async with engine.begin() as conn:
+            machine_ids = [int(mid) for mid in args.machines.split(",")] if args.machines else []
+            if args.line is not None:
+                result = await conn.execute(
+                    text("SELECT id FROM machines WHERE line_id = :line ORDER BY id"), {"line": args.line}
+                )
+                machine_ids += [row[0] for row in result.fetchall()]
+            if not machine_ids:
+                print("No machines selected", file=sys.stderr)
+                return 2
+
+            result = await conn.execute(
+                text(
+                    "INSERT INTO oee_recalc_jobs "
+                    "(machine_ids, range_start, range_end, product_id, reason, status, "
+                    "total_windows, completed_windows, created_at, updated_at) "
+                    "VALUES (CAST(:mids AS json), :start, :end, :product, :reason, 'queued', 0, 0, now(), now()) "
+                    "RETURNING id"
+                ),
+                {
+                    "mids": json.dumps(sorted(set(machine_ids))),
+                    "start": _timestamp(args.start),
+                    "end": _timestamp(args.end),
+                    "product": args.product,
+                    "reason": args.reason,
+                },
+            )
+            job_id = result.scalar_one()
+        print(f"Queued recalculation job {job_id} for {len(set(machine_ids))} machines")
+        if args.no_wait:
+            return 0
+
+        while True:
+            await asyncio.sleep(2)
+            async with engine.connect() as conn:
+                result = await conn.execute(
+                    text("SELECT status, total_windows, completed_windows, error FROM oee_recalc_jobs WHERE id = :id"),
+                    {"id": job_id},
+                )
+                status, total, completed, error = result.one()
+            print(f"  {status}: {completed}/{total} windows", flush=True)
+            if status == "completed":
+                return 0
+            if status == "failed":
+                print(f"Recalculation failed: {error}", file=sys.stderr)
+                return 1
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recalculate historical OEE windows with the current configs")
+    parser.add_argument("--machines", help="comma-separated machine ids")
+    parser.add_argument("--line", type=int, help="add every machine on this line")
+    parser.add_argument("--start", required=True, help="ISO timestamp (UTC if no offset)")
+    parser.add_argument("--end", required=True, help="ISO timestamp (UTC if no offset)")
+    parser.add_argument("--product", type=int, help="only windows in which this product ran")
+    parser.add_argument("--reason", help="free-text note stored on the job")
+    parser.add_argument("--no-wait", action="store_true", help="queue the job and exit")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,99 @@
+"""In-memory machine config cache, invalidated by Postgres LISTEN/NOTIFY.
+
+The backend publishes the affected machine id on the ``oee_config_changed``
+channel whenever an availability/performance/quality config or a
+machine-product cycle time is created, updated or deleted.  A listener task marks that machine dirty and the next
+calculation cycle reloads only the dirty machines.  The same connection listens
+for recalculations that rewrote a machine's windows, so its rollup totals are
+reloaded too.
+"""
+import asyncio
+import logging
+import time
+
+import asyncpg
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from calculator.machine_config import MachineConfigs, fetch_machine_configs
+from calculator.rollups import ROLLUP_CHANNEL, RollupStore
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+CONFIG_CHANNEL = "oee_config_changed"
+
+
+class ConfigCache:
+    def __init__(self, full_reload_seconds: float):
+        self.full_reload_seconds = full_reload_seconds
+        self._configs: dict[int, MachineConfigs] = {}
+        self._dirty: set[int] = set()
+        self._needs_full_reload = True
+        self._loaded_at = 0.0
+
+    def invalidate(self, machine_id: int | None = None) -> None:
+        """Mark one machine (or, with no id, everything) for reload."""
+        if machine_id is None:
+            self._needs_full_reload = True
+        else:
+            self._dirty.add(machine_id)
+
+    async def refresh(self, db: AsyncSession) -> None:
+        """Reload whatever has been invalidated since the last cycle."""
+        full = self._needs_full_reload or (
+            time.monotonic() - self._loaded_at >= self.full_reload_seconds
+        )
+        dirty, self._dirty = self._dirty, set()
+        self._needs_full_reload = False
+
+        try:
+            if full:
+                self._configs = await fetch_machine_configs(db)
+                self._loaded_at = time.monotonic()
+                logger.info(f"Config cache: loaded configs for {len(self._configs)} machines")
+            elif dirty:
+                reloaded = await fetch_machine_configs(db, sorted(dirty))
+                self._configs = {**self._configs, **reloaded}
+                logger.info(f"Config cache: reloaded machines {sorted(dirty)}")
+        except Exception:
+            # Try again next cycle rather than calculating from a half-loaded cache
+            if full:
+                self._needs_full_reload = True
+            self._dirty |= dirty
+            raise
+
+    def get(self, machine_id: int) -> MachineConfigs:
+        return self._configs.get(machine_id, MachineConfigs())
+
+
+def _on_notify(cache: ConfigCache | RollupStore, payload: str) -> None:
+    try:
+        cache.invalidate(int(payload))
+    except (TypeError, ValueError):
+        cache.invalidate()
+
+
+async def listen_for_config_changes(cache: ConfigCache, rollups: RollupStore) -> None:
+    """Hold a LISTEN connection open for the lifetime of the service, reconnecting on error."""
+    dsn = settings.DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://")
+    while True:
+        try:
+            conn = await asyncpg.connect(dsn)
+            try:
+                await conn.add_listener(
+                    CONFIG_CHANNEL, lambda _conn, _pid, _channel, payload: _on_notify(cache, payload)
+                )
+                await conn.add_listener(
+                    ROLLUP_CHANNEL, lambda _conn, _pid, _channel, payload: _on_notify(rollups, payload)
+                )
+                # Anything could have changed while we were not listening
+                cache.invalidate()
+                rollups.invalidate()
+                logger.info(f"Config cache: listening on '{CONFIG_CHANNEL}' and '{ROLLUP_CHANNEL}'")
+                while not conn.is_closed():
+                    await asyncio.sleep(5)
+            finally:
+                await conn.close()
+        except Exception as e:
+            logger.warning(f"Config cache: listener error, reconnecting: {e}")
+        await asyncio.sleep(5)
@@ -0,0 +1,195 @@
+"""Provisional OEE for the still-open window, recalculated on machine events.
+
+The periodic job only closes a window once it has ended, so the dashboard's
+current OEE can trail a fault by a whole interval.  With
+``OEE_PROVISIONAL_ENABLED`` the tag monitor (polling or push ingestion) calls
+``notify`` when a machine changes state or its counter jumps (``CounterWatch``),
+and just that machine's open window is recalculated and written to
+``oee_provisional``.
+
+Events are debounced — a burst within ``OEE_PROVISIONAL_DEBOUNCE_SECONDS``
+becomes one run — and each machine runs at most once per
+``OEE_PROVISIONAL_MIN_INTERVAL_SECONDS``, ``OEE_PROVISIONAL_CONCURRENCY`` at a
+time.  Provisional runs never touch rollups or checkpoints; the periodic pass
+stays the authoritative result for every window.
+"""
+import asyncio
+import logging
+import math
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+from sqlalchemy import text
+
+from calculator.counters import CounterState, WindowCounts, compute_window_counts
+from calculator.downtime_overlap import DowntimeOverlap, compute_downtime_overlap
+from calculator.oee import run_oee_for_machine
+from calculator.stoppages import StopSummary, minor_stoppage_threshold, query_fleet_stops
+from calculator.window_inputs import WindowInputs, query_fleet_inputs
+from config import settings
+from metrics import PROVISIONAL_RUNS
+from scheduler.tasks import get_config_cache, get_engine, get_influx, get_product_run_index
+from scheduler.windows import align_down, pending_windows
+
+logger = logging.getLogger(__name__)
+
+# A counter that stood still this long and then moves again means the machine resumed
+COUNTER_RESUME_SECONDS = 60.0
+
+
+class CounterWatch:
+    """Spots production counter resets and production resuming after a pause, per machine."""
+
+    def __init__(self):
+        # machine_id → (last production total, time it last changed)
+        self._counters: dict[int, tuple[float, datetime]] = {}
+
+    def observe(self, machine_id: int, total: float, at: datetime) -> str | None:
+        """Record a counter sample; returns the reason to recalculate, if any.
+
+        Samples must arrive in time order per machine.  A machine's first
+        sample only sets its baseline.
+        """
+        previous = self._counters.get(machine_id)
+        if previous is not None and total == previous[0]:
+            return None
+        self._counters[machine_id] = (total, at)
+        if previous is None:
+            return None
+        if total < previous[0]:
+            return "counter reset"
+        if (at - previous[1]).total_seconds() >= COUNTER_RESUME_SECONDS:
+            return "counter resumed"
+        return None
+
+
+class ProvisionalScheduler:
+    def __init__(self, enabled: bool, debounce_seconds: float, min_interval_seconds: float, concurrency: int):
+        self.enabled = enabled
+        self.debounce_seconds = debounce_seconds
+        self.min_interval_seconds = min_interval_seconds
+        self._semaphore = asyncio.Semaphore(max(concurrency, 1))
+        # machine_id → timer for its next run; further events until then are coalesced
+        self._due: dict[int, asyncio.TimerHandle] = {}
+        self._last_run: dict[int, float] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def notify(self, machine_id: int, reason: str = "") -> None:
+        """Request a provisional recalculation of ``machine_id``'s open window."""
+        if not self.enabled:
+            return
+        if machine_id in self._due:
+            PROVISIONAL_RUNS.inc(outcome="coalesced")
+            return
+        loop = asyncio.get_running_loop()
+        earliest = self._last_run.get(machine_id, -math.inf) + self.min_interval_seconds
+        delay = max(self.debounce_seconds, earliest - loop.time())
+        self._due[machine_id] = loop.call_later(delay, self._start, machine_id)
+        logger.debug(f"Provisional OEE for machine {machine_id} in {delay:.1f}s ({reason})")
+
+    def _start(self, machine_id: int) -> None:
+        self._due.pop(machine_id, None)
+        task = asyncio.create_task(self._run(machine_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, machine_id: int) -> None:
+        async with self._semaphore:
+            self._last_run[machine_id] = asyncio.get_running_loop().time()
+            try:
+                await recalculate_open_window(machine_id)
+                PROVISIONAL_RUNS.inc(outcome="ok")
+            except Exception as e:
+                PROVISIONAL_RUNS.inc(outcome="failed")
+                logger.warning(f"Provisional OEE failed for machine {machine_id}: {e}")
+
+    def close(self) -> None:
+        for handle in self._due.values():
+            handle.cancel()
+        self._due.clear()
+        for task in self._tasks:
+            task.cancel()
+
+
+@lru_cache(maxsize=1)
+def get_provisional_scheduler() -> ProvisionalScheduler:
+    return ProvisionalScheduler(
+        enabled=settings.OEE_PROVISIONAL_ENABLED,
+        debounce_seconds=settings.OEE_PROVISIONAL_DEBOUNCE_SECONDS,
+        min_interval_seconds=settings.OEE_PROVISIONAL_MIN_INTERVAL_SECONDS,
+        concurrency=settings.OEE_PROVISIONAL_CONCURRENCY,
+    )
+
+
+async def recalculate_open_window(machine_id: int) -> None:
+    """Calculate ``machine_id``'s current window from its start up to now."""
+    _, SessionLocal = get_engine()
+    influx = get_influx()
+    interval = settings.OEE_CALC_INTERVAL_SECONDS
+    now = datetime.now(timezone.utc)
+    window_start = align_down(now, interval)
+    window_end = window_start + timedelta(seconds=interval)
+    elapsed = (now - window_start).total_seconds()
+    if elapsed < 1:
+        return
+
+    configs = get_config_cache().get(machine_id)
+    excluded = set((configs.availability or {}).get("excluded_category_ids") or [])
+    async with SessionLocal() as db:
+        result = await db.execute(
+            text(
+                "SELECT last_window_end, counter_time, counter_total, counter_reject "
+                "FROM oee_calc_checkpoints WHERE machine_id = :mid"
+            ),
+            {"mid": machine_id},
+        )
+        row = result.fetchone()
+        overlaps = await compute_downtime_overlap(db, {machine_id: [(window_start, now)]}, {machine_id: excluded})
+    downtime = overlaps.get((machine_id, now), DowntimeOverlap())
+    last_end = row[0] if row else None
+    states = {machine_id: CounterState(row[1], int(row[2] or 0), int(row[3] or 0))} if row and row[1] else {}
+
+    # Count from the checkpoint's counter watermark through any windows the
+    # periodic pass hasn't closed yet, so the open window starts from the right baseline
+    windows = pending_windows(last_end, window_end, interval, settings.OEE_CATCHUP_LOOKBACK_HOURS * 3600)
+    counts = await asyncio.to_thread(
+        compute_window_counts,
+        influx,
+        {machine_id: windows},
+        states,
+        settings.PRODUCTION_COUNTER_MAX,
+        settings.OEE_CATCHUP_LOOKBACK_HOURS * 3600,
+    )
+    fleet_inputs = await asyncio.to_thread(query_fleet_inputs, influx, window_start, now, [machine_id])
+    stops = await asyncio.to_thread(
+        query_fleet_stops, influx, window_start, now, interval, {machine_id: minor_stoppage_threshold(configs)}
+    )
+    inputs = fleet_inputs.get(str(machine_id), WindowInputs())
+    open_counts = counts.get((machine_id, window_end), WindowCounts())
+    inputs.total_parts = open_counts.total_parts
+    inputs.reject_parts = open_counts.reject_parts
+
+    # A configured planned time is per full window; only the elapsed part is planned so far
+    avail = configs.availability
+    if avail and avail.get("planned_production_time_seconds"):
+        configs = replace(configs, availability={
+            **avail,
+            "planned_production_time_seconds": avail["planned_production_time_seconds"] * elapsed / interval,
+        })
+
+    async with SessionLocal() as db:
+        await run_oee_for_machine(
+            db=db,
+            influx=influx,
+            influx_db=settings.INFLUXDB_DATABASE,
+            machine_id=machine_id,
+            window_start=window_start,
+            window_end=now,
+            inputs=inputs,
+            configs=configs,
+            product_segments=get_product_run_index().segments(machine_id, window_start, now),
+            downtime=downtime,
+            stops=stops.get((str(machine_id), window_end), StopSummary()),
+            provisional=True,
+        )
@@ -0,0 +1,405 @@
+"""Historical OEE recalculation jobs.
+
+Admins queue jobs in ``oee_recalc_jobs`` through the backend API or
+``recalc.py``.  A replica claims one queued job at a time, works out which
+windows it affects, splits them into time chunks and recomputes each chunk in
+a worker process with the current configs.  Results are written at the
+original window-end timestamps, so they overwrite the old points in place and
+a job can safely be re-run.  Shift/day rollups of every touched period are
+then rebuilt from the stored windows, and the replicas owning the machines
+are notified to reload their running totals.
+
+Jobs are queued explicitly, or by the backend's config endpoints when called
+with ``recalculate_from``; a config change alone does not queue one.
+
+Only windows up to each machine's checkpoint are recalculated; later windows
+are still owed to the regular calculation job, which uses the current configs
+anyway.
+"""
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from influxdb_client_3 import InfluxDBClient3
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from calculator.counters import WindowCounts, compute_window_counts, query_counter_baselines
+from calculator.downtime_overlap import DowntimeOverlap, compute_downtime_overlap
+from calculator.intervals import overlap_per_window, union
+from calculator.machine_config import MachineConfigs, fetch_machine_configs
+from calculator.oee import run_oee_for_machine
+from calculator.product_runs import ProductRunIndex
+from calculator.rollups import RollupStore, RollupTotals, notify_rollups_stale, query_stored_windows
+from calculator.stoppages import StopSummary, minor_stoppage_threshold, query_fleet_stops
+from calculator.window_inputs import WindowInputs, query_fleet_state_bins
+from config import settings
+from scheduler.tasks import get_engine, get_influx, get_write_buffer
+from scheduler.windows import Window, align_down, latest_complete_window_end, load_checkpoints
+from write_buffer import WriteBuffer
+
+logger = logging.getLogger(__name__)
+
+# A running job whose heartbeat hasn't moved for this long is assumed orphaned
+# (its replica died) and may be claimed again
+STALE_JOB_SECONDS = 900
+# The replica running a job touches its updated_at this often, however slow its chunks
+JOB_HEARTBEAT_SECONDS = 60
+# Shifts and days are at most this long; rollup rebuilds read this much context
+PERIOD_MARGIN = timedelta(hours=26)
+
+WindowResult = tuple[int, datetime, datetime, RollupTotals]
+
+
+@dataclass
+class RecalcChunk:
+    windows_by_machine: dict[int, list[Window]]
+
+
+@dataclass
+class ChunkResult:
+    windows: list[WindowResult] = field(default_factory=list)
+
+
+# ── Affected windows ──────────────────────────────────────────────────────────
+async def affected_windows(
+    db: AsyncSession,
+    machine_ids: list[int],
+    range_start: datetime,
+    range_end: datetime,
+    checkpoints: dict[int, datetime],
+    product_id: int | None = None,
+) -> dict[int, list[Window]]:
+    """Interval-aligned windows overlapping the range, per machine.
+
+    Windows after a machine's checkpoint are left to the regular job.  With
+    ``product_id`` (a product-specific config change), only windows in which
+    that product ran are affected.
+    """
+    interval = settings.OEE_CALC_INTERVAL_SECONDS
+    step = timedelta(seconds=interval)
+    first = align_down(range_start, interval)
+
+    runs: dict[int, list[tuple[float, float]]] = {}
+    if product_id is not None:
+        result = await db.execute(
+            text(
+                "SELECT machine_id, start_time, end_time FROM product_runs "
+                "WHERE product_id = :pid AND machine_id = ANY(:mids) "
+                "AND start_time < :range_end AND (end_time IS NULL OR end_time > :range_start)"
+            ),
+            {"pid": product_id, "mids": machine_ids, "range_start": range_start, "range_end": range_end},
+        )
+        now = datetime.now(timezone.utc)
+        for row in result.mappings():
+            runs.setdefault(row["machine_id"], []).append(
+                (row["start_time"].timestamp(), (row["end_time"] or now).timestamp())
+            )
+
+    affected: dict[int, list[Window]] = {}
+    for machine_id in machine_ids:
+        last_end = checkpoints.get(machine_id)
+        if last_end is None:
+            continue
+        windows: list[Window] = []
+        start = first
+        while start < range_end and start + step <= last_end:
+            windows.append((start, start + step))
+            start += step
+        if product_id is not None:
+            spans = [(ws.timestamp(), we.timestamp()) for ws, we in windows]
+            overlap = overlap_per_window(union(runs.get(machine_id, [])), spans)
+            windows = [w for w, seconds in zip(windows, overlap) if seconds > 0]
+        if windows:
+            affected[machine_id] = windows
+    return affected
+
+
+def split_chunks(windows_by_machine: dict[int, list[Window]], chunk_seconds: int) -> list[RecalcChunk]:
+    """Split by time so each chunk covers every machine and its fleet queries stay wide."""
+    by_bucket: dict[int, dict[int, list[Window]]] = {}
+    for machine_id, windows in windows_by_machine.items():
+        for window in windows:
+            bucket = int(window[0].timestamp()) // chunk_seconds
+            by_bucket.setdefault(bucket, {}).setdefault(machine_id, []).append(window)
+    return [RecalcChunk(by_bucket[bucket]) for bucket in sorted(by_bucket)]
+
+
+# ── Worker process ────────────────────────────────────────────────────────────
+def _init_worker() -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    )
+    # One line per machine-window is too much for a backfill
+    logging.getLogger("calculator.oee").setLevel(logging.WARNING)
+
+
+def run_chunk(chunk: RecalcChunk) -> ChunkResult:
+    """Process-pool entry point: recompute one chunk on its own loop and connections."""
+    return asyncio.run(_run_chunk(chunk))
+
+
+async def _run_chunk(chunk: RecalcChunk) -> ChunkResult:
+    interval = settings.OEE_CALC_INTERVAL_SECONDS
+    machine_ids = list(chunk.windows_by_machine)
+    range_start = min(ws[0][0] for ws in chunk.windows_by_machine.values())
+    range_end = max(ws[-1][1] for ws in chunk.windows_by_machine.values())
+
+    engine = create_async_engine(settings.DATABASE_URL, poolclass=NullPool)
+    SessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    influx = InfluxDBClient3(
+        host=settings.INFLUXDB_URL,
+        database=settings.INFLUXDB_DATABASE,
+        token=settings.INFLUXDB_TOKEN if settings.INFLUXDB_TOKEN else None,
+        enable_gzip=settings.INFLUXDB_WRITE_GZIP,
+    )
+    write_buffer = WriteBuffer(
+        influx=influx,
+        max_points=settings.INFLUXDB_WRITE_BATCH_POINTS,
+        max_bytes=settings.INFLUXDB_WRITE_BATCH_BYTES,
+        max_age_seconds=settings.INFLUXDB_WRITE_FLUSH_SECONDS,
+    )
+    try:
+        async with SessionLocal() as db:
+            configs = await fetch_machine_configs(db, machine_ids)
+            product_runs = ProductRunIndex()
+            await product_runs.refresh(db, range_start)
+            excluded_by_machine = {
+                machine_id: set((configs[machine_id].availability or {}).get("excluded_category_ids") or [])
+                for machine_id in machine_ids
+            }
+            downtime = await compute_downtime_overlap(db, chunk.windows_by_machine, excluded_by_machine)
+
+        # Each machine's last counter sample before the chunk is its baseline
+        baselines = await asyncio.to_thread(
+            query_counter_baselines,
+            influx,
+            machine_ids,
+            range_start,
+            settings.OEE_CATCHUP_LOOKBACK_HOURS * 3600,
+        )
+        counts = await asyncio.to_thread(
+            compute_window_counts, influx, chunk.windows_by_machine, baselines, settings.PRODUCTION_COUNTER_MAX
+        )
+        states = await asyncio.to_thread(
+            query_fleet_state_bins, influx, range_start, range_end, interval, machine_ids
+        )
+        stops = await asyncio.to_thread(
+            query_fleet_stops, influx, range_start, range_end, interval, {
+                machine_id: minor_stoppage_threshold(configs.get(machine_id, MachineConfigs()))
+                for machine_id in machine_ids
+            },
+        )
+
+        result = ChunkResult()
+        async with SessionLocal() as db:
+            for machine_id, windows in chunk.windows_by_machine.items():
+                for window_start, window_end in windows:
+                    inputs = states.get((str(machine_id), window_end), WindowInputs())
+                    window_counts = counts.get((machine_id, window_end), WindowCounts())
+                    inputs.total_parts = window_counts.total_parts
+                    inputs.reject_parts = window_counts.reject_parts
+                    contribution = await run_oee_for_machine(
+                        db=db,
+                        influx=influx,
+                        influx_db=settings.INFLUXDB_DATABASE,
+                        machine_id=machine_id,
+                        window_start=window_start,
+                        window_end=window_end,
+                        inputs=inputs,
+                        write_buffer=write_buffer,
+                        configs=configs.get(machine_id, MachineConfigs()),
+                        product_segments=product_runs.segments(machine_id, window_start, window_end),
+                        downtime=downtime.get((machine_id, window_end), DowntimeOverlap()),
+                        stops=stops.get((str(machine_id), window_end), StopSummary()),
+                    )
+                    result.windows.append((machine_id, window_start, window_end, contribution))
+
+        await write_buffer.flush()
+        if write_buffer.error_count:
+            raise RuntimeError("OEE results could not be written to InfluxDB")
+        return result
+    finally:
+        await engine.dispose()
+        influx.close()
+
+
+# ── Job runner (service process) ──────────────────────────────────────────────
+_pool: ProcessPoolExecutor | None = None
+
+
+def get_recalc_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # Spawn rather than fork: the service process has a running loop and threads
+        _pool = ProcessPoolExecutor(
+            max_workers=max(settings.OEE_RECALC_WORKERS, 1),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+    return _pool
+
+
+def shutdown_recalc_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def _rebuild_rollups(influx: InfluxDBClient3, recalculated: list[WindowResult]) -> int:
+    """Rewrite every shift/day rollup period containing a recalculated window.
+
+    The periods are rebuilt in a store of their own rather than the replica's
+    running totals, which only hold the machines it owns.  Each machine's
+    owner (possibly this replica) is then notified to reload its totals from
+    the stored windows, so its next window doesn't write the old totals back.
+    """
+    if not recalculated:
+        return 0
+    _, SessionLocal = get_engine()
+    machine_ids = sorted({w[0] for w in recalculated})
+    range_start = min(w[1] for w in recalculated) - PERIOD_MARGIN
+    range_end = max(w[2] for w in recalculated) + PERIOD_MARGIN
+    stored = await asyncio.to_thread(
+        query_stored_windows, influx, machine_ids, range_start, range_end, settings.OEE_CALC_INTERVAL_SECONDS
+    )
+
+    # Fresh results win over whatever the stored query returned for the same window
+    by_key = {(w[0], w[2]): w for w in stored}
+    by_key.update({(w[0], w[2]): w for w in recalculated})
+    store = RollupStore()
+    async with SessionLocal() as db:
+        await store.refresh_calendar(db)
+    points = store.rebuild(
+        sorted(by_key.values(), key=lambda w: (w[0], w[2])),
+        {(w[0], w[2]) for w in recalculated},
+    )
+    write_buffer = get_write_buffer()
+    errors_before = write_buffer.error_count
+    await write_buffer.add(points)
+    await write_buffer.flush()
+    if write_buffer.error_count != errors_before:
+        raise RuntimeError("Rollup points could not be written to InfluxDB")
+
+    async with SessionLocal() as db:
+        await notify_rollups_stale(db, machine_ids)
+        await db.commit()
+    return len(points)
+
+
+async def _update_job(job_id: int, **fields) -> None:
+    _, SessionLocal = get_engine()
+    assignments = "".join(f"{name} = :{name}, " for name in fields)
+    async with SessionLocal() as db:
+        await db.execute(
+            text(f"UPDATE oee_recalc_jobs SET {assignments}updated_at = now() WHERE id = :job_id"),
+            {**fields, "job_id": job_id},
+        )
+        await db.commit()
+
+
+async def _heartbeat(job_id: int) -> None:
+    """Keep a running job's updated_at fresh so other replicas don't reclaim it."""
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            await _update_job(job_id)
+        except Exception as e:
+            logger.warning(f"Recalculation job {job_id}: heartbeat failed: {e}")
+
+
+async def run_recalc_jobs():
+    """Claim one queued (or orphaned) recalculation job and run it to completion."""
+    _, SessionLocal = get_engine()
+    async with SessionLocal() as db:
+        try:
+            result = await db.execute(
+                text(
+                    """
+                    UPDATE oee_recalc_jobs
+                    SET status = 'running', started_at = now(), updated_at = now(),
+                        completed_windows = 0, error = NULL
+                    WHERE id = (
+                        SELECT id FROM oee_recalc_jobs
+                        WHERE status = 'queued'
+                           OR (status = 'running' AND updated_at < now() - make_interval(secs => :stale))
+                        ORDER BY id
+                        FOR UPDATE SKIP LOCKED
+                        LIMIT 1
+                    )
+                    RETURNING id, machine_ids, range_start, range_end, product_id
+                    """
+                ),
+                {"stale": STALE_JOB_SECONDS},
+            )
+            job = result.mappings().first()
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Failed to claim a recalculation job: {e}")
+            return
+    if job is None:
+        return
+
+    job_id = job["id"]
+    heartbeat = asyncio.create_task(_heartbeat(job_id))
+    try:
+        await _run_job(job_id, job)
+    except Exception as e:
+        logger.error(f"Recalculation job {job_id} failed: {e}")
+        await _update_job(job_id, status="failed", error=str(e), finished_at=datetime.now(timezone.utc))
+    finally:
+        heartbeat.cancel()
+
+
+async def _run_job(job_id: int, job) -> None:
+    _, SessionLocal = get_engine()
+    started = datetime.now(timezone.utc)
+    latest_end = latest_complete_window_end(started, settings.OEE_CALC_INTERVAL_SECONDS, settings.OEE_CALC_LAG_SECONDS)
+
+    async with SessionLocal() as db:
+        checkpoints = await load_checkpoints(db)
+        windows_by_machine = await affected_windows(
+            db,
+            [int(mid) for mid in job["machine_ids"]],
+            job["range_start"],
+            min(job["range_end"], latest_end),
+            checkpoints,
+            job["product_id"],
+        )
+    total = sum(len(windows) for windows in windows_by_machine.values())
+    chunks = split_chunks(windows_by_machine, max(settings.OEE_RECALC_CHUNK_HOURS, 1) * 3600)
+    await _update_job(job_id, total_windows=total)
+    logger.info(
+        f"Recalculation job {job_id}: {total} windows for {len(windows_by_machine)} machines "
+        f"in {len(chunks)} chunks"
+    )
+
+    loop = asyncio.get_running_loop()
+    pool = get_recalc_pool()
+    futures = [loop.run_in_executor(pool, run_chunk, chunk) for chunk in chunks]
+    recalculated: list[WindowResult] = []
+    try:
+        for future in asyncio.as_completed(futures):
+            result = await future
+            recalculated.extend(result.windows)
+            await _update_job(job_id, completed_windows=len(recalculated))
+            logger.info(f"Recalculation job {job_id}: {len(recalculated)}/{total} windows")
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+
+    rollup_points = await _rebuild_rollups(get_influx(), recalculated)
+    await _update_job(job_id, status="completed", finished_at=datetime.now(timezone.utc))
+    logger.info(
+        f"Recalculation job {job_id} complete: {len(recalculated)} windows, "
+        f"{rollup_points} rollup periods rewritten in "
+        f"{(datetime.now(timezone.utc) - started).total_seconds():.1f}s"
+    )
@@ -0,0 +1,104 @@
+"""Machine sharding across oee-service replicas using Postgres advisory locks.
+
+Machines are split into ``OEE_SHARD_COUNT`` shards (``machine_id % count``).
+Each replica claims shards with session-level ``pg_try_advisory_lock`` calls
+on a dedicated connection, so a replica that dies releases its shards as soon
+as Postgres notices the connection is gone.  Each replica also holds a
+presence lock in a separate namespace from the moment it connects, so a
+replica that has just joined (and owns no shard yet) is still counted.  On
+every heartbeat a replica counts the live replicas holding presence locks,
+releases shards above its fair share and claims free shards up to it, so
+ownership rebalances on its own as replicas join and leave.
+"""
+import asyncio
+import logging
+import math
+
+import asyncpg
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# First key of the two-key advisory lock; the second key is the shard number
+LOCK_NAMESPACE = 0x0EE0
+# First key of each replica's presence lock; the second key is its backend pid
+PRESENCE_NAMESPACE = 0x0EE1
+
+
+class ShardManager:
+    def __init__(self, shard_count: int, heartbeat_seconds: float):
+        self.shard_count = shard_count
+        self.heartbeat_seconds = heartbeat_seconds
+        self.owned: set[int] = set()
+        self._conn: asyncpg.Connection | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.shard_count > 0
+
+    def owns(self, machine_id: int) -> bool:
+        return not self.enabled or machine_id % self.shard_count in self.owned
+
+    async def heartbeat(self) -> None:
+        """Check the lock connection is alive and rebalance shard ownership."""
+        if not self.enabled:
+            return
+        if self._conn is None or self._conn.is_closed():
+            # Any locks we held went away with the old connection
+            self.owned.clear()
+            dsn = settings.DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://")
+            self._conn = await asyncpg.connect(dsn)
+            await self._conn.fetchval(
+                "SELECT pg_advisory_lock($1, pg_backend_pid())", PRESENCE_NAMESPACE
+            )
+
+        other_replicas = await self._conn.fetchval(
+            "SELECT count(DISTINCT pid) FROM pg_locks "
+            "WHERE locktype = 'advisory' AND classid = $1 AND objsubid = 2 "
+            "AND granted AND pid <> pg_backend_pid()",
+            PRESENCE_NAMESPACE,
+        )
+        fair_share = math.ceil(self.shard_count / (other_replicas + 1))
+        before = set(self.owned)
+
+        # Give up the highest shards first so a newcomer can pick them up
+        for shard in sorted(self.owned, reverse=True)[: max(len(self.owned) - fair_share, 0)]:
+            await self._conn.fetchval("SELECT pg_advisory_unlock($1, $2)", LOCK_NAMESPACE, shard)
+            self.owned.discard(shard)
+
+        for shard in range(self.shard_count):
+            if len(self.owned) >= fair_share:
+                break
+            if shard in self.owned:
+                continue
+            if await self._conn.fetchval("SELECT pg_try_advisory_lock($1, $2)", LOCK_NAMESPACE, shard):
+                self.owned.add(shard)
+
+        if self.owned != before:
+            logger.info(
+                f"Shards: own {sorted(self.owned)} of {self.shard_count} "
+                f"({other_replicas + 1} replicas, fair share {fair_share})"
+            )
+
+    async def run(self) -> None:
+        """Heartbeat for the lifetime of the service."""
+        if not self.enabled:
+            return
+        while True:
+            try:
+                await self.heartbeat()
+            except Exception as e:
+                # Stop calculating anything until the locks are re-acquired
+                logger.warning(f"Shards: heartbeat failed, releasing all shards: {e}")
+                self.owned.clear()
+                await self.close()
+            await asyncio.sleep(self.heartbeat_seconds)
+
+    async def close(self) -> None:
+        if self._conn is not None and not self._conn.is_closed():
+            try:
+                await self._conn.close(timeout=5)
+            except Exception:
+                self._conn.terminate()
+        self._conn = None
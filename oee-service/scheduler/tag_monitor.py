@@ -1,35 +1,165 @@
-"""Tag monitor: auto-create/close downtime events based on InfluxDB field conditions."""
+"""Tag monitor: auto-create/close downtime events based on InfluxDB field conditions.
+
+Every tick reads all samples written since each config's watermark (one query
+per measurement), finds the down/up edges in them with
+``calculator.tag_edges`` and records events with the samples' own timestamps,
+so a stop and restart between two ticks still produces an event.  With
+provisional OEE enabled, each tick also reads the new production counter
+samples and asks for a provisional recalculation when a counter resets or
+starts moving again.
+"""
 import asyncio
 import logging
-from datetime import datetime, timezone
+import time
+from datetime import datetime, timedelta, timezone
 
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
 from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from calculator.stoppages import minor_stoppage_point, minor_stoppage_threshold
+from calculator.tag_edges import Edge, compile_condition, detect_edges
 from config import settings
-from scheduler.tasks import get_engine, get_influx
+from metrics import STAGE_SECONDS, record_cycle
+from scheduler.provisional import CounterWatch, get_provisional_scheduler
+from scheduler.tasks import get_config_cache, get_engine, get_influx, get_shard_manager, get_write_buffer
+from scheduler.windows import align_down
 
 logger = logging.getLogger(__name__)
 
+# (machine_id strings, timestamps, values, non-null mask) for one field, sorted by machine then time
+FieldSamples = tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
 
-def _evaluate_condition(value, tag_type: str, digital_downtime_value: str | None,
-                        analog_operator: str | None, analog_threshold: float | None) -> bool:
-    """Return True if the tag value indicates a downtime condition."""
-    if tag_type == "digital":
-        return str(value) == digital_downtime_value
-    elif tag_type == "analog" and analog_operator and analog_threshold is not None:
-        try:
-            numeric = float(value)
-        except (TypeError, ValueError):
-            return False
-        ops = {
-            ">": numeric > analog_threshold,
-            ">=": numeric >= analog_threshold,
-            "<": numeric < analog_threshold,
-            "<=": numeric <= analog_threshold,
-            "==": numeric == analog_threshold,
-        }
-        return ops.get(analog_operator, False)
-    return False
+
+def _query_samples(
+    influx, measurement: str, fields: list[str], machine_ids: list[int], since: datetime, until: datetime
+) -> dict[str, FieldSamples]:
+    """Every sample of ``fields`` for the machines in ``(since, until]``, keyed by field."""
+    columns = ", ".join(f'"{field}"' for field in fields)
+    machine_list = ", ".join(f"'{mid}'" for mid in machine_ids)
+    sql = f"""
+        SELECT machine_id, {columns}, time
+        FROM "{measurement}"
+        WHERE machine_id IN ({machine_list})
+          AND time > '{since.isoformat()}' AND time <= '{until.isoformat()}'
+        ORDER BY machine_id, time
+    """
+    table = influx.query(sql, database=settings.INFLUXDB_DATABASE, language="sql")
+    if table is None or len(table) == 0:
+        return {}
+    mids = table.column("machine_id").to_numpy(zero_copy_only=False)
+    times = table.column("time").to_numpy(zero_copy_only=False).astype("datetime64[ns]")
+    samples: dict[str, FieldSamples] = {}
+    for field in fields:
+        column = table.column(field)
+        valid = pc.is_valid(column).to_numpy(zero_copy_only=False)
+        # Nulls are masked out by ``valid``; filling boolean ones keeps the column a bool array
+        if pa.types.is_boolean(column.type):
+            column = pc.fill_null(column, False)
+        samples[field] = (mids, times, column.to_numpy(zero_copy_only=False), valid)
+    return samples
+
+
+def _query_counter_samples(influx, since: datetime, until: datetime) -> list[tuple[int, datetime, float]]:
+    """(machine_id, time, total_count) of every production counter sample in ``(since, until]``."""
+    sql = f"""
+        SELECT machine_id, time, total_count
+        FROM production_count
+        WHERE time > '{since.isoformat()}' AND time <= '{until.isoformat()}'
+          AND total_count IS NOT NULL
+        ORDER BY machine_id, time
+    """
+    table = influx.query(sql, database=settings.INFLUXDB_DATABASE, language="sql")
+    if table is None or len(table) == 0:
+        return []
+    data = table.to_pydict()
+    samples = []
+    for mid, ts, total in zip(data["machine_id"], data["time"], data["total_count"]):
+        if mid is None or not str(mid).isdigit():
+            continue
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        samples.append((int(mid), ts, float(total)))
+    return samples
+
+
+def _machine_slices(mids: np.ndarray) -> dict[str, slice]:
+    """Row range of each machine in an array grouped by machine."""
+    if len(mids) == 0:
+        return {}
+    starts = np.flatnonzero(np.concatenate(([True], mids[1:] != mids[:-1])))
+    ends = np.append(starts[1:], len(mids))
+    return {str(mids[start]): slice(start, end) for start, end in zip(starts, ends)}
+
+
+async def _load_open_events(db: AsyncSession, cfg_ids: list[int] | None = None) -> dict[int, int]:
+    """Open tag-sourced downtime events as ``{source_tag_config_id: event_id}``."""
+    sql = (
+        "SELECT DISTINCT ON (source_tag_config_id) source_tag_config_id, id FROM downtime_events "
+        "WHERE source_tag_config_id IS NOT NULL AND end_time IS NULL "
+    )
+    params = {}
+    if cfg_ids is not None:
+        sql += "AND source_tag_config_id = ANY(:cfg_ids) "
+        params["cfg_ids"] = cfg_ids
+    result = await db.execute(text(sql + "ORDER BY source_tag_config_id, start_time DESC"), params)
+    return {row[0]: row[1] for row in result.fetchall()}
+
+
+class TagMonitorState:
+    """Open events and sample watermarks per config, so ticks don't query for them.
+
+    ``events`` maps config_id → open downtime event id; ``watermarks`` maps
+    config_id → time of the last sample already evaluated (persisted in
+    ``tag_monitor_watermarks`` with every tick's events).  Loaded on the first
+    tick, and reloaded every ``TAG_MONITOR_RESYNC_SECONDS`` (events can also
+    be closed or split by hand), whenever this replica's shards change, and
+    after a failed write.
+    """
+
+    def __init__(self, resync_seconds: float):
+        self.resync_seconds = resync_seconds
+        self.events: dict[int, int] = {}
+        self.watermarks: dict[int, datetime] = {}
+        self._loaded_at: float | None = None
+        self._shards: frozenset[int] = frozenset()
+
+    def invalidate(self) -> None:
+        self._loaded_at = None
+
+    async def ensure_loaded(self, db: AsyncSession, owned_shards: set[int]) -> None:
+        if (
+            self._loaded_at is not None
+            and time.monotonic() - self._loaded_at < self.resync_seconds
+            and self._shards == owned_shards
+        ):
+            return
+        self.events = await _load_open_events(db)
+        result = await db.execute(text("SELECT config_id, last_sample_time FROM tag_monitor_watermarks"))
+        self.watermarks = {row[0]: row[1] for row in result.fetchall()}
+        self._loaded_at = time.monotonic()
+        self._shards = frozenset(owned_shards)
+        logger.info(f"Tag monitor: {len(self.events)} open tag-sourced downtime events")
+
+
+_state = TagMonitorState(resync_seconds=settings.TAG_MONITOR_RESYNC_SECONDS)
+# Counter samples seen so far (poll mode); push ingestion keeps its own
+_counter_watch = CounterWatch()
+_counters_read_until: datetime | None = None
+
+
+def get_tag_monitor_state() -> TagMonitorState:
+    return _state
+
+
+async def run_tag_monitor():
+    started = time.perf_counter()
+    try:
+        await _run_tag_monitor()
+    finally:
+        record_cycle("tag_monitor", time.perf_counter() - started, settings.TAG_MONITOR_INTERVAL_SECONDS)
 
 
 async def _run_tag_monitor():
@@ -38,105 +168,345 @@ async def _run_tag_monitor():
     influx = get_influx()
     now = datetime.now(timezone.utc)
 
-    async with SessionLocal() as db:
+    async with SessionLocal() as db, STAGE_SECONDS.time(job="tag_monitor", stage="config_load"):
         try:
             result = await db.execute(
                 text(
                     """
                     SELECT id, machine_id, measurement_name, tag_field, tag_type,
                            digital_downtime_value, analog_operator, analog_threshold,
-                           downtime_category_id
+                           downtime_category_id, debounce_seconds, analog_hysteresis
                     FROM downtime_tag_configs
                     WHERE is_enabled = true
                     ORDER BY id
                     """
                 )
             )
-            configs = result.fetchall()
+            shards = get_shard_manager()
+            configs = [cfg for cfg in result.fetchall() if shards.owns(cfg[1])]
+            await _state.ensure_loaded(db, shards.owned)
         except Exception as e:
-            logger.error(f"Tag monitor: failed to fetch configs: {e}")
+            logger.error(f"Tag monitor: failed to fetch configs or open events: {e}")
             return
 
+    # New configs start one interval back; nothing older than the lookback is read
+    default_since = now - timedelta(seconds=settings.TAG_MONITOR_INTERVAL_SECONDS)
+    earliest = now - timedelta(hours=settings.TAG_MONITOR_LOOKBACK_HOURS)
+    since_by_cfg = {cfg[0]: max(_state.watermarks.get(cfg[0], default_since), earliest) for cfg in configs}
+
+    # Every sample since the oldest watermark, one query per measurement
+    fields_by_measurement: dict[str, set[str]] = {}
+    machines_by_measurement: dict[str, set[int]] = {}
+    since_by_measurement: dict[str, datetime] = {}
+    for cfg in configs:
+        fields_by_measurement.setdefault(cfg[2], set()).add(cfg[3])
+        machines_by_measurement.setdefault(cfg[2], set()).add(cfg[1])
+        since_by_measurement[cfg[2]] = min(since_by_measurement.get(cfg[2], now), since_by_cfg[cfg[0]])
+
+    async def _fetch(measurement: str) -> tuple[str, dict[str, FieldSamples]]:
+        fields = sorted(fields_by_measurement[measurement])
+        machine_ids = sorted(machines_by_measurement[measurement])
+        since = since_by_measurement[measurement]
+        # Blocking FlightSQL call — keep it off the shared event loop
+        with STAGE_SECONDS.time(job="tag_monitor", stage="influx_query"):
+            try:
+                return measurement, await asyncio.to_thread(
+                    _query_samples, influx, measurement, fields, machine_ids, since, now
+                )
+            except Exception as e:
+                logger.debug(f"Tag monitor: no data for measurement {measurement}: {e}")
+                if len(fields) == 1:
+                    return measurement, {}
+            # One bad field (e.g. a typo in a config) shouldn't blind the other configs
+            samples: dict[str, FieldSamples] = {}
+            for field in fields:
+                try:
+                    samples.update(await asyncio.to_thread(
+                        _query_samples, influx, measurement, [field], machine_ids, since, now
+                    ))
+                except Exception as e:
+                    logger.debug(f"Tag monitor: no data for {measurement}.{field}: {e}")
+            return measurement, samples
+
+    samples = dict(await asyncio.gather(*(_fetch(m) for m in fields_by_measurement)))
+    slices: dict[tuple[str, str], dict[str, slice]] = {
+        (measurement, field): _machine_slices(columns[0])
+        for measurement, by_field in samples.items()
+        for field, columns in by_field.items()
+    }
+
+    # Edges per config since its watermark
+    edges_by_cfg: dict[int, tuple[int, list[Edge]]] = {}
+    watermarks: dict[int, datetime] = {}
     for cfg in configs:
         (cfg_id, machine_id, measurement_name, tag_field, tag_type,
          digital_downtime_value, analog_operator, analog_threshold,
-         downtime_category_id) = cfg
-
-        # Query InfluxDB for the latest value of this field for this machine
-        sql = (
-            f'SELECT "{tag_field}", time '
-            f'FROM "{measurement_name}" '
-            f"WHERE \"machine_id\" = '{machine_id}' "
-            f"ORDER BY time DESC "
-            f"LIMIT 1"
+         downtime_category_id, debounce_seconds, analog_hysteresis) = cfg
+
+        columns = samples.get(measurement_name, {}).get(tag_field)
+        rows = slices.get((measurement_name, tag_field), {}).get(str(machine_id))
+        if columns is None or rows is None:
+            continue
+        _, times, values, valid = columns
+        since = np.datetime64(since_by_cfg[cfg_id].replace(tzinfo=None), "ns")
+        keep = valid[rows] & (times[rows] > since)
+        if not keep.any():
+            continue
+
+        was_down = cfg_id in _state.events
+        condition = compile_condition(
+            tag_type, digital_downtime_value, analog_operator, analog_threshold, analog_hysteresis
         )
+        down = condition.mask(values[rows][keep], was_down)
+        edges, watermark = detect_edges(times[rows][keep], down, was_down, now, debounce_seconds)
+        if watermark is not None:
+            watermarks[cfg_id] = watermark
+        elif cfg_id not in _state.watermarks:
+            watermarks[cfg_id] = since_by_cfg[cfg_id]
+        if edges:
+            edges_by_cfg[cfg_id] = (machine_id, edges)
+
+    await record_edges(edges_by_cfg, watermarks, now)
+    if get_provisional_scheduler().enabled:
+        await _watch_counters(influx, now)
+
+
+async def _watch_counters(influx, now: datetime) -> None:
+    """Notify provisional OEE of counter resets and resumes since the previous tick."""
+    global _counters_read_until
+    since = _counters_read_until or now - timedelta(seconds=settings.TAG_MONITOR_INTERVAL_SECONDS)
+    with STAGE_SECONDS.time(job="tag_monitor", stage="counter_query"):
         try:
-            table = influx.query(sql, database=settings.INFLUXDB_DATABASE, language="sql")
-            if table is None or len(table) == 0:
-                continue
-            value = table[tag_field][0].as_py() if hasattr(table[tag_field][0], "as_py") else table[tag_field][0]
+            samples = await asyncio.to_thread(_query_counter_samples, influx, since, now)
         except Exception as e:
-            logger.debug(f"Tag monitor: no data for config {cfg_id} (machine {machine_id}): {e}")
+            logger.debug(f"Tag monitor: no production counter data: {e}")
+            return
+    _counters_read_until = now
+
+    shards = get_shard_manager()
+    provisional = get_provisional_scheduler()
+    for machine_id, ts, total in samples:
+        if not shards.owns(machine_id):
             continue
+        reason = _counter_watch.observe(machine_id, total, ts)
+        if reason:
+            provisional.notify(machine_id, reason)
 
-        is_down = _evaluate_condition(
-            value, tag_type, digital_downtime_value, analog_operator, analog_threshold
-        )
 
-        async with SessionLocal() as db:
-            try:
-                if is_down:
-                    # Check for an existing open event for this config
-                    existing = await db.execute(
-                        text(
-                            "SELECT id FROM downtime_events "
-                            "WHERE source_tag_config_id = :cfg_id AND end_time IS NULL "
-                            "ORDER BY start_time DESC LIMIT 1"
-                        ),
-                        {"cfg_id": cfg_id},
-                    )
-                    if existing.fetchone() is None:
-                        # Create a new downtime event
-                        await db.execute(
-                            text(
-                                "INSERT INTO downtime_events "
-                                "(machine_id, start_time, source_tag_config_id, is_split, created_at) "
-                                "VALUES (:machine_id, :start_time, :cfg_id, false, :created_at)"
-                            ),
-                            {
-                                "machine_id": machine_id,
-                                "start_time": now,
-                                "cfg_id": cfg_id,
-                                "created_at": now,
-                            },
-                        )
-                        await db.commit()
-                        logger.info(f"Tag monitor: opened downtime event for config {cfg_id} (machine {machine_id})")
+async def record_edges(
+    edges_by_cfg: dict[int, tuple[int, list[Edge]]],
+    watermarks: dict[int, datetime],
+    now: datetime,
+) -> bool:
+    """Turn each config's edges into downtime events and write them, with the watermarks, in one transaction.
+
+    ``edges_by_cfg`` maps config_id → (machine_id, edges in time order).  Used
+    by both the polling monitor and push ingestion.  Stops shorter than the
+    machine's minor stoppage threshold are counted in ``minor_stoppages``
+    instead of kept as events (see ``calculator.stoppages``).  Returns False
+    if the write failed; the in-memory state is then reloaded before the next use.
+    """
+    config_cache = get_config_cache()
+    thresholds = {
+        machine_id: minor_stoppage_threshold(config_cache.get(machine_id)) for machine_id, _ in edges_by_cfg.values()
+    }
+    closes: list[tuple[int, datetime, float]] = []                 # (cfg_id, end_time, minor threshold)
+    inserts: list[tuple[int, int, datetime, datetime | None]] = []  # (cfg_id, machine_id, start, end)
+    minor: list[tuple[int, datetime, float]] = []                   # (machine_id, start, seconds)
+    for cfg_id, (machine_id, edges) in edges_by_cfg.items():
+        open_start = None
+        for edge in edges:
+            if edge.is_down:
+                open_start = edge.time
+            elif open_start is not None:
+                seconds = (edge.time - open_start).total_seconds()
+                if seconds < thresholds[machine_id]:
+                    minor.append((machine_id, open_start, seconds))
                 else:
-                    # Close any open event for this config
-                    result = await db.execute(
-                        text(
-                            "SELECT id FROM downtime_events "
-                            "WHERE source_tag_config_id = :cfg_id AND end_time IS NULL "
-                            "ORDER BY start_time DESC LIMIT 1"
-                        ),
-                        {"cfg_id": cfg_id},
-                    )
-                    row = result.fetchone()
-                    if row:
-                        await db.execute(
-                            text(
-                                "UPDATE downtime_events SET end_time = :end_time WHERE id = :event_id"
-                            ),
-                            {"end_time": now, "event_id": row[0]},
-                        )
-                        await db.commit()
-                        logger.info(f"Tag monitor: closed downtime event {row[0]} for config {cfg_id}")
-            except Exception as e:
-                await db.rollback()
-                logger.error(f"Tag monitor: DB error for config {cfg_id}: {e}")
+                    inserts.append((cfg_id, machine_id, open_start, edge.time))
+                open_start = None
+            else:
+                closes.append((cfg_id, edge.time, thresholds[machine_id]))
+        if open_start is not None:
+            inserts.append((cfg_id, machine_id, open_start, None))
+
+    if not closes and not inserts and not minor and not watermarks:
+        return True
+
+    _, SessionLocal = get_engine()
+    async with SessionLocal() as db, STAGE_SECONDS.time(job="tag_monitor", stage="db_write"):
+        try:
+            opened, closed, recorded, minor_totals = await _apply_transitions(
+                db, closes, inserts, minor, watermarks, now
+            )
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            # The in-memory state may no longer match the database; reload it next tick
+            _state.invalidate()
+            logger.error(f"Tag monitor: DB error applying {len(inserts)} new / {len(closes)} closed events: {e}")
+            return False
+
+    _state.watermarks.update(watermarks)
+    for cfg_id, _, _ in closes:
+        # Also drops configs whose event was already closed in the database (e.g. by hand)
+        _state.events.pop(cfg_id, None)
+    for cfg_id, event_id in closed.items():
+        logger.info(f"Tag monitor: closed downtime event {event_id} for config {cfg_id}")
+    for cfg_id, event_id in opened.items():
+        _state.events[cfg_id] = event_id
+        logger.info(f"Tag monitor: opened downtime event for config {cfg_id} (machine {edges_by_cfg[cfg_id][0]})")
+    if recorded:
+        logger.info(f"Tag monitor: recorded {recorded} downtime events that started and ended between ticks")
+    if minor_totals:
+        interval = settings.OEE_CALC_INTERVAL_SECONDS
+        await get_write_buffer().add([
+            minor_stoppage_point(machine_id, window_start, interval, "tag", count, seconds, thresholds[machine_id])
+            for machine_id, window_start, count, seconds in minor_totals
+        ])
+        logger.debug(f"Tag monitor: counted minor stoppages in {len(minor_totals)} machine-windows")
+    provisional = get_provisional_scheduler()
+    for machine_id, _ in edges_by_cfg.values():
+        provisional.notify(machine_id, "downtime edge")
+    return True
+
+
+async def _apply_transitions(
+    db: AsyncSession,
+    closes: list[tuple[int, datetime, float]],
+    inserts: list[tuple[int, int, datetime, datetime | None]],
+    minor: list[tuple[int, datetime, float]],
+    watermarks: dict[int, datetime],
+    now: datetime,
+) -> tuple[dict[int, int], dict[int, int], int, list[tuple[int, datetime, int, float]]]:
+    """Bulk-close open events, insert new ones, count minor stoppages and save watermarks.
+
+    Returns ``{cfg_id: event_id}`` for events left open and for events closed,
+    the number of complete events recorded and the updated minor stoppage
+    totals as (machine_id, window_start, count, seconds).
+    """
+    opened: dict[int, int] = {}
+    closed: dict[int, int] = {}
+    recorded = 0
+    minor = list(minor)
+    if closes:
+        # Events nobody has touched yet that turn out shorter than the
+        # threshold become minor stoppages
+        result = await db.execute(
+            text(
+                """
+                UPDATE downtime_events de SET end_time = GREATEST(v.end_time, de.start_time)
+                FROM unnest(
+                    CAST(:cfg_ids AS integer[]), CAST(:end_times AS timestamptz[]), CAST(:thresholds AS float8[])
+                ) AS v(cfg_id, end_time, threshold)
+                WHERE de.source_tag_config_id = v.cfg_id AND de.end_time IS NULL
+                RETURNING de.source_tag_config_id, de.id, de.machine_id, de.start_time,
+                          EXTRACT(EPOCH FROM de.end_time - de.start_time) AS seconds,
+                          de.reason_code_id IS NULL AND de.comments IS NULL AND NOT de.is_split
+                              AND de.end_time - de.start_time < v.threshold * INTERVAL '1 second' AS is_minor
+                """
+            ),
+            {
+                "cfg_ids": [row[0] for row in closes],
+                "end_times": [row[1] for row in closes],
+                "thresholds": [row[2] for row in closes],
+            },
+        )
+        short: list[int] = []
+        for cfg_id, event_id, machine_id, start_time, seconds, is_minor in result.fetchall():
+            closed[cfg_id] = event_id
+            if is_minor:
+                short.append(event_id)
+                minor.append((machine_id, start_time, float(seconds)))
+        if short:
+            await db.execute(text("DELETE FROM downtime_events WHERE id = ANY(:ids)"), {"ids": short})
+    if inserts:
+        # Don't open a second event for a config that already has one (opened
+        # elsewhere since the state was loaded); complete events always go in
+        result = await db.execute(
+            text(
+                """
+                INSERT INTO downtime_events
+                    (machine_id, start_time, end_time, source_tag_config_id, is_split, created_at)
+                SELECT v.machine_id, v.start_time, v.end_time, v.cfg_id, false, :now
+                FROM unnest(
+                    CAST(:cfg_ids AS integer[]), CAST(:machine_ids AS integer[]),
+                    CAST(:start_times AS timestamptz[]), CAST(:end_times AS timestamptz[])
+                ) AS v(cfg_id, machine_id, start_time, end_time)
+                WHERE v.end_time IS NOT NULL OR NOT EXISTS (
+                    SELECT 1 FROM downtime_events de
+                    WHERE de.source_tag_config_id = v.cfg_id AND de.end_time IS NULL
+                )
+                RETURNING source_tag_config_id, id, end_time
+                """
+            ),
+            {
+                "cfg_ids": [row[0] for row in inserts],
+                "machine_ids": [row[1] for row in inserts],
+                "start_times": [row[2] for row in inserts],
+                "end_times": [row[3] for row in inserts],
+                "now": now,
+            },
+        )
+        for cfg_id, event_id, end_time in result.fetchall():
+            if end_time is None:
+                opened[cfg_id] = event_id
+            else:
+                recorded += 1
+        missing = [row[0] for row in inserts if row[3] is None and row[0] not in opened]
+        if missing:
+            _state.events.update(await _load_open_events(db, missing))
+    if watermarks:
+        await db.execute(
+            text(
+                """
+                INSERT INTO tag_monitor_watermarks (config_id, last_sample_time, updated_at)
+                SELECT v.config_id, v.last_sample_time, :now
+                FROM unnest(CAST(:cfg_ids AS integer[]), CAST(:times AS timestamptz[]))
+                     AS v(config_id, last_sample_time)
+                ON CONFLICT (config_id) DO UPDATE SET
+                    last_sample_time = GREATEST(tag_monitor_watermarks.last_sample_time, EXCLUDED.last_sample_time),
+                    updated_at = EXCLUDED.updated_at
+                """
+            ),
+            {"cfg_ids": list(watermarks), "times": list(watermarks.values()), "now": now},
+        )
+    minor_totals = await _count_minor_stoppages(db, minor, now) if minor else []
+    return opened, closed, recorded, minor_totals
 
 
-def run_tag_monitor():
-    """Synchronous wrapper for APScheduler."""
-    asyncio.run(_run_tag_monitor())
+async def _count_minor_stoppages(
+    db: AsyncSession, minor: list[tuple[int, datetime, float]], now: datetime
+) -> list[tuple[int, datetime, int, float]]:
+    """Add minor stoppages to their machine-window totals; returns the new totals."""
+    interval = settings.OEE_CALC_INTERVAL_SECONDS
+    batch: dict[tuple[int, datetime], list] = {}
+    for machine_id, start, seconds in minor:
+        entry = batch.setdefault((machine_id, align_down(start, interval)), [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+    result = await db.execute(
+        text(
+            """
+            INSERT INTO minor_stoppages (machine_id, window_start, stop_count, stop_seconds, updated_at)
+            SELECT v.machine_id, v.window_start, v.stop_count, v.stop_seconds, :now
+            FROM unnest(
+                CAST(:machine_ids AS integer[]), CAST(:window_starts AS timestamptz[]),
+                CAST(:counts AS integer[]), CAST(:seconds AS float8[])
+            ) AS v(machine_id, window_start, stop_count, stop_seconds)
+            ON CONFLICT (machine_id, window_start) DO UPDATE SET
+                stop_count = minor_stoppages.stop_count + EXCLUDED.stop_count,
+                stop_seconds = minor_stoppages.stop_seconds + EXCLUDED.stop_seconds,
+                updated_at = EXCLUDED.updated_at
+            RETURNING machine_id, window_start, stop_count, stop_seconds
+            """
+        ),
+        {
+            "machine_ids": [key[0] for key in batch],
+            "window_starts": [key[1] for key in batch],
+            "counts": [entry[0] for entry in batch.values()],
+            "seconds": [entry[1] for entry in batch.values()],
+            "now": now,
+        },
+    )
+    return [(row[0], row[1], row[2], row[3]) for row in result.fetchall()]
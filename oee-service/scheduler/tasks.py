@@ -1,6 +1,12 @@
-"""APScheduler job definitions for the OEE calculation service."""
+"""APScheduler job definitions for the OEE calculation service.
+
+Jobs run as coroutines on the service's single, long-lived event loop, so the
+asyncpg pool and InfluxDB client created here are shared by every tick.
+"""
 import asyncio
 import logging
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from functools import lru_cache
 
@@ -8,8 +14,37 @@ from influxdb_client_3 import InfluxDBClient3
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
+from calculator.counters import CounterState, WindowCounts, compute_window_counts
+from calculator.downtime_overlap import DowntimeOverlap, compute_downtime_overlap
 from calculator.oee import run_oee_for_machine
+from calculator.product_runs import ProductRunIndex, sync_product_runs_from_tags
+from calculator.rollups import RollupStore
+from calculator.stoppages import StopSummary, minor_stoppage_threshold, query_fleet_stops
+from calculator.window_inputs import WindowInputs, query_fleet_inputs
 from config import settings
+from metrics import (
+    CYCLES_SKIPPED,
+    MACHINE_FAILURES,
+    SLOT_LAST_SECONDS,
+    SLOT_MACHINES,
+    STAGE_SECONDS,
+    WINDOWS_CALCULATED,
+    WINDOWS_PENDING,
+    record_cycle,
+)
+from scheduler.config_cache import ConfigCache
+from scheduler.shards import ShardManager
+from scheduler.stagger import assign_slots, due_slot, slot_loads, slot_step_seconds
+from scheduler.windows import (
+    Window,
+    latest_complete_window_end,
+    load_checkpoints,
+    load_counter_states,
+    pending_windows,
+    save_checkpoints,
+)
+from spool import CircuitBreaker, Spool
+from write_buffer import WriteBuffer
 
 logger = logging.getLogger(__name__)
 
@@ -20,53 +55,421 @@ _SessionLocal = None
 def get_engine():
     global _engine, _SessionLocal
     if _engine is None:
-        _engine = create_async_engine(settings.DATABASE_URL, pool_pre_ping=True)
+        # Size the pool so every concurrent machine calculation gets its own connection
+        _engine = create_async_engine(
+            settings.DATABASE_URL,
+            pool_pre_ping=True,
+            pool_size=max(settings.OEE_CALC_CONCURRENCY, 1),
+            max_overflow=5,
+            pool_recycle=1800,
+        )
         _SessionLocal = async_sessionmaker(_engine, class_=AsyncSession, expire_on_commit=False)
     return _engine, _SessionLocal
 
 
+async def dispose_engine() -> None:
+    global _engine, _SessionLocal
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
+        _SessionLocal = None
+
+
 @lru_cache(maxsize=1)
 def get_influx() -> InfluxDBClient3:
     return InfluxDBClient3(
         host=settings.INFLUXDB_URL,
         database=settings.INFLUXDB_DATABASE,
         token=settings.INFLUXDB_TOKEN if settings.INFLUXDB_TOKEN else None,
+        enable_gzip=settings.INFLUXDB_WRITE_GZIP,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_spool() -> Spool | None:
+    if not settings.OEE_SPOOL_DIR:
+        return None
+    return Spool(
+        settings.OEE_SPOOL_DIR,
+        max_bytes=settings.OEE_SPOOL_MAX_BYTES,
+        segment_bytes=settings.OEE_SPOOL_SEGMENT_BYTES,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_influx_breaker() -> CircuitBreaker:
+    return CircuitBreaker(max_seconds=settings.OEE_SPOOL_BACKOFF_MAX_SECONDS)
+
+
+def _results_buffer() -> WriteBuffer:
+    return WriteBuffer(
+        influx=get_influx(),
+        max_points=settings.INFLUXDB_WRITE_BATCH_POINTS,
+        max_bytes=settings.INFLUXDB_WRITE_BATCH_BYTES,
+        max_age_seconds=settings.INFLUXDB_WRITE_FLUSH_SECONDS,
+        spool=get_spool(),
+        breaker=get_influx_breaker(),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_write_buffer() -> WriteBuffer:
+    return _results_buffer()
+
+
+# Staggered slots write through their own buffers (sharing the spool and
+# breaker), so a slot's flush and error count only cover its own points
+_slot_write_buffers: dict[int, WriteBuffer] = {}
+
+
+def get_slot_write_buffer(slot: int) -> WriteBuffer:
+    if slot not in _slot_write_buffers:
+        _slot_write_buffers[slot] = _results_buffer()
+    return _slot_write_buffers[slot]
+
+
+def result_write_buffers() -> list[WriteBuffer]:
+    """Every buffer OEE results are written through."""
+    return [get_write_buffer(), *_slot_write_buffers.values()]
+
+
+@lru_cache(maxsize=1)
+def get_ingest_buffer() -> WriteBuffer:
+    """Buffer for raw tag samples pushed to the ingestion endpoint; shares the spool and breaker."""
+    return WriteBuffer(
+        influx=get_influx(),
+        max_points=settings.INFLUXDB_WRITE_BATCH_POINTS,
+        max_bytes=settings.INFLUXDB_WRITE_BATCH_BYTES,
+        max_age_seconds=settings.OEE_INGEST_FLUSH_SECONDS,
+        spool=get_spool(),
+        breaker=get_influx_breaker(),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_config_cache() -> ConfigCache:
+    return ConfigCache(full_reload_seconds=settings.CONFIG_CACHE_FULL_RELOAD_SECONDS)
+
+
+@lru_cache(maxsize=1)
+def get_shard_manager() -> ShardManager:
+    return ShardManager(
+        shard_count=settings.OEE_SHARD_COUNT,
+        heartbeat_seconds=settings.OEE_SHARD_HEARTBEAT_SECONDS,
     )
 
 
-async def _run_calculations():
-    """Fetch all machines from Postgres and calculate OEE for each."""
+@lru_cache(maxsize=1)
+def get_rollup_store() -> RollupStore:
+    return RollupStore()
+
+
+@lru_cache(maxsize=1)
+def get_product_run_index() -> ProductRunIndex:
+    return ProductRunIndex()
+
+
+async def run_calculations():
+    started = time.perf_counter()
+    try:
+        await _run_calculations()
+    finally:
+        record_cycle("oee_calc", time.perf_counter() - started, settings.OEE_CALC_INTERVAL_SECONDS)
+
+
+# Slots still calculating; a slow slot may overlap the next slot's tick
+_running_slots: set[int] = set()
+
+
+async def run_staggered_calculations():
+    """Calculate only the machines in the slot that is due (``OEE_STAGGER_SLOTS``)."""
+    interval = settings.OEE_CALC_INTERVAL_SECONDS
+    slots = settings.OEE_STAGGER_SLOTS
+    slot = due_slot(datetime.now(timezone.utc), interval, settings.OEE_CALC_LAG_SECONDS, slots)
+    if slot in _running_slots:
+        CYCLES_SKIPPED.inc(job="oee_calc")
+        logger.warning(f"OEE slot {slot} is still running from the previous interval; skipping this tick")
+        return
+
+    _running_slots.add(slot)
+    started = time.perf_counter()
+    try:
+        await _run_calculations(slot)
+    finally:
+        _running_slots.discard(slot)
+        elapsed = time.perf_counter() - started
+        SLOT_LAST_SECONDS.set(elapsed, slot=slot)
+        record_cycle("oee_calc", elapsed, slot_step_seconds(interval, slots))
+
+
+@dataclass
+class _CycleState:
+    """State loaded once per interval and shared by every slot calculated in it."""
+    window_end: datetime
+    machine_ids: list[int]
+    checkpoints: dict[int, datetime]
+    counter_states: dict[int, CounterState]
+
+
+_cycle: _CycleState | None = None
+_cycle_lock = asyncio.Lock()
+
+
+async def _load_cycle(latest_end: datetime) -> _CycleState | None:
+    """Load machines, configs, checkpoints, rollups and product runs for the interval ending ``latest_end``.
+
+    The first run in an interval loads; staggered slots running later in the
+    same interval reuse it.  Returns None (and caches nothing) on failure.
+    """
+    global _cycle
+    async with _cycle_lock:
+        if _cycle is not None and _cycle.window_end == latest_end:
+            return _cycle
+
+        _, SessionLocal = get_engine()
+        influx = get_influx()
+        config_cache = get_config_cache()
+        shards = get_shard_manager()
+        rollups = get_rollup_store()
+        product_runs = get_product_run_index()
+        interval = settings.OEE_CALC_INTERVAL_SECONDS
+
+        async with SessionLocal() as db, STAGE_SECONDS.time(job="oee_calc", stage="load"):
+            try:
+                result = await db.execute(text("SELECT id FROM machines ORDER BY id"))
+                # Only the machines in shards this replica currently holds
+                machine_ids = [row[0] for row in result.fetchall() if shards.owns(row[0])]
+                await config_cache.refresh(db)
+                await rollups.refresh_calendar(db)
+                checkpoints = await load_checkpoints(db)
+                counter_states = await load_counter_states(db)
+            except Exception as e:
+                logger.error(f"Failed to fetch machines, configs or checkpoints: {e}")
+                return None
+
+        # Shift/day totals of machines this replica just took on, from their stored windows
+        try:
+            rollup_since = latest_end - timedelta(hours=settings.OEE_CATCHUP_LOOKBACK_HOURS + 48)
+            await asyncio.to_thread(rollups.sync_machines, influx, machine_ids, rollup_since, interval)
+        except Exception as e:
+            logger.error(f"Failed to load stored windows for rollups: {e}")
+            return None
+
+        # Product changes for every owned machine, whichever slot it is in
+        horizon = latest_end - timedelta(hours=settings.OEE_CATCHUP_LOOKBACK_HOURS)
+        async with SessionLocal() as db, STAGE_SECONDS.time(job="oee_calc", stage="product_runs"):
+            try:
+                await product_runs.refresh(db, horizon)
+                opened, synced = await sync_product_runs_from_tags(db, influx, product_runs, machine_ids, horizon)
+                if opened:
+                    await db.commit()
+                    await product_runs.refresh(db, horizon)
+                # Only once the runs are committed, so a failed commit re-reads the samples
+                product_runs.tag_watermarks.update(synced)
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Failed to load product runs: {e}")
+
+        _cycle = _CycleState(latest_end, machine_ids, checkpoints, counter_states)
+        return _cycle
+
+
+async def _run_calculations(slot: int | None = None):
+    """Calculate every owed, interval-aligned window for every machine.
+
+    Normally that is just the latest window.  After an outage each machine's
+    checkpoint lags behind and the missed windows are processed oldest first,
+    ``OEE_CATCHUP_CONCURRENCY`` windows at a time.  A machine's checkpoint only
+    advances over a contiguous run of windows that were calculated and written.
+    With ``slot`` set, only the machines staggered into that slot are calculated,
+    written through the slot's own buffer.
+    """
     _, SessionLocal = get_engine()
     influx = get_influx()
+    write_buffer = get_write_buffer() if slot is None else get_slot_write_buffer(slot)
+    config_cache = get_config_cache()
+    shards = get_shard_manager()
+    rollups = get_rollup_store()
+    product_runs = get_product_run_index()
+
+    interval = settings.OEE_CALC_INTERVAL_SECONDS
+    latest_end = latest_complete_window_end(
+        datetime.now(timezone.utc), interval, settings.OEE_CALC_LAG_SECONDS
+    )
+    cycle = await _load_cycle(latest_end)
+    if cycle is None:
+        return
+    # Checkpoints saved below update these too, for later runs in the interval
+    checkpoints, counter_states = cycle.checkpoints, cycle.counter_states
+    machine_ids = cycle.machine_ids
 
-    window_end = datetime.now(timezone.utc)
-    window_start = window_end - timedelta(seconds=settings.OEE_CALC_INTERVAL_SECONDS)
+    # Only query InfluxDB for this slot's machines when staggered
+    machine_filter = None
+    if slot is not None:
+        assignment = assign_slots(machine_ids, settings.OEE_STAGGER_SLOTS)
+        for other_slot, count in slot_loads(assignment, settings.OEE_STAGGER_SLOTS).items():
+            SLOT_MACHINES.set(count, slot=other_slot)
+        machine_ids = [m for m in machine_ids if assignment[m] == slot]
+    # Shards may have moved since the interval's state was loaded
+    machine_ids = [m for m in machine_ids if shards.owns(m)]
+    if slot is not None:
+        machine_filter = machine_ids
 
-    async with SessionLocal() as db:
+    # Window → machines that still owe it
+    owed: dict[Window, list[int]] = {}
+    for machine_id in machine_ids:
+        for window in pending_windows(
+            checkpoints.get(machine_id), latest_end, interval, settings.OEE_CATCHUP_LOOKBACK_HOURS * 3600
+        ):
+            owed.setdefault(window, []).append(machine_id)
+    windows = sorted(owed)
+    if len(windows) > 1:
+        logger.info(f"Catching up {len(windows)} windows from {windows[0][0].isoformat()}")
+
+    # Excluded-category downtime for every owed machine-window in one query
+    windows_by_machine: dict[int, list[Window]] = {}
+    for window in windows:
+        for machine_id in owed[window]:
+            windows_by_machine.setdefault(machine_id, []).append(window)
+    excluded_by_machine = {
+        machine_id: set((config_cache.get(machine_id).availability or {}).get("excluded_category_ids") or [])
+        for machine_id in windows_by_machine
+    }
+    async with SessionLocal() as db, STAGE_SECONDS.time(job="oee_calc", stage="downtime_query"):
         try:
-            result = await db.execute(text("SELECT id FROM machines ORDER BY id"))
-            machine_ids = [row[0] for row in result.fetchall()]
+            downtime = await compute_downtime_overlap(db, windows_by_machine, excluded_by_machine)
         except Exception as e:
-            logger.error(f"Failed to fetch machines: {e}")
+            logger.error(f"Failed to load downtime events: {e}")
             return
 
-    for machine_id in machine_ids:
-        async with SessionLocal() as db:
-            try:
-                await run_oee_for_machine(
-                    db=db,
-                    influx=influx,
-                    influx_db=settings.INFLUXDB_DATABASE,
-                    machine_id=machine_id,
-                    window_start=window_start,
-                    window_end=window_end,
+    # Part counts from counter deltas, reading only samples after each machine's watermark
+    try:
+        with STAGE_SECONDS.time(job="oee_calc", stage="count_query"):
+            counts = await asyncio.to_thread(
+                compute_window_counts,
+                influx,
+                windows_by_machine,
+                counter_states,
+                settings.PRODUCTION_COUNTER_MAX,
+                settings.OEE_CATCHUP_LOOKBACK_HOURS * 3600,
+            )
+    except Exception as e:
+        logger.error(f"InfluxDB production counter query failed: {e}")
+        return
+
+    # Stops shorter than these are minor stoppages (performance, not availability, loss)
+    minor_thresholds = {
+        machine_id: minor_stoppage_threshold(config_cache.get(machine_id)) for machine_id in windows_by_machine
+    }
+
+    semaphore = asyncio.Semaphore(max(settings.OEE_CALC_CONCURRENCY, 1))
+    blocked: set[int] = set()  # machines with a failed window this run
+
+    async def _calculate_window(window: Window, window_machine_ids: list[int]) -> set[int]:
+        window_start, window_end = window
+        if not window_machine_ids:
+            return set()
+        try:
+            # One state query for the whole fleet, fanned out below
+            with STAGE_SECONDS.time(job="oee_calc", stage="state_query"):
+                fleet_inputs = await asyncio.to_thread(
+                    query_fleet_inputs, influx, window_start, window_end, machine_filter
                 )
+            with STAGE_SECONDS.time(job="oee_calc", stage="stop_query"):
+                stops = await asyncio.to_thread(
+                    query_fleet_stops, influx, window_start, window_end, interval, minor_thresholds
+                )
+        except Exception as e:
+            logger.error(f"InfluxDB fleet query failed for window ending {window_end.isoformat()}: {e}")
+            return set()
+
+        succeeded: set[int] = set()
+
+        async def _calculate(machine_id: int) -> None:
+            # Each machine gets its own session so a failure only rolls back its own work
+            async with semaphore, SessionLocal() as db:
+                try:
+                    inputs = fleet_inputs.get(str(machine_id), WindowInputs())
+                    window_counts = counts.get((machine_id, window_end), WindowCounts())
+                    inputs.total_parts = window_counts.total_parts
+                    inputs.reject_parts = window_counts.reject_parts
+                    await run_oee_for_machine(
+                        db=db,
+                        influx=influx,
+                        influx_db=settings.INFLUXDB_DATABASE,
+                        machine_id=machine_id,
+                        window_start=window_start,
+                        window_end=window_end,
+                        inputs=inputs,
+                        write_buffer=write_buffer,
+                        configs=config_cache.get(machine_id),
+                        rollups=rollups,
+                        product_segments=product_runs.segments(machine_id, window_start, window_end),
+                        downtime=downtime.get((machine_id, window_end), DowntimeOverlap()),
+                        stops=stops.get((str(machine_id), window_end), StopSummary()),
+                    )
+                    await db.commit()
+                    succeeded.add(machine_id)
+                    WINDOWS_CALCULATED.inc()
+                except Exception as e:
+                    await db.rollback()
+                    MACHINE_FAILURES.inc(machine_id=machine_id)
+                    logger.error(f"OEE calculation failed for machine {machine_id}: {e}")
+
+        await asyncio.gather(*(_calculate(machine_id) for machine_id in window_machine_ids))
+        return succeeded
+
+    batch_size = max(settings.OEE_CATCHUP_CONCURRENCY, 1)
+    completed = 0
+    for i in range(0, len(windows), batch_size):
+        batch = windows[i:i + batch_size]
+        errors_before = write_buffer.error_count
+        results = await asyncio.gather(*(
+            _calculate_window(window, [m for m in owed[window] if m not in blocked])
+            for window in batch
+        ))
+        with STAGE_SECONDS.time(job="oee_calc", stage="flush"):
+            await write_buffer.flush()
+        if write_buffer.error_count != errors_before:
+            logger.error("OEE results could not be written; checkpoints not advanced, will retry next cycle")
+            break
+
+        # Batch windows are in time order: advance each machine up to its first failure
+        advanced: dict[int, datetime] = {}
+        for window, succeeded in zip(batch, results):
+            for machine_id in owed[window]:
+                if machine_id in blocked:
+                    continue
+                if machine_id in succeeded:
+                    advanced[machine_id] = window[1]
+                else:
+                    blocked.add(machine_id)
+
+        async with SessionLocal() as db, STAGE_SECONDS.time(job="oee_calc", stage="checkpoint_save"):
+            try:
+                states = {
+                    machine_id: counts[(machine_id, end)].state
+                    for machine_id, end in advanced.items()
+                    if (machine_id, end) in counts and counts[(machine_id, end)].state is not None
+                }
+                await save_checkpoints(db, advanced, states)
                 await db.commit()
+                checkpoints.update(advanced)
+                counter_states.update(states)
             except Exception as e:
                 await db.rollback()
-                logger.error(f"OEE calculation failed for machine {machine_id}: {e}")
+                logger.error(f"Failed to save OEE checkpoints: {e}")
+                break
+        completed += len(batch)
 
+    WINDOWS_PENDING.set(len(windows) - completed)
 
-def run_calculations():
-    """Synchronous wrapper for the APScheduler job."""
-    asyncio.run(_run_calculations())
+    # Periods older than the catch-up horizon can no longer receive windows
+    rollups.prune(latest_end - timedelta(hours=settings.OEE_CATCHUP_LOOKBACK_HOURS + 48))
+
+    logger.info(
+        f"OEE cycle complete{f' (slot {slot})' if slot is not None else ''}: {completed}/{len(windows)} windows, {len(machine_ids)} machines, "
+        f"{write_buffer.flush_count} batch writes so far, "
+        f"last flush {write_buffer.last_flush_points} points in "
+        f"{write_buffer.last_flush_seconds * 1000:.1f} ms"
+    )
@@ -0,0 +1,111 @@
+"""Interval-aligned calculation windows and per-machine checkpoints.
+
+Windows are aligned to multiples of the calculation interval since the Unix
+epoch, so every run produces the same boundaries regardless of scheduler
+jitter.  ``oee_calc_checkpoints`` records the end of the last window that was
+completed for each machine; anything after it (up to the lookback limit) is
+still owed and is processed oldest first.  It also records the last
+``production_count`` sample seen up to that point, the baseline for the next
+window's counter deltas.
+"""
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from calculator.counters import CounterState
+
+Window = tuple[datetime, datetime]
+
+
+def align_down(ts: datetime, interval_seconds: int) -> datetime:
+    """Floor a timestamp to the nearest interval boundary."""
+    epoch = int(ts.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % interval_seconds, tz=timezone.utc)
+
+
+def latest_complete_window_end(now: datetime, interval_seconds: int, lag_seconds: int) -> datetime:
+    """End of the newest window whose data has had ``lag_seconds`` to arrive."""
+    return align_down(now - timedelta(seconds=lag_seconds), interval_seconds)
+
+
+def pending_windows(
+    last_end: datetime | None,
+    latest_end: datetime,
+    interval_seconds: int,
+    lookback_seconds: int,
+) -> list[Window]:
+    """Windows after ``last_end`` up to and including the one ending at ``latest_end``.
+
+    Machines without a checkpoint start from the latest window only; gaps
+    older than the lookback are left to the recalculation job.
+    """
+    step = timedelta(seconds=interval_seconds)
+    earliest = latest_end - timedelta(seconds=lookback_seconds)
+    if last_end is None:
+        start = latest_end - step
+    else:
+        start = max(align_down(last_end, interval_seconds), align_down(earliest, interval_seconds))
+
+    windows: list[Window] = []
+    while start + step <= latest_end:
+        windows.append((start, start + step))
+        start += step
+    return windows
+
+
+async def load_checkpoints(db: AsyncSession) -> dict[int, datetime]:
+    result = await db.execute(text("SELECT machine_id, last_window_end FROM oee_calc_checkpoints"))
+    return {row[0]: row[1] for row in result.fetchall()}
+
+
+async def load_counter_states(db: AsyncSession) -> dict[int, CounterState]:
+    result = await db.execute(
+        text(
+            "SELECT machine_id, counter_time, counter_total, counter_reject FROM oee_calc_checkpoints "
+            "WHERE counter_time IS NOT NULL"
+        )
+    )
+    return {row[0]: CounterState(row[1], int(row[2] or 0), int(row[3] or 0)) for row in result.fetchall()}
+
+
+async def save_checkpoints(
+    db: AsyncSession,
+    window_ends: dict[int, datetime],
+    counter_states: dict[int, CounterState] | None = None,
+) -> None:
+    """Advance checkpoints; never moves a checkpoint (or its counter watermark) backwards."""
+    if not window_ends:
+        return
+    counter_states = counter_states or {}
+    rows = []
+    for mid, end in window_ends.items():
+        state = counter_states.get(mid)
+        rows.append({
+            "mid": mid,
+            "end": end,
+            "ctime": state.time if state else None,
+            "ctotal": state.total if state else None,
+            "creject": state.reject if state else None,
+        })
+    # Counter columns only move with a checkpoint that is at least as new
+    newer = (
+        "EXCLUDED.counter_time IS NOT NULL "
+        "AND EXCLUDED.last_window_end >= oee_calc_checkpoints.last_window_end"
+    )
+    counter_updates = ", ".join(
+        f"{col} = CASE WHEN {newer} THEN EXCLUDED.{col} ELSE oee_calc_checkpoints.{col} END"
+        for col in ("counter_time", "counter_total", "counter_reject")
+    )
+    await db.execute(
+        text(
+            "INSERT INTO oee_calc_checkpoints "
+            "(machine_id, last_window_end, counter_time, counter_total, counter_reject, updated_at) "
+            "VALUES (:mid, :end, :ctime, :ctotal, :creject, now()) "
+            "ON CONFLICT (machine_id) DO UPDATE SET "
+            f"{counter_updates}, "
+            "last_window_end = GREATEST(oee_calc_checkpoints.last_window_end, EXCLUDED.last_window_end), "
+            "updated_at = EXCLUDED.updated_at"
+        ),
+        rows,
+    )
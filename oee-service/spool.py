@@ -0,0 +1,252 @@
+"""Durable on-disk spool for line-protocol batches InfluxDB did not accept.
+
+When a batch write fails (or the circuit breaker says InfluxDB is down), the
+write buffer appends the batch to an append-only segment file instead of
+dropping it.  A background drainer replays segments oldest first once
+InfluxDB recovers; replays are idempotent because every point carries its
+original timestamp.  Until the spool is empty the write buffer appends new
+batches here too, so points rewritten at the same timestamp land in order.
+
+Each record is ``>IIQ`` (payload length, CRC-32, append time in ms) followed
+by the newline-joined batch.  Segments are fsynced on every append and read
+back through ``mmap``; a torn record at the end of a segment (crash during
+append) fails its CRC check and is skipped.  The spool is bounded: once
+``max_bytes`` is reached new batches are refused, so the calculation job does
+not advance its checkpoints and recomputes those windows on catch-up instead.
+"""
+import asyncio
+import logging
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">IIQ")
+
+
+class SpoolFull(Exception):
+    pass
+
+
+class Spool:
+    def __init__(self, directory: str, max_bytes: int = 512_000_000, segment_bytes: int = 16_000_000):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+
+        self._lock = threading.Lock()
+        # Segments left by a previous run are all closed and replayed first
+        self._segments: list[Path] = sorted(self.directory.glob("seg-*.lp"))
+        self._bytes = sum(p.stat().st_size for p in self._segments)
+        self._next_seq = int(self._segments[-1].stem[4:]) + 1 if self._segments else 0
+        self._active = None
+        self._active_path: Path | None = None
+        # Replay position inside the segment being drained
+        self._drain_path: Path | None = None
+        self._drain_offset = 0
+
+        self.spooled_batches = 0
+        self.replayed_batches = 0
+        if self._segments:
+            logger.warning(f"Spool: {len(self._segments)} segments ({self._bytes} bytes) left to replay")
+
+    # ── Append ────────────────────────────────────────────────────────────────
+    def append(self, lines: list[str]) -> None:
+        payload = "\n".join(lines).encode()
+        record = _HEADER.pack(len(payload), zlib.crc32(payload), int(time.time() * 1000)) + payload
+        with self._lock:
+            if self._bytes + len(record) > self.max_bytes:
+                raise SpoolFull(f"spool is full ({self._bytes} of {self.max_bytes} bytes)")
+            if self._active is None or self._active.tell() >= self.segment_bytes:
+                self._rotate()
+            self._active.write(record)
+            self._active.flush()
+            os.fsync(self._active.fileno())
+            self._bytes += len(record)
+            self.spooled_batches += 1
+
+    def _rotate(self) -> None:
+        if self._active is not None:
+            self._active.close()
+        path = self.directory / f"seg-{self._next_seq:012d}.lp"
+        self._next_seq += 1
+        self._active = open(path, "ab")
+        self._active_path = path
+        self._segments.append(path)
+
+    # ── Replay ────────────────────────────────────────────────────────────────
+    def _oldest_closed(self) -> Path | None:
+        """Oldest segment, closing the active one if it is the only one with data."""
+        with self._lock:
+            if not self._segments:
+                return None
+            oldest = self._segments[0]
+            if oldest == self._active_path:
+                if self._active.tell() == 0:
+                    return None
+                self._active.close()
+                self._active = None
+                self._active_path = None
+            return oldest
+
+    def _remove(self, path: Path) -> None:
+        with self._lock:
+            size = path.stat().st_size
+            path.unlink()
+            self._segments.remove(path)
+            self._bytes -= size
+
+    def replay_oldest(self, write: Callable[[str], None]) -> int:
+        """Write every record of the oldest segment, then delete it.
+
+        Raises on the first failed write; the next call resumes from that
+        record.  Returns the number of batches replayed.
+        """
+        path = self._oldest_closed()
+        if path is None:
+            return 0
+        if path != self._drain_path:
+            self._drain_path, self._drain_offset = path, 0
+
+        replayed = 0
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    offset = self._drain_offset
+                    while offset + _HEADER.size <= size:
+                        length, crc, _ = _HEADER.unpack_from(data, offset)
+                        start = offset + _HEADER.size
+                        payload = data[start:start + length]
+                        if len(payload) < length or zlib.crc32(payload) != crc:
+                            logger.warning(f"Spool: skipping torn record at {path.name}:{offset}")
+                            break
+                        write(payload.decode())
+                        offset = start + length
+                        self._drain_offset = offset
+                        replayed += 1
+                        self.replayed_batches += 1
+
+        self._remove(path)
+        self._drain_path, self._drain_offset = None, 0
+        return replayed
+
+    # ── Stats ─────────────────────────────────────────────────────────────────
+    def is_empty(self) -> bool:
+        """True once every spooled batch has been replayed."""
+        with self._lock:
+            return self._bytes == 0
+
+    def stats(self) -> tuple[int, int, float]:
+        """Return (bytes, segments, age in seconds of the oldest record)."""
+        with self._lock:
+            if not self._segments or self._bytes == 0:
+                return 0, len(self._segments), 0.0
+            try:
+                with open(self._segments[0], "rb") as f:
+                    f.seek(self._drain_offset if self._segments[0] == self._drain_path else 0)
+                    header = f.read(_HEADER.size)
+            except OSError:
+                header = b""
+            age = 0.0
+            if len(header) == _HEADER.size:
+                age = max(time.time() - _HEADER.unpack(header)[2] / 1000, 0.0)
+            return self._bytes, len(self._segments), age
+
+    def close(self) -> None:
+        with self._lock:
+            if self._active is not None:
+                self._active.close()
+                self._active = None
+                self._active_path = None
+
+
+class CircuitBreaker:
+    """Stops write attempts after repeated InfluxDB failures.
+
+    After ``threshold`` consecutive failures the breaker opens for a jittered,
+    exponentially growing backoff (up to ``max_seconds``).  Once that expires
+    the breaker is half-open: the first ``allow()`` claims a single trial write
+    and every other caller is refused until ``success()`` or ``failure()``
+    settles it (or ``release()`` hands the trial back unused).
+    """
+
+    def __init__(self, threshold: int = 3, base_seconds: float = 1.0, max_seconds: float = 300.0):
+        self.threshold = threshold
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._backoff = base_seconds
+        self._open_until: float | None = None
+        self._trial = False
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._open_until is not None and (self._trial or time.monotonic() < self._open_until)
+
+    def allow(self) -> bool:
+        """True if a write may be attempted; claims the trial while half-open."""
+        with self._lock:
+            if self._open_until is None:
+                return True
+            if self._trial or time.monotonic() < self._open_until:
+                return False
+            self._trial = True
+            return True
+
+    def release(self) -> None:
+        """Give back a claimed trial without a verdict (nothing was written)."""
+        with self._lock:
+            self._trial = False
+
+    def success(self) -> None:
+        with self._lock:
+            if self._open_until is not None:
+                logger.info("InfluxDB writes recovered; circuit closed")
+            self._failures = 0
+            self._backoff = self.base_seconds
+            self._open_until = None
+            self._trial = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial = False
+            if self._failures < self.threshold:
+                return
+            delay = self._backoff * random.uniform(0.5, 1.0)
+            self._open_until = time.monotonic() + delay
+            self._backoff = min(self._backoff * 2, self.max_seconds)
+            logger.warning(f"InfluxDB writes failing; circuit open for {delay:.1f}s")
+
+
+async def drain_spool(spool: Spool, write: Callable[[str], None], breaker: CircuitBreaker, idle_seconds: float = 5.0):
+    """Replay spooled batches, oldest segment first, whenever the breaker allows writes."""
+    while True:
+        if not breaker.allow():
+            await asyncio.sleep(1.0)
+            continue
+        try:
+            replayed = await asyncio.to_thread(spool.replay_oldest, write)
+        except Exception as e:
+            breaker.failure()
+            logger.warning(f"Spool: replay failed, will retry: {e}")
+            await asyncio.sleep(1.0)
+            continue
+        if replayed:
+            breaker.success()
+            logger.info(f"Spool: replayed {replayed} batches")
+            continue
+        breaker.release()
+        if not spool.stats()[0]:
+            await asyncio.sleep(idle_seconds)
@@ -0,0 +1,94 @@
+import re
+from datetime import datetime, timedelta, timezone
+
+from calculator.counters import CounterState, compute_window_counts, counter_delta
+
+T0 = datetime(2025, 10, 9, 8, 0, tzinfo=timezone.utc)
+WEEK = 7 * 86400
+
+
+class FakeInflux:
+    """Answers the production_count query from a fixed list of samples."""
+
+    def __init__(self, rows: list[tuple[int, datetime, int | None, int | None]]):
+        self.rows = rows
+        self.queries: list[str] = []
+
+    def query(self, sql: str):
+        self.queries.append(sql)
+        since, until = (datetime.fromisoformat(t) for t in re.findall(r"time [><] '([^']+)'", sql))
+        rows = [r for r in self.rows if since < r[1] < until]
+        return _Table({
+            "machine_id": [str(r[0]) for r in rows],
+            "time": [r[1] for r in rows],
+            "total_count": [r[2] for r in rows],
+            "reject_count": [r[3] for r in rows],
+        })
+
+    def scan_start(self) -> datetime:
+        return datetime.fromisoformat(re.search(r"time > '([^']+)'", self.queries[-1]).group(1))
+
+
+class _Table:
+    def __init__(self, data: dict):
+        self.data = data
+
+    def to_pydict(self) -> dict:
+        return self.data
+
+
+def _windows(start: datetime, count: int, minutes: int = 5) -> list[tuple[datetime, datetime]]:
+    step = timedelta(minutes=minutes)
+    return [(start + i * step, start + (i + 1) * step) for i in range(count)]
+
+
+def test_counter_delta():
+    assert counter_delta(10, 15) == 5
+    assert counter_delta(65530, 4, counter_max=65535) == 10
+    assert counter_delta(500, 20, counter_max=65535) == 20
+    assert counter_delta(500, 20) == 20
+
+
+def test_deltas_land_in_the_window_of_the_later_sample():
+    windows = _windows(T0, 2)
+    influx = FakeInflux([
+        (1, T0 + timedelta(minutes=1), 100, 2),
+        (1, T0 + timedelta(minutes=3), 110, 3),
+        (1, T0 + timedelta(minutes=6), 5, None),
+    ])
+    counts = compute_window_counts(influx, {1: windows}, {1: CounterState(T0, 90, 2)})
+
+    first, second = counts[(1, windows[0][1])], counts[(1, windows[1][1])]
+    assert (first.total_parts, first.reject_parts) == (20, 1)
+    # A reset counts from zero; a null reject keeps the previous value
+    assert (second.total_parts, second.reject_parts) == (5, 0)
+    assert second.state == CounterState(T0 + timedelta(minutes=6), 5, 3)
+
+
+def test_idle_machine_watermark_advances_between_cycles():
+    busy, idle = 1, 2
+    stale = T0 - timedelta(days=3)
+    states = {busy: CounterState(T0, 0, 0), idle: CounterState(stale, 40, 1)}
+    influx = FakeInflux([(busy, T0 + timedelta(minutes=m), m, 0) for m in range(1, 30)])
+
+    first_cycle = _windows(T0, 3)
+    counts = compute_window_counts(influx, {busy: first_cycle, idle: first_cycle}, states, lookback_seconds=WEEK)
+    assert influx.scan_start() == stale
+
+    last_end = first_cycle[-1][1]
+    carried = counts[(idle, last_end)]
+    assert (carried.total_parts, carried.state) == (0, CounterState(last_end, 40, 1))
+
+    # The next cycle resumes from the windows just completed, not the idle machine's last sample
+    states = {mid: counts[(mid, last_end)].state for mid in (busy, idle)}
+    next_cycle = _windows(last_end, 3)
+    compute_window_counts(influx, {busy: next_cycle, idle: next_cycle}, states, lookback_seconds=WEEK)
+    assert influx.scan_start() == min(states[busy].time, last_end)
+    assert influx.scan_start() > T0
+
+
+def test_lookback_bounds_the_scan():
+    states = {1: CounterState(T0 - timedelta(days=30), 0, 0)}
+    influx = FakeInflux([])
+    compute_window_counts(influx, {1: _windows(T0, 1)}, states, lookback_seconds=3600)
+    assert influx.scan_start() == T0 - timedelta(hours=1)
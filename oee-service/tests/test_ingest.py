@@ -0,0 +1,283 @@
+"""Parsers, WebSocket framing and request limits of the ingestion endpoint, without a socket."""
+import asyncio
+import gzip
+import os
+import struct
+
+import pytest
+
+from config import settings
+from ingest import server
+from ingest.protocol import ProtocolError, parse_json, parse_line_protocol
+
+RECEIVED_NS = 1_760_000_000_000_000_000
+LIMIT = settings.OEE_INGEST_MAX_BODY_BYTES
+
+
+def _reader(data: bytes) -> asyncio.StreamReader:
+    reader = asyncio.StreamReader(limit=server.MAX_HEADER_BYTES)
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+class _Writer:
+    """Collects what the server writes back."""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data: bytes) -> None:
+        self.data += data
+
+    async def drain(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def _run(read, data: bytes, *args):
+    """Run a server reader coroutine over ``data`` (the stream needs a running loop)."""
+
+    async def run():
+        return await read(_reader(data), *args)
+
+    return asyncio.run(run())
+
+
+def _status(read, data: bytes, *args) -> str:
+    """The _HTTPError status a reader raises, or "" if it returned."""
+    try:
+        _run(read, data, *args)
+    except server._HTTPError as e:
+        return e.status
+    return ""
+
+
+def _serve(request: bytes) -> bytes:
+    """Run one connection through the full handler and return the response bytes."""
+    writer = _Writer()
+    _run(server._handle, request, writer)
+    return bytes(writer.data)
+
+
+def _client_frame(opcode: int, payload: bytes, fin: bool = True, masked: bool = True, rsv: int = 0) -> bytes:
+    """A frame as a client sends it (masked), for feeding to ``_read_frame``."""
+    first = (0x80 if fin else 0) | rsv | opcode
+    mask_bit = 0x80 if masked else 0
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", first, mask_bit | length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", first, mask_bit | 126, length)
+    else:
+        header = struct.pack("!BBQ", first, mask_bit | 127, length)
+    if not masked:
+        return header + payload
+    mask = os.urandom(4)
+    return header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+
+def _read_frame(data: bytes) -> tuple[bool, int, bytes]:
+    return _run(server._read_frame, data)
+
+
+# ── Line protocol ─────────────────────────────────────────────────────────────
+def test_line_protocol():
+    body = "\n".join([
+        r'plc\ tags,machine_id=3,line=A\,1 running=true,speed=12.5,count=42i,state="RUN, fast" 1760000000',
+        "# comment",
+        "",
+        "plc,machine_id=3 running=0i",
+        "plc,machine_id=3",
+        "plc,machine_id=3 running=1i notatime",
+        'plc,machine_id=3 state="open',
+        "plc,badtag running=1i",
+    ])
+    samples, errors = parse_line_protocol(body, "s", RECEIVED_NS)
+    assert len(samples) == 2
+    assert len(errors) == 4
+    assert errors[0].startswith("line 5:")
+
+    first, second = samples
+    assert first.measurement == "plc tags"
+    assert first.tags == {"machine_id": "3", "line": "A,1"}
+    assert first.fields == {"running": True, "speed": 12.5, "count": 42, "state": "RUN, fast"}
+    assert first.time_ns == 1_760_000_000 * 10**9
+    assert first.line.endswith(f" {1_760_000_000 * 10**9}")
+    assert second.time_ns == RECEIVED_NS
+
+    with pytest.raises(ProtocolError):
+        parse_line_protocol("plc running=1i", "h", RECEIVED_NS)
+
+
+# ── JSON ──────────────────────────────────────────────────────────────────────
+def test_json():
+    samples, errors = parse_json(
+        [
+            {"measurement": "plc", "tags": {"machine_id": 3}, "fields": {"running": True}, "time": 1760000000000},
+            {"measurement": "plc", "tags": {"machine_id": "3"}, "fields": {"v": 1.5}, "time": "2025-10-09T08:53:20Z"},
+            {"measurement": "plc, x", "fields": {"a b": "c\"d"}},
+            {"measurement": "plc", "fields": {"v": None}},
+            {"fields": {"v": 1}},
+            "not an object",
+            {"measurement": "plc", "fields": {"v": 1}, "time": "yesterday"},
+        ],
+        "ms",
+        RECEIVED_NS,
+    )
+    assert len(samples) == 3
+    assert len(errors) == 4
+    assert samples[0].tags == {"machine_id": "3"}
+    assert samples[0].time_ns == 1_760_000_000_000 * 10**6
+    assert samples[1].time_ns == 1_760_000_000 * 10**9
+    assert samples[2].time_ns == RECEIVED_NS
+
+    # The forwarded line must parse back to the same sample
+    (reparsed,), errs = parse_line_protocol(samples[2].line, "ns", 0)
+    assert not errs
+    assert (reparsed.measurement, reparsed.fields) == (samples[2].measurement, samples[2].fields)
+
+
+# ── WebSocket framing ─────────────────────────────────────────────────────────
+@pytest.mark.parametrize("length", [0, 1, 125, 126, 65535, 65536])
+def test_frame_round_trip(length):
+    payload = os.urandom(length)
+    assert _read_frame(_client_frame(server._BINARY, payload)) == (True, server._BINARY, payload)
+
+    frame = server._frame(server._TEXT, payload)
+    header = 2 if length < 126 else 4 if length < 1 << 16 else 10
+    assert len(frame) == header + length and frame[0] == 0x81
+
+
+def test_continuation_flag_read():
+    fin, _, _ = _read_frame(_client_frame(server._TEXT, b"part", fin=False))
+    assert fin is False
+
+
+@pytest.mark.parametrize(
+    "frame",
+    [
+        pytest.param(_client_frame(server._TEXT, b"x", masked=False), id="unmasked"),
+        pytest.param(_client_frame(server._TEXT, b"x", rsv=0x40), id="reserved-bit"),
+        pytest.param(_client_frame(0x3, b"x"), id="unknown-opcode"),
+        pytest.param(_client_frame(server._PING, b"x" * 126), id="long-control-frame"),
+        pytest.param(_client_frame(server._PING, b"x", fin=False), id="fragmented-control-frame"),
+    ],
+)
+def test_invalid_frames_rejected(frame):
+    with pytest.raises(ProtocolError):
+        _read_frame(frame)
+
+
+def test_oversized_frame_rejected_before_reading_it():
+    # Only the header is sent: the length must be refused without waiting for the payload
+    oversized = struct.pack("!BBQ", 0x82, 0x80 | 127, LIMIT + 1) + b"\0" * 4
+    with pytest.raises(ProtocolError, match="too large"):
+        _read_frame(oversized)
+
+
+def _websocket_close_code(frames: bytes) -> int:
+    upgrade = (
+        b"GET /ws HTTP/1.1\r\nHost: x\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+        b"Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n\r\n"
+    )
+    response = _serve(upgrade + frames)
+    assert response.startswith(b"HTTP/1.1 101 ")
+    close = response[response.index(b"\r\n\r\n") + 4:]
+    assert close[0] == 0x80 | server._CLOSE
+    return struct.unpack("!H", close[2:4])[0]
+
+
+def test_websocket_closes_on_protocol_violations():
+    assert _websocket_close_code(_client_frame(server._TEXT, b"x", masked=False)) == 1002
+    assert _websocket_close_code(_client_frame(server._CONTINUATION, b"x")) == 1002
+    interleaved = _client_frame(server._TEXT, b"a", fin=False) + _client_frame(server._TEXT, b"b")
+    assert _websocket_close_code(interleaved) == 1002
+
+
+def test_websocket_closes_on_oversized_fragmented_message():
+    half = b"x" * (LIMIT // 2 + 1)
+    frames = _client_frame(server._TEXT, half, fin=False) + _client_frame(server._CONTINUATION, half)
+    assert _websocket_close_code(frames) == 1009
+
+
+# ── HTTP request limits ───────────────────────────────────────────────────────
+def test_request_parsed():
+    request = b"POST /write?precision=s HTTP/1.1\r\nHost: x\r\nContent-Length: 3\r\n\r\nabc"
+    method, target, headers = _run(server._read_request, request)
+    assert (method, target, headers["content-length"]) == ("POST", "/write?precision=s", "3")
+    assert _run(server._read_request, b"") is None
+
+
+@pytest.mark.parametrize(
+    "request_line",
+    [b"NOPE\r\n\r\n", b"GET /ws\r\n\r\n", b"GET / HTTP/1.1 extra\r\n\r\n", b"GET / SMTP/1.0\r\n\r\n"],
+)
+def test_malformed_request_line(request_line):
+    assert _status(server._read_request, request_line).startswith("400")
+
+
+def test_malformed_header_line():
+    request = b"GET /ws HTTP/1.1\r\nno colon here\r\n\r\n"
+    assert _status(server._read_request, request).startswith("400")
+
+
+def test_header_limits():
+    many = b"GET /ws HTTP/1.1\r\n" + b"".join(b"X-%d: y\r\n" % i for i in range(server.MAX_HEADER_COUNT + 1)) + b"\r\n"
+    assert _status(server._read_request, many).startswith("431")
+
+    large = b"GET /ws HTTP/1.1\r\n" + b"".join(
+        b"X-%d: %s\r\n" % (i, b"y" * 1000) for i in range(server.MAX_HEADER_BYTES // 1000 + 1)
+    ) + b"\r\n"
+    assert _status(server._read_request, large).startswith("431")
+
+    long_line = b"GET /" + b"a" * (server.MAX_HEADER_BYTES * 2) + b" HTTP/1.1\r\n\r\n"
+    assert _status(server._read_request, long_line).startswith("431")
+
+
+@pytest.mark.parametrize(
+    "headers, status",
+    [
+        ({}, "411"),
+        ({"content-length": "abc"}, "411"),
+        ({"content-length": "-1"}, "400"),
+        ({"transfer-encoding": "chunked"}, "411"),
+        ({"transfer-encoding": "gzip, chunked", "content-length": "3"}, "411"),
+        ({"content-length": str(LIMIT + 1)}, "413"),
+    ],
+)
+def test_body_framing_rejected(headers, status):
+    assert _status(server._read_body, b"abc", headers).startswith(status)
+
+
+def test_gzip_body():
+    body = gzip.compress(b"plc running=1i")
+    headers = {"content-length": str(len(body)), "content-encoding": "gzip"}
+    assert _run(server._read_body, body, headers) == b"plc running=1i"
+
+
+def test_gzip_bomb_rejected():
+    bomb = gzip.compress(b"\0" * (LIMIT * 10))
+    assert len(bomb) < LIMIT
+    headers = {"content-length": str(len(bomb)), "content-encoding": "gzip"}
+    assert _status(server._read_body, bomb, headers).startswith("413")
+
+
+@pytest.mark.parametrize("body", [b"not gzip at all", gzip.compress(b"plc running=1i" * 100)[:-12]], ids=["invalid", "truncated"])
+def test_bad_gzip_rejected(body):
+    headers = {"content-length": str(len(body)), "content-encoding": "gzip"}
+    assert _status(server._read_body, body, headers).startswith("400")
+
+
+def test_rejected_requests_get_a_response_and_close():
+    for request, status in (
+        (b"GARBAGE\r\n\r\n", b"400"),
+        (b"POST /write HTTP/1.1\r\nContent-Length: -5\r\n\r\n", b"400"),
+        (b"POST /write HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n0\r\n\r\n", b"411"),
+        (b"POST /write HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % (LIMIT + 1), b"413"),
+    ):
+        response = _serve(request)
+        assert response.startswith(b"HTTP/1.1 " + status)
+        assert b"Connection: close" in response
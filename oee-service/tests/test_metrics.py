@@ -0,0 +1,27 @@
+import metrics
+
+
+def test_monotonic_counts_are_exported_as_counters():
+    rendered = metrics.render()
+    for metric in (
+        metrics.WRITE_BUFFER_FLUSHES,
+        metrics.WRITE_BUFFER_ERRORS,
+        metrics.SPOOL_SPOOLED,
+        metrics.SPOOL_REPLAYED,
+    ):
+        assert isinstance(metric, metrics.Counter)
+        assert metric.name.endswith("_total")
+        assert f"# TYPE {metric.name} counter" in rendered
+
+
+def test_counter_rendering():
+    counter = metrics.Counter("oee_test_total", "Test.")
+    counter.inc(job="a")
+    counter.inc(2, job="a")
+    counter.set_total(7, job='b"c')
+    assert counter.render() == [
+        "# HELP oee_test_total Test.",
+        "# TYPE oee_test_total counter",
+        'oee_test_total{job="a"} 3',
+        'oee_test_total{job="b\\"c"} 7',
+    ]
@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta, timezone
+
+from scheduler.provisional import COUNTER_RESUME_SECONDS, CounterWatch
+
+T0 = datetime(2025, 10, 9, 8, 0, tzinfo=timezone.utc)
+
+
+def _at(seconds: float) -> datetime:
+    return T0 + timedelta(seconds=seconds)
+
+
+def test_first_sample_is_only_a_baseline():
+    watch = CounterWatch()
+    assert watch.observe(1, 500, _at(0)) is None
+    assert watch.observe(1, 510, _at(5)) is None
+
+
+def test_reset_and_resume():
+    watch = CounterWatch()
+    watch.observe(1, 500, _at(0))
+    assert watch.observe(1, 3, _at(5)) == "counter reset"
+
+    # Standing still doesn't count as a change; moving again after the pause does
+    assert watch.observe(1, 3, _at(5 + COUNTER_RESUME_SECONDS)) is None
+    assert watch.observe(1, 4, _at(6 + COUNTER_RESUME_SECONDS)) == "counter resumed"
+    assert watch.observe(1, 5, _at(7 + COUNTER_RESUME_SECONDS)) is None
+
+
+def test_machines_are_tracked_separately():
+    watch = CounterWatch()
+    watch.observe(1, 500, _at(0))
+    assert watch.observe(2, 10, _at(1)) is None
+    assert watch.observe(2, 5, _at(2)) == "counter reset"
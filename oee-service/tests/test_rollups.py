@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta, timezone
+
+from calculator.rollups import DAILY_MEASUREMENT, RollupStore, RollupTotals
+
+DAY = datetime(2025, 10, 9, tzinfo=timezone.utc)
+INTERVAL = 300
+
+
+class FakeInflux:
+    """Answers the stored-windows query with whatever ``rows`` holds."""
+
+    def __init__(self):
+        self.rows: list[dict] = []
+        self.queries = 0
+
+    def query(self, sql: str):
+        self.queries += 1
+        return _Table(self.rows)
+
+
+class _Table:
+    def __init__(self, rows: list[dict]):
+        self.rows = rows
+
+    def to_pylist(self) -> list[dict]:
+        return self.rows
+
+
+def _stored(machine_id: int, window_end: datetime, total_parts: int) -> dict:
+    return {
+        "machine_id": str(machine_id),
+        "time": window_end,
+        "planned_time_seconds": 300.0,
+        "actual_run_time_seconds": 240.0,
+        "downtime_seconds": 60.0,
+        "total_parts": total_parts,
+        "good_parts": total_parts,
+        "reject_parts": 0,
+        "ideal_cycle_time": 1.0,
+    }
+
+
+def _day_totals(store: RollupStore, machine_id: int) -> RollupTotals:
+    return store._periods[(DAILY_MEASUREMENT, machine_id, DAY)].totals
+
+
+def test_sync_loads_new_machines_once():
+    store, influx = RollupStore(), FakeInflux()
+    influx.rows = [_stored(1, DAY + timedelta(hours=1), 100), _stored(1, DAY + timedelta(hours=2), 50)]
+    store.sync_machines(influx, [1], DAY, INTERVAL)
+    store.sync_machines(influx, [1], DAY, INTERVAL)
+
+    assert influx.queries == 1
+    assert (_day_totals(store, 1).total_parts, _day_totals(store, 1).window_count) == (150, 2)
+
+
+def test_released_machines_are_forgotten():
+    store, influx = RollupStore(), FakeInflux()
+    influx.rows = [_stored(1, DAY + timedelta(hours=1), 100)]
+    store.sync_machines(influx, [1], DAY, INTERVAL)
+    store.sync_machines(influx, [], DAY, INTERVAL)
+
+    assert not store._periods
+
+
+def test_invalidated_machine_reloads_recalculated_windows():
+    store, influx = RollupStore(), FakeInflux()
+    end = DAY + timedelta(hours=1)
+    influx.rows = [_stored(1, end, 100)]
+    store.sync_machines(influx, [1], DAY, INTERVAL)
+
+    # Another replica recalculated the window; totals stay as they were until the reload
+    influx.rows = [_stored(1, end, 80)]
+    store.invalidate(1)
+    assert _day_totals(store, 1).total_parts == 100
+
+    store.sync_machines(influx, [1], DAY, INTERVAL)
+    assert (_day_totals(store, 1).total_parts, _day_totals(store, 1).window_count) == (80, 1)
+    # Recording the window again replaces its contribution rather than adding to it
+    store.record(1, end - timedelta(seconds=INTERVAL), end, RollupTotals(total_parts=90, window_count=1))
+    assert (_day_totals(store, 1).total_parts, _day_totals(store, 1).window_count) == (90, 1)
@@ -0,0 +1,47 @@
+import time
+
+from spool import CircuitBreaker
+
+
+def _opened(breaker: CircuitBreaker) -> CircuitBreaker:
+    for _ in range(breaker.threshold):
+        breaker.failure()
+    assert breaker.is_open and not breaker.allow()
+    return breaker
+
+
+def _expire(breaker: CircuitBreaker) -> None:
+    breaker._open_until = time.monotonic() - 1
+
+
+def test_half_open_admits_a_single_trial():
+    breaker = _opened(CircuitBreaker(threshold=2))
+    _expire(breaker)
+
+    assert breaker.allow()
+    assert not breaker.allow()
+    assert breaker.is_open
+
+    breaker.success()
+    assert not breaker.is_open
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_trial_reopens_with_longer_backoff():
+    breaker = _opened(CircuitBreaker(threshold=1, base_seconds=10.0))
+    _expire(breaker)
+
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.is_open and not breaker.allow()
+    assert breaker._backoff == 40.0
+
+
+def test_released_trial_can_be_claimed_again():
+    breaker = _opened(CircuitBreaker(threshold=1))
+    _expire(breaker)
+
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+    assert not breaker.allow()
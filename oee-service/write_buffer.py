@@ -0,0 +1,143 @@
+"""Shared line-protocol write buffer for OEE results.
+
+Points from every machine are collected and sent to InfluxDB 3 as a single
+line-protocol batch once a point count, byte size or age threshold is reached,
+instead of one HTTP write per point.  Batches InfluxDB does not accept go to
+the on-disk spool (when configured) and are replayed later.  While the spool
+still holds batches, new batches are spooled behind them rather than written
+directly: rollup and minor stoppage points are running totals rewritten at
+the same timestamp, and an older spooled copy replayed after a newer live
+write would replace the newer total.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from influxdb_client_3 import InfluxDBClient3, Point
+
+from spool import CircuitBreaker, Spool
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBuffer:
+    def __init__(
+        self,
+        influx: InfluxDBClient3,
+        max_points: int = 5000,
+        max_bytes: int = 1_000_000,
+        max_age_seconds: float = 5.0,
+        spool: Spool | None = None,
+        breaker: CircuitBreaker | None = None,
+    ):
+        self.influx = influx
+        self.max_points = max_points
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.spool = spool
+        self.breaker = breaker
+
+        self._lock = threading.Lock()
+        self._lines: list[str] = []
+        self._bytes = 0
+        self._oldest: float | None = None
+
+        self.flush_count = 0
+        # error_count only counts batches that were lost (not written, not spooled)
+        self.error_count = 0
+        self.spooled_count = 0
+        self.last_flush_points = 0
+        self.last_flush_seconds = 0.0
+        self.last_write_failed = False
+
+    def _append(self, points: list[Point | str]) -> bool:
+        """Append points and return True if a flush threshold has been reached."""
+        with self._lock:
+            for point in points:
+                line = point if isinstance(point, str) else point.to_line_protocol()
+                self._lines.append(line)
+                self._bytes += len(line.encode()) + 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            return (
+                len(self._lines) >= self.max_points
+                or self._bytes >= self.max_bytes
+                or time.monotonic() - self._oldest >= self.max_age_seconds
+            )
+
+    def _drain(self) -> list[str]:
+        with self._lock:
+            lines, self._lines = self._lines, []
+            self._bytes = 0
+            self._oldest = None
+        return lines
+
+    def write_lines(self, record: str) -> None:
+        """Blocking write of one line-protocol batch (also used to replay the spool)."""
+        self.influx.write(record=record, write_precision="ns")
+
+    def _spool_or_fail(self, lines: list[str], reason, failed: bool = True) -> None:
+        if self.spool is not None:
+            try:
+                self.spool.append(lines)
+                self.spooled_count += 1
+                if failed:
+                    logger.warning(f"InfluxDB write failed ({reason}); spooled {len(lines)} points to disk")
+                else:
+                    logger.debug(f"Spooled {len(lines)} points ({reason})")
+                return
+            except Exception as e:
+                logger.error(f"Could not spool {len(lines)} points: {e}")
+        self.error_count += 1
+        self.last_write_failed = True
+        logger.error(f"Failed to write OEE metrics batch ({len(lines)} points): {reason}")
+
+    def _write(self, lines: list[str]) -> None:
+        if self.breaker is not None and self.breaker.is_open:
+            self._spool_or_fail(lines, "circuit open")
+            return
+        if self.spool is not None and not self.spool.is_empty():
+            # Keep write order: queue behind the batches still being replayed
+            self._spool_or_fail(lines, "spool still draining", failed=False)
+            return
+        # Claimed last, so a half-open trial is only taken by a write that is attempted
+        if self.breaker is not None and not self.breaker.allow():
+            self._spool_or_fail(lines, "circuit open")
+            return
+        started = time.perf_counter()
+        try:
+            self.write_lines("\n".join(lines))
+        except Exception as e:
+            if self.breaker is not None:
+                self.breaker.failure()
+            self._spool_or_fail(lines, e)
+            return
+        if self.breaker is not None:
+            self.breaker.success()
+        elapsed = time.perf_counter() - started
+        self.last_write_failed = False
+        self.flush_count += 1
+        self.last_flush_points = len(lines)
+        self.last_flush_seconds = elapsed
+        logger.debug(f"Flushed {len(lines)} points to InfluxDB in {elapsed * 1000:.1f} ms")
+
+    async def add(self, points: list[Point | str]) -> None:
+        """Buffer points, flushing in a worker thread if a threshold is reached."""
+        if self._append(points):
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Send everything currently buffered as one line-protocol batch."""
+        lines = self._drain()
+        if lines:
+            await asyncio.to_thread(self._write, lines)
+
+    def due(self) -> bool:
+        """True once the oldest buffered point has waited ``max_age_seconds``."""
+        with self._lock:
+            return self._oldest is not None and time.monotonic() - self._oldest >= self.max_age_seconds
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._lines)